@@ -1,91 +1,185 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
-from datetime import datetime, timedelta
+import os
 
-def load_data():
-    """Đọc dữ liệu gốc từ file CSV mà không đổi tên cột."""
-    df = pd.read_csv("data.csv")
-    return df
+from cip_cleaning import clean_data
+from compliance_index import ComplianceIndex
+from due_index import DEFAULT_WITHIN_HOURS, DueTracker, plant_now
+from data_store import DATA_STORE_PATH, lines_in_window, load_data, read_manifest
+from chart_cache import ChartCache
+from charts import (
+    compliance_figure, compliance_trend_figure, control_chart_figure, distribution_figure, duration_figure, flow_figure, gap_figure, sketch_boxplot_figure,
+    temp_delta_figure
+)
+from filter_index import FilterIndex
+from instrumentation import NULL_PROFILER, PROFILE_LOG_ENV, Profiler, activate, env_enabled, get_profiler
+from metrics import TEMP_COLUMNS, compute_device_metrics, temp_delta_column
+from rollups import RollupTracker
+from shared_dataset import SharedDataset, build_clean_data, csv_source
+from sketches import SKETCH_MIN_ROWS, DistributionSketches
+from spc import SPC_COLUMNS, SpcTracker, control_series
 
-def clean_data(df):
+DATA_PATH = "data.csv"
+
+@st.cache_resource(show_spinner="Đang tải dữ liệu CIP...")
+def get_shared_dataset():
     """
-    1) Tách các dòng outlier (có 0 ở Lưu lượng hồi, Tổng thời gian bước Xút, Tổng thời gian bước nước nóng).
-    2) Chuyển cột thời gian bắt đầu/ kết thúc CIP sang datetime.
-    3) Chuyển các cột thời gian Xút / Nước nóng sang phút (tạo thêm cột (phút)).
-    4) Tính tổng thời gian CIP từ thời gian bắt đầu đến kết thúc.
-    5) Tính khoảng cách giữa 2 lần CIP liên tiếp (time_gap_days).
+    Một bộ dữ liệu đã làm sạch (kèm chỉ mục bộ lọc) cho cả tiến trình, mọi phiên dùng chung chỉ-đọc.
+    Luồng nền tự phát hiện khi fetch_sheet_data.py thay data.csv, xây lại rồi hoán đổi.
     """
-    # 1) Tách outlier
-    outlier_condition = (
-        (df['Lưu lượng hồi (l/h)'] == 0) |
-        (df['Tổng thời gian bước Xút'] == 0) |
-        (df['Tổng thời gian bước nước nóng'] == 0)
-    )
-    df_outliers = df[outlier_condition].copy()
-    df_clean = df[~outlier_condition].copy()
-    
-    # 2) Chuyển "Thời gian Bắt đầu CIP" / "Thời gian Kết thúc CIP" sang datetime
-    df_clean['Thời gian Bắt đầu CIP'] = pd.to_datetime(
-        df_clean['Thời gian Bắt đầu CIP'],
-        format="%d/%m/%y %H:%M",
-        errors='coerce'
-    )
-    df_clean['Thời gian Kết thúc CIP'] = pd.to_datetime(
-        df_clean['Thời gian Kết thúc CIP'],
-        format="%d/%m/%y %H:%M",
-        errors='coerce'
-    )
-    
-    # 3) Chuyển "Tổng thời gian bước Xút" & "Tổng thời gian bước nước nóng" sang số phút
-    def convert_to_minutes(t_str):
-        if pd.isna(t_str) or t_str == '0:00' or t_str == '':
-            return 0
-        try:
-            parts = t_str.split(':')
-            if len(parts) == 2:
-                hours = int(parts[0])
-                minutes = int(parts[1])
-                return hours * 60 + minutes
-            return 0
-        except:
-            return 0
+    return SharedDataset(lambda: csv_source(DATA_PATH), build_clean_data).start()
 
-    df_clean['Tổng thời gian bước Xút (phút)'] = df_clean['Tổng thời gian bước Xút'].apply(convert_to_minutes)
-    df_clean['Tổng thời gian bước nước nóng (phút)'] = df_clean['Tổng thời gian bước nước nóng'].apply(convert_to_minutes)
-    
-    # 4) Tính tổng thời gian CIP (từ bắt đầu đến kết thúc)
-    # Đảm bảo dữ liệu datetime hợp lệ trước khi tính toán
-    valid_times = (~df_clean['Thời gian Bắt đầu CIP'].isna()) & (~df_clean['Thời gian Kết thúc CIP'].isna())
-    df_clean.loc[valid_times, 'Tổng thời gian CIP (phút)'] = (
-        (df_clean.loc[valid_times, 'Thời gian Kết thúc CIP'] - 
-         df_clean.loc[valid_times, 'Thời gian Bắt đầu CIP']).dt.total_seconds() / 60
-    )
-    
-    # Sắp xếp dữ liệu theo (Line, Circuit, Thiết bị, Thời gian Bắt đầu CIP)
-    df_clean.sort_values(by=['Line', 'Circuit', 'Thiết bị', 'Thời gian Bắt đầu CIP'], inplace=True)
-    
-    # 5) Tính khoảng cách giữa 2 lần CIP liên tiếp cho cùng một thiết bị
-    df_clean['next_start'] = df_clean.groupby(['Line', 'Circuit', 'Thiết bị'])['Thời gian Bắt đầu CIP'].shift(-1)
-    df_clean['time_gap_days'] = (
-        (df_clean['next_start'] - df_clean['Thời gian Kết thúc CIP'])
-        .dt.total_seconds() / 86400
+@st.cache_resource(show_spinner="Đang tải dữ liệu CIP...", max_entries=8)
+def get_clean_data(data_version, path=DATA_STORE_PATH, start_date=None, end_date=None, line=None):
+    """
+    Dữ liệu đã làm sạch của store trong khoảng [start_date, end_date]: chỉ đọc các phân vùng tháng
+    trong khoảng đó (và chỉ phân vùng của line nếu có). Khoảng cách tới lần CIP kế tiếp lấy từ cột
+    tính sẵn của store, nên lần CIP cuối trong khoảng có cùng time_gap_days như khi đọc data.csv.
+    st.cache_resource trả về cùng một DataFrame cho mọi phiên (khóa theo data_version + khoảng ngày
+    + line) thay vì mỗi phiên một bản sao.
+    """
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    lines = [line] if line is not None else None
+    return clean_data(load_data(path, start=pd.Timestamp(start_date), end=end, lines=lines, with_next_start=True))
+
+@st.cache_resource(max_entries=8)
+def get_filter_index(_df_clean, data_version, window=None):
+    """
+    Chỉ mục bộ lọc Line → Circuit → Thiết bị xây một lần cho mỗi phiên bản store và khoảng ngày.
+    _df_clean không được băm, khóa là data_version.
+    """
+    return FilterIndex(_df_clean)
+
+@st.cache_resource(max_entries=8)
+def get_distribution_sketches(_df_clean, _filter_index, data_version, window=None):
+    """Sketch phân phối theo thiết bị x tháng (mục 1) cho một phiên bản dữ liệu, dùng chung mọi phiên."""
+    return DistributionSketches(_df_clean, _filter_index)
+
+@st.cache_resource(max_entries=8)
+def get_compliance_index(_df_clean, _filter_index, data_version, window=None):
+    """Tổng tích lũy số lần tuân thủ theo thiết bị (mục 3) cho một phiên bản dữ liệu, dùng chung mọi phiên."""
+    return ComplianceIndex(_df_clean, _filter_index)
+
+@st.cache_resource
+def get_due_tracker():
+    """Lịch CIP kế tiếp theo thiết bị, dùng chung mọi phiên; chỉ đọc các dòng mới ghi thêm vào data.csv."""
+    return DueTracker(DATA_PATH)
+
+@st.cache_resource
+def get_spc_tracker():
+    """Trạng thái biểu đồ kiểm soát theo thiết bị, dùng chung mọi phiên; lưu trong .cache/ để khởi động lại không phải tính lại."""
+    return SpcTracker(DATA_PATH)
+
+@st.cache_resource
+def get_rollup_tracker():
+    """
+    Bảng tổng hợp theo thiết bị/ngày, dùng chung mọi phiên; lưu trong .cache/ như trạng thái SPC.
+    Cập nhật trong luồng nền (latest()), bắt đầu ngay khi tạo để lần xem đầu tiên không phải chờ.
+    """
+    tracker = RollupTracker(DATA_PATH)
+    tracker.latest()
+    return tracker
+
+@st.cache_resource
+def get_chart_cache():
+    """Cache ảnh biểu đồ dùng chung cho mọi phiên trong tiến trình."""
+    return ChartCache()
+
+def debug_enabled():
+    """Bảng gỡ lỗi chỉ hiện khi bật CIP_PROFILE=1 hoặc thêm ?debug=1 vào URL."""
+    return env_enabled() or st.query_params.get("debug", "").lower() in ("1", "true")
+
+def show_debug_panel(profiler):
+    """Sidebar gỡ lỗi: thời gian / số dòng / bộ nhớ từng giai đoạn và thống kê cache biểu đồ."""
+    with st.sidebar.expander("Debug: thời gian từng giai đoạn", expanded=True):
+        if profiler.records:
+            stages = pd.DataFrame(profiler.records)
+            stages["stage"] = ["  " * depth + name for depth, name in zip(stages["depth"], stages["stage"])]
+            stages["peak (MB)"] = (pd.to_numeric(stages["peak_bytes"]) / 2**20).round(2)
+            st.dataframe(stages[["stage", "seconds", "rows_in", "rows_out", "peak (MB)"]], hide_index=True)
+            if stages["peak_bytes"].isna().all():
+                st.caption("Không đo bộ nhớ ở lần chạy này: một phiên khác đang đo (tracemalloc dùng chung cả tiến trình).")
+    with st.sidebar.expander("Debug: cache biểu đồ"):
+        st.json(get_chart_cache().stats())
+    if not os.path.isdir(DATA_STORE_PATH):
+        with st.sidebar.expander("Debug: bộ dữ liệu chung"):
+            st.json(get_shared_dataset().stats())
+        with st.sidebar.expander("Debug: lịch CIP kế tiếp"):
+            st.json(get_due_tracker().stats())
+        with st.sidebar.expander("Debug: SPC"):
+            st.json(get_spc_tracker().stats())
+        with st.sidebar.expander("Debug: bảng tổng hợp theo ngày"):
+            st.json(get_rollup_tracker().stats())
+
+def show_memory_report(df_clean):
+    """Sidebar gỡ lỗi: bộ nhớ của DataFrame đã làm sạch trước/sau khi áp dụng schema gọn."""
+    report = df_clean.attrs.get("memory_report")
+    if not report:
+        return
+    with st.sidebar.expander("Debug: bộ nhớ DataFrame"):
+        table = pd.DataFrame(report)
+        table["trước (MB)"] = (table.pop("bytes_before") / 2**20).round(3)
+        table["sau (MB)"] = (table.pop("bytes_after") / 2**20).round(3)
+        st.dataframe(table, hide_index=True)
+
+def show_overdue_panel():
+    """Đầu dashboard: các thiết bị đã quá hạn hoặc sắp đến hạn CIP kế tiếp tính đến hiện tại."""
+    due_index = get_due_tracker().refresh()
+    as_of = plant_now().floor("min")
+    within_hours = st.number_input(
+        "Cảnh báo thiết bị đến hạn CIP trong (giờ)", min_value=0, max_value=24 * 30,
+        value=DEFAULT_WITHIN_HOURS, step=12
     )
-    
-    return df_clean
+    due = due_index.due(as_of, within_hours)
+    overdue = int((due["Quá hạn (giờ)"] > 0).sum())
+    col_overdue, col_soon = st.columns(2)
+    col_overdue.metric("Thiết bị quá hạn CIP", overdue)
+    col_soon.metric(f"Đến hạn trong {within_hours} giờ tới", len(due) - overdue)
+    if not due.empty:
+        with st.expander(f"Danh sách thiết bị quá hạn / sắp đến hạn (tính đến {as_of:%d/%m/%Y %H:%M})", expanded=overdue > 0):
+            st.dataframe(due, hide_index=True)
 
 def main():
+    profiler = activate(Profiler(enabled=debug_enabled(), log_path=os.environ.get(PROFILE_LOG_ENV)))
+    profiler.start()
+    try:
+        render_dashboard()
+    finally:
+        profiler.stop()
+        activate(NULL_PROFILER)
+        if profiler.enabled:
+            show_debug_panel(profiler)
+
+def render_dashboard():
     st.title("CIP Data Dashboard")
+    profiler = get_profiler()
     
-    # 1) Đọc dữ liệu gốc và làm sạch
-    df_raw = load_data()
-    df_clean = clean_data(df_raw)
+    # 0) Thiết bị quá hạn / sắp đến hạn CIP kế tiếp (theo lần CIP mới nhất của mỗi thiết bị)
+    if os.path.isfile(DATA_PATH):
+        with profiler.stage("overdue"):
+            st.subheader("Lịch CIP kế tiếp")
+            show_overdue_panel()
+    
+    # 1) Đọc dữ liệu đã làm sạch: ưu tiên store Parquet phân vùng nếu có,
+    #    nếu không dùng bộ dữ liệu chung của tiến trình (data.csv, tự tải lại khi file đổi)
+    use_store = os.path.isdir(DATA_STORE_PATH)
     
     # Lấy min và max của thời gian bắt đầu CIP từ dữ liệu
-    min_date = df_clean['Thời gian Bắt đầu CIP'].min().date()
-    max_date = df_clean['Thời gian Bắt đầu CIP'].max().date()
+    if use_store:
+        # Store đã lưu sẵn khoảng thời gian trong manifest, chưa cần đọc dữ liệu. Phân giải symlink
+        # một lần để manifest và dữ liệu của lần chạy này cùng một phiên bản store
+        store_root = os.path.realpath(DATA_STORE_PATH)
+        manifest = read_manifest(store_root)
+        data_version = manifest["version"]
+        min_date = pd.Timestamp(manifest["min_start"]).date()
+        max_date = pd.Timestamp(manifest["max_start"]).date()
+    else:
+        with profiler.stage("get_clean_data"):
+            snapshot = get_shared_dataset().current()
+        df_clean, data_version = snapshot.df, snapshot.version
+        min_date = df_clean['Thời gian Bắt đầu CIP'].min().date()
+        max_date = df_clean['Thời gian Bắt đầu CIP'].max().date()
     
     # 2) Thêm bộ lọc khoảng thời gian
     st.subheader("Lọc theo thời gian")
@@ -113,42 +207,77 @@ def main():
     # Đặt end_date là cuối ngày (23:59:59) để bao gồm tất cả các bản ghi trong ngày đó
     end_datetime = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
     
-    # Lọc dữ liệu theo khoảng thời gian đã chọn
-    df_filtered_by_date = df_clean[
-        (df_clean['Thời gian Bắt đầu CIP'] >= start_datetime) & 
-        (df_clean['Thời gian Bắt đầu CIP'] <= end_datetime)
-    ]
+    # Khóa phụ của các cache theo phiên bản dữ liệu: với store, df_clean chỉ là lát (khoảng ngày, Line)
+    store_window = None
+    if use_store:
+        # Store phân vùng theo Line: chọn Line (các Line có CIP trong khoảng ngày, theo manifest) trước
+        # khi đọc, rồi chỉ đọc các phân vùng của Line đó trong các tháng nằm trong khoảng ngày đã chọn
+        store_lines = lines_in_window(manifest, start_date, end_date)
+        if not store_lines:
+            st.warning(f"Không có dữ liệu CIP trong khoảng thời gian từ {start_date} đến {end_date}.")
+            return
+        st.subheader("Lọc theo thiết bị")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            selected_line = st.selectbox("Chọn Line", store_lines)
+        with profiler.stage("get_clean_data"):
+            df_clean = get_clean_data(data_version, store_root, start_date, end_date, selected_line)
+        store_window = (start_date, end_date, selected_line)
+    
+    # Cảnh báo nếu có ô thời gian sai định dạng trong Google Sheet
+    for report in df_clean.attrs.get("parse_reports", []):
+        st.warning(
+            f"Cột '{report['column']}' có {report['malformed']}/{report['total']} ô sai định dạng "
+            f"(ví dụ: {', '.join(report['sample'])})."
+        )
+    
+    if profiler.enabled:
+        show_memory_report(df_clean)
+    
+    # Chỉ mục bộ lọc (mã categorical + đoạn dòng đã sắp xếp theo thời gian) cho phiên bản dữ liệu này
+    if use_store:
+        with profiler.stage("filter_index", len(df_clean)):
+            filter_index = get_filter_index(df_clean, data_version, store_window)
+    else:
+        filter_index = snapshot.index
+    
+    # Lọc dữ liệu theo khoảng thời gian đã chọn (searchsorted trên từng thiết bị)
+    with profiler.stage("filter: khoảng ngày", len(df_clean)) as stage:
+        date_bounds = filter_index.window(start_datetime, end_datetime)
+        lines = filter_index.lines(date_bounds)
+        stage.set_rows_out(int((date_bounds[1] - date_bounds[0]).sum()))
     
     # Kiểm tra xem có dữ liệu nào sau khi lọc không
-    if df_filtered_by_date.empty:
+    if not lines:
         st.warning(f"Không có dữ liệu CIP trong khoảng thời gian từ {start_date} đến {end_date}.")
         return
     
-    # 3) Lựa chọn line, circuit, thiết bị
-    st.subheader("Lọc theo thiết bị")
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        lines = df_filtered_by_date['Line'].unique()
-        selected_line = st.selectbox("Chọn Line", lines)
-    
-    df_line = df_filtered_by_date[df_filtered_by_date['Line'] == selected_line]
+    # 3) Lựa chọn line, circuit, thiết bị (với store, Line đã được chọn ở trên)
+    if not use_store:
+        st.subheader("Lọc theo thiết bị")
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            selected_line = st.selectbox("Chọn Line", lines)
     
     with col2:
-        circuits = df_line['Circuit'].unique()
+        circuits = filter_index.circuits(date_bounds, selected_line)
         selected_circuit = st.selectbox("Chọn Circuit", circuits)
     
-    df_line_circuit = df_line[df_line['Circuit'] == selected_circuit]
-    
     with col3:
-        thiet_bi_list = df_line_circuit['Thiết bị'].unique()
+        thiet_bi_list = filter_index.devices(date_bounds, selected_line, selected_circuit)
         selected_thiet_bi = st.selectbox("Chọn Thiết bị", ["Tất cả"] + list(thiet_bi_list))
     
     # Lọc theo thiết bị nếu không chọn "Tất cả"
-    if selected_thiet_bi != "Tất cả":
-        df_filtered = df_line_circuit[df_line_circuit['Thiết bị'] == selected_thiet_bi]
-    else:
-        df_filtered = df_line_circuit
+    with profiler.stage("filter: Line/Circuit/Thiết bị", len(df_clean)) as stage:
+        df_filtered = filter_index.select(
+            df_clean,
+            date_bounds,
+            selected_line,
+            selected_circuit,
+            selected_thiet_bi if selected_thiet_bi != "Tất cả" else None
+        )
+        stage.set_rows_out(len(df_filtered))
     
     # Kiểm tra xem có dữ liệu nào sau khi lọc không
     if df_filtered.empty:
@@ -158,6 +287,19 @@ def main():
     # Hiển thị số lượng bản ghi sau khi lọc
     st.info(f"Đang hiển thị {len(df_filtered)} bản ghi CIP từ {start_date} đến {end_date}.")
     
+    # Cache ảnh biểu đồ dùng chung cho mọi phiên; khóa theo phiên bản dữ liệu + trạng thái bộ lọc
+    chart_cache = get_chart_cache()
+    filter_key = (data_version, selected_line, selected_circuit, selected_thiet_bi, start_date, end_date)
+    
+    def show_chart(name, render):
+        """Hiển thị biểu đồ từ cache, chỉ render khi chưa có. Trả về False nếu không vẽ được."""
+        with profiler.stage(f"chart: {'/'.join(map(str, name))}", len(df_filtered)):
+            png = chart_cache.get_or_render(filter_key + name, render)
+        if png is None:
+            return False
+        st.image(png, width="stretch")
+        return True
+    
     # 4) Boxplot các thông số CIP theo Thiết bị
     st.subheader("1) Boxplot các thông số CIP")
     
@@ -176,280 +318,194 @@ def main():
     # Kiểm tra xem có đủ dữ liệu để vẽ boxplot không
     if len(df_filtered) > 0 and not df_filtered[col_selected].isna().all():
         try:
-            # Sử dụng biểu đồ violin thay vì boxplot nếu chỉ có một thiết bị
-            if selected_thiet_bi != "Tất cả":
-                fig1, ax1 = plt.subplots(figsize=(8, 4))
-                # Sử dụng stripplot khi chỉ có một thiết bị 
-                # (hiển thị các điểm dữ liệu riêng lẻ)
-                sns.stripplot(
-                    data=df_filtered,
-                    y=col_selected,
-                    jitter=True,
-                    size=8,
-                    ax=ax1
+            # Stripplot khi chỉ có một thiết bị, boxplot theo Thiết bị khi chọn "Tất cả"
+            if selected_thiet_bi == "Tất cả" and len(df_filtered) > SKETCH_MIN_ROWS:
+                # Lát dữ liệu lớn: boxplot từ sketch phân vị đã tính sẵn thay vì từ từng dòng
+                sketches = get_distribution_sketches(
+                    df_clean, filter_index, data_version, store_window
                 )
-                ax1.set_title(f"{col_selected} cho {selected_thiet_bi} (Circuit: {selected_circuit}, Line: {selected_line})")
-                ax1.set_ylabel(col_selected)
-                st.pyplot(fig1)
-            else:
-                if len(df_filtered['Thiết bị'].unique()) > 1:
-                    fig1, ax1 = plt.subplots(figsize=(10, 5))
-                    sns.boxplot(
-                        data=df_filtered,
-                        x="Thiết bị",
-                        y=col_selected,
-                        ax=ax1
+                drawn = show_chart(
+                    ("distribution", col_selected),
+                    lambda: sketch_boxplot_figure(
+                        sketches.device_sketches(col_selected, date_bounds, selected_line, selected_circuit),
+                        col_selected, selected_circuit, selected_line
                     )
-                    ax1.set_title(f"{col_selected} theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})")
-                    ax1.set_xlabel("Thiết bị")
-                    ax1.set_ylabel(col_selected)
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    st.pyplot(fig1)
-                else:
-                    st.warning(f"Chỉ có một Thiết bị trong dữ liệu được lọc. Không thể tạo boxplot.")
+                )
+            else:
+                drawn = show_chart(
+                    ("distribution", col_selected),
+                    lambda: distribution_figure(df_filtered, col_selected, selected_thiet_bi, selected_circuit, selected_line)
+                )
+            if not drawn:
+                st.warning(f"Chỉ có một Thiết bị trong dữ liệu được lọc. Không thể tạo boxplot.")
         except Exception as e:
             st.error(f"Lỗi khi vẽ biểu đồ: {str(e)}")
             st.info("Hãy thử chọn một thông số khác hoặc kiểm tra lại dữ liệu.")
     else:
         st.warning(f"Không có đủ dữ liệu cho thông số {col_selected} để vẽ biểu đồ.")
     
-    # 5) Biểu đồ thể hiện thời gian giữa hai lần CIP (time_gap_days)
-    st.subheader("2) Thời gian giữa hai lần CIP")
-    st.markdown(
-        "- **Cách tính**: Thời gian Bắt đầu CIP của đợt sau trừ đi Thời gian Kết thúc CIP của đợt trước.\n"
-        "- Đơn vị: ngày (1 ngày = 24 giờ).\n"
-        "- Đường kẻ ngang (màu đỏ) biểu thị quy định 5 ngày."
-    )
-    
-    # Lọc dữ liệu không có giá trị NA và loại bỏ giá trị âm hoặc bằng 0
-    time_gap_data = df_filtered[df_filtered['time_gap_days'] > 0].copy()
-    
-    if not time_gap_data.empty:
-        try:
-            # Tính trung bình thời gian giữa các lần CIP cho mỗi thiết bị
-            avg_time_gap = time_gap_data.groupby('Thiết bị')['time_gap_days'].mean().reset_index()
-            avg_time_gap = avg_time_gap.sort_values('time_gap_days', ascending=False)
-            
-            # Vẽ biểu đồ cột thể hiện khoảng thời gian trung bình giữa các lần CIP theo thiết bị
-            fig2, ax2 = plt.subplots(figsize=(10, 6))
-            bars = ax2.bar(
-                avg_time_gap['Thiết bị'],
-                avg_time_gap['time_gap_days'],
-                color='skyblue'
-            )
-            
-            # Thêm đường kẻ ngang biểu thị quy định 5 ngày
-            ax2.axhline(5, color='red', linestyle='--', label='Quy định 5 ngày')
-            
-            # Thêm giá trị số ngày lên đỉnh mỗi cột
-            for bar in bars:
-                height = bar.get_height()
-                ax2.text(
-                    bar.get_x() + bar.get_width()/2.,
-                    height + 0.1,
-                    f'{height:.1f}',
-                    ha='center',
-                    va='bottom'
-                )
-            
-            ax2.set_title(f"Thời gian trung bình giữa các lần CIP theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})")
-            ax2.set_xlabel("Thiết bị")
-            ax2.set_ylabel("Thời gian trung bình (ngày)")
-            ax2.set_ylim(0, max(avg_time_gap['time_gap_days']) * 1.2)  # Đặt giới hạn trục y để có không gian cho số
-            ax2.legend()
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            st.pyplot(fig2)
-            
-            # Thêm biểu đồ tỷ lệ tuân thủ quy định 5 ngày
-            st.subheader("3) Tỷ lệ tuân thủ quy định 5 ngày")
-            
-            # Tính tỷ lệ tuân thủ cho mỗi thiết bị
-            compliance_data = time_gap_data.groupby('Thiết bị').apply(
-                lambda x: pd.Series({
-                    'total_cips': len(x),
-                    'compliant_cips': sum(x['time_gap_days'] <= 5),
-                })
-            ).reset_index()
-            
-            compliance_data['compliance_rate'] = (compliance_data['compliant_cips'] / compliance_data['total_cips'] * 100).round(1)
-            compliance_data = compliance_data.sort_values('compliance_rate', ascending=False)
-            
-            fig3, ax3 = plt.subplots(figsize=(10, 6))
-            bars = ax3.bar(
-                compliance_data['Thiết bị'],
-                compliance_data['compliance_rate'],
-                color='lightgreen'
+    # Tính mọi chỉ số theo Thiết bị trong một lần groupby (chỉ các khoảng cách > 0 ngày)
+    # Với data.csv: lấy từ bảng tổng hợp theo ngày nếu bảng phản ánh đúng phiên bản dữ liệu đang hiển thị
+    # (chi phí theo số thiết bị x số ngày thay vì số lần CIP), ngược lại tính trực tiếp từ df_filtered.
+    # Bảng được cập nhật trong luồng nền: request không bao giờ chờ tính lại bảng
+    with profiler.stage("metrics", len(df_filtered)) as stage:
+        rollups, rollup_version = get_rollup_tracker().latest() if not use_store else (None, None)
+        if rollup_version is not None and rollup_version == data_version:
+            device_metrics = rollups.device_metrics(
+                selected_line, selected_circuit,
+                None if selected_thiet_bi == "Tất cả" else selected_thiet_bi,
+                start_date, end_date
             )
-            
-            # Thêm giá trị phần trăm lên đỉnh mỗi cột
-            for bar in bars:
-                height = bar.get_height()
-                ax3.text(
-                    bar.get_x() + bar.get_width()/2.,
-                    height + 1,
-                    f'{height:.1f}%',
-                    ha='center',
-                    va='bottom'
-                )
-            
-            ax3.set_title(f"Tỷ lệ tuân thủ quy định 5 ngày theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})")
-            ax3.set_xlabel("Thiết bị")
-            ax3.set_ylabel("Tỷ lệ tuân thủ (%)")
-            ax3.set_ylim(0, 105)  # Giới hạn đến 105% để có không gian cho số
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            st.pyplot(fig3)
-            
-            # Thêm bảng thống kê chi tiết về khoảng thời gian
-            st.subheader("4) Thống kê chi tiết về khoảng thời gian giữa các lần CIP")
-            
-            # Tạo bảng thống kê rộng hơn với nhiều thông tin
-            stats_df = time_gap_data.groupby('Thiết bị').agg(
-                Trung_bình_ngày=('time_gap_days', 'mean'),
-                Tối_thiểu_ngày=('time_gap_days', 'min'),
-                Tối_đa_ngày=('time_gap_days', 'max'),
-                Độ_lệch_chuẩn=('time_gap_days', 'std'),
-                Số_lần_CIP=('time_gap_days', 'count'),
-                Tỷ_lệ_tuân_thủ=('time_gap_days', lambda x: (sum(x <= 5) / len(x) * 100)),
-                Số_lần_vượt_quy_định=('time_gap_days', lambda x: sum(x > 5))
-            ).reset_index()
-            
-            # Làm tròn số thập phân
-            numeric_cols = ['Trung_bình_ngày', 'Tối_thiểu_ngày', 'Tối_đa_ngày', 'Độ_lệch_chuẩn', 'Tỷ_lệ_tuân_thủ']
-            stats_df[numeric_cols] = stats_df[numeric_cols].round(2)
-            
-            # Đổi tên cột để hiển thị tiếng Việt đẹp hơn
-            stats_df.columns = ['Thiết bị', 'Trung bình (ngày)', 'Tối thiểu (ngày)', 'Tối đa (ngày)', 
-                             'Độ lệch chuẩn (ngày)', 'Số lần CIP', 'Tỷ lệ tuân thủ (%)', 'Số lần vượt quy định']
-            
-            # Sắp xếp theo tỷ lệ tuân thủ giảm dần
-            stats_df = stats_df.sort_values('Tỷ lệ tuân thủ (%)', ascending=False)
-            
-            st.dataframe(stats_df)
-            
-        except Exception as e:
-            st.error(f"Lỗi khi vẽ biểu đồ khoảng thời gian: {str(e)}")
-    else:
-        st.warning("Không có đủ dữ liệu về khoảng thời gian giữa các lần CIP để vẽ biểu đồ.")
+        else:
+            device_metrics = compute_device_metrics(df_filtered)
+        stage.set_rows_out(len(device_metrics.per_device))
     
-    # 6) Phân tích hiệu suất CIP
-    st.subheader("5) Phân tích hiệu suất CIP")
+    # Các mục bên dưới nằm trong tab: chỉ tab đang mở mới được tính và vẽ.
+    # Tab SPC chỉ có khi đọc data.csv: giới hạn kiểm soát (SpcTracker) tính từ data.csv,
+    # còn ở chế độ store các điểm trên biểu đồ lại lấy từ store -> hai nguồn không khớp nhau
+    tab_labels = ["Khoảng cách & tuân thủ", "Hiệu suất CIP"] + ([] if use_store else ["Kiểm soát SPC"])
+    tab_gap, tab_performance, *tab_spc = st.tabs(tab_labels, key="section_tab", on_change="rerun")
+    tab_spc = tab_spc[0] if tab_spc else None
     
-    if not df_filtered.empty and 'Tổng thời gian CIP (phút)' in df_filtered.columns:
-        try:
-            # Tính trung bình thời gian CIP cho mỗi thiết bị
-            avg_cip_duration = df_filtered.groupby('Thiết bị')['Tổng thời gian CIP (phút)'].mean().reset_index()
-            avg_cip_duration = avg_cip_duration.sort_values('Tổng thời gian CIP (phút)', ascending=False)
-            
-            # Vẽ biểu đồ thời gian CIP trung bình theo thiết bị
-            fig4, ax4 = plt.subplots(figsize=(10, 6))
-            bars = ax4.bar(
-                avg_cip_duration['Thiết bị'],
-                avg_cip_duration['Tổng thời gian CIP (phút)'],
-                color='lightcoral'
+    # 5) Biểu đồ thể hiện thời gian giữa hai lần CIP (time_gap_days)
+    if tab_gap.open:
+        with tab_gap, profiler.stage("tab: Khoảng cách & tuân thủ", len(df_filtered)):
+            st.subheader("2) Thời gian giữa hai lần CIP")
+            st.markdown(
+                "- **Cách tính**: Thời gian Bắt đầu CIP của đợt sau trừ đi Thời gian Kết thúc CIP của đợt trước.\n"
+                "- Đơn vị: ngày (1 ngày = 24 giờ).\n"
+                "- Đường kẻ ngang (màu đỏ) biểu thị quy định 5 ngày."
             )
             
-            # Thêm giá trị lên đỉnh mỗi cột
-            for bar in bars:
-                height = bar.get_height()
-                ax4.text(
-                    bar.get_x() + bar.get_width()/2.,
-                    height + 0.5,
-                    f'{height:.1f}',
-                    ha='center',
-                    va='bottom'
-                )
-            
-            ax4.set_title(f"Thời gian CIP trung bình theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})")
-            ax4.set_xlabel("Thiết bị")
-            ax4.set_ylabel("Thời gian trung bình (phút)")
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            st.pyplot(fig4)
-            
-            # 7) Phân tích xu hướng nhiệt độ
-            st.subheader("6) Phân tích xu hướng nhiệt độ")
-            
-            temp_columns = [
-                ("Nhiệt độ Xút", "Nhiệt độ Xút Bắt đầu", "Nhiệt độ Xút Kết thúc"),
-                ("Nhiệt độ Nước nóng", "Nhiệt độ Nước nóng Bắt đầu", "Nhiệt độ Nước nóng Kết thúc")
-            ]
-            
-            for temp_type, start_col, end_col in temp_columns:
-                if start_col in df_filtered.columns and end_col in df_filtered.columns:
-                    # Tính chênh lệch nhiệt độ
-                    df_filtered[f'Chênh lệch {temp_type}'] = df_filtered[end_col] - df_filtered[start_col]
+            if not device_metrics.gaps().empty:
+                try:
+                    # Trung bình thời gian giữa các lần CIP cho mỗi thiết bị
+                    avg_time_gap = device_metrics.column("gap_mean")
+                    show_chart(("gap",), lambda: gap_figure(avg_time_gap, selected_circuit, selected_line))
                     
-                    # Tính trung bình chênh lệch nhiệt độ cho mỗi thiết bị
-                    avg_temp_diff = df_filtered.groupby('Thiết bị')[f'Chênh lệch {temp_type}'].mean().reset_index()
-                    avg_temp_diff = avg_temp_diff.sort_values(f'Chênh lệch {temp_type}', ascending=False)
+                    # Thêm biểu đồ tỷ lệ tuân thủ quy định 5 ngày
+                    st.subheader("3) Tỷ lệ tuân thủ quy định 5 ngày")
                     
-                    # Vẽ biểu đồ chênh lệch nhiệt độ trung bình
-                    fig5, ax5 = plt.subplots(figsize=(10, 6))
-                    bars = ax5.bar(
-                        avg_temp_diff['Thiết bị'],
-                        avg_temp_diff[f'Chênh lệch {temp_type}'],
-                        color='lightblue'
+                    # Tỷ lệ tuân thủ cho mỗi thiết bị: hiệu hai tổng tích lũy tại ranh giới khoảng ngày
+                    compliance_index = get_compliance_index(
+                        df_clean, filter_index, data_version, store_window
                     )
+                    compliance_data = compliance_index.rates(
+                        date_bounds, selected_line, selected_circuit,
+                        selected_thiet_bi if selected_thiet_bi != "Tất cả" else None
+                    ).round(1)
+                    show_chart(("compliance",), lambda: compliance_figure(compliance_data, selected_circuit, selected_line))
                     
-                    # Thêm giá trị lên đỉnh mỗi cột
-                    for bar in bars:
-                        height = bar.get_height()
-                        ax5.text(
-                            bar.get_x() + bar.get_width()/2.,
-                            height + 0.2,
-                            f'{height:.1f}°C',
-                            ha='center',
-                            va='bottom'
+                    # Xu hướng tuân thủ theo cửa sổ trượt tuần / tháng
+                    show_chart(
+                        ("compliance_trend",),
+                        lambda: compliance_trend_figure(
+                            compliance_index.rolling(
+                                selected_line, selected_circuit,
+                                selected_thiet_bi if selected_thiet_bi != "Tất cả" else None,
+                                start_datetime, end_datetime
+                            ),
+                            selected_thiet_bi, selected_circuit, selected_line
                         )
+                    )
                     
-                    ax5.set_title(f"Chênh lệch {temp_type} trung bình theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})")
-                    ax5.set_xlabel("Thiết bị")
-                    ax5.set_ylabel("Chênh lệch nhiệt độ trung bình (°C)")
-                    plt.xticks(rotation=45, ha='right')
-                    plt.tight_layout()
-                    st.pyplot(fig5)
-            
-            # 8) Phân tích hiệu quả lưu lượng
-            st.subheader("7) Phân tích hiệu quả lưu lượng")
+                    # Thêm bảng thống kê chi tiết về khoảng thời gian
+                    st.subheader("4) Thống kê chi tiết về khoảng thời gian giữa các lần CIP")
+                    
+                    # Bảng thống kê đã làm tròn, đổi tên cột tiếng Việt và sắp xếp theo tỷ lệ tuân thủ giảm dần
+                    stats_df = device_metrics.stats_table()
+                    
+                    st.dataframe(stats_df)
+                    
+                except Exception as e:
+                    st.error(f"Lỗi khi vẽ biểu đồ khoảng thời gian: {str(e)}")
+            else:
+                st.warning("Không có đủ dữ liệu về khoảng thời gian giữa các lần CIP để vẽ biểu đồ.")
+    
+    # 6) Phân tích hiệu suất CIP
+    if tab_performance.open:
+        with tab_performance, profiler.stage("tab: Hiệu suất CIP", len(df_filtered)):
+            st.subheader("5) Phân tích hiệu suất CIP")
             
-            if 'Lưu lượng hồi (l/h)' in df_filtered.columns:
-                # Tính trung bình lưu lượng hồi cho mỗi thiết bị
-                avg_flow = df_filtered.groupby('Thiết bị')['Lưu lượng hồi (l/h)'].mean().reset_index()
-                avg_flow = avg_flow.sort_values('Lưu lượng hồi (l/h)', ascending=False)
-                
-                fig6, ax6 = plt.subplots(figsize=(10, 6))
-                bars = ax6.bar(
-                    avg_flow['Thiết bị'],
-                    avg_flow['Lưu lượng hồi (l/h)'],
-                    color='lightsalmon'
+            if not df_filtered.empty and 'Tổng thời gian CIP (phút)' in df_filtered.columns:
+                try:
+                    # Trung bình thời gian CIP cho mỗi thiết bị
+                    avg_cip_duration = device_metrics.column("duration_mean")
+                    show_chart(("duration",), lambda: duration_figure(avg_cip_duration, selected_circuit, selected_line))
+                    
+                    # 7) Phân tích xu hướng nhiệt độ
+                    st.subheader("6) Phân tích xu hướng nhiệt độ")
+                    
+                    for temp_type, start_col, end_col in TEMP_COLUMNS:
+                        if start_col in df_filtered.columns and end_col in df_filtered.columns:
+                            # Trung bình chênh lệch nhiệt độ cho mỗi thiết bị
+                            avg_temp_diff = device_metrics.column(temp_delta_column(temp_type))
+                            show_chart(
+                                ("temp_delta", temp_type),
+                                lambda: temp_delta_figure(avg_temp_diff, temp_type, selected_circuit, selected_line)
+                            )
+                    
+                    # 8) Phân tích hiệu quả lưu lượng
+                    st.subheader("7) Phân tích hiệu quả lưu lượng")
+                    
+                    if 'Lưu lượng hồi (l/h)' in df_filtered.columns:
+                        # Trung bình lưu lượng hồi cho mỗi thiết bị
+                        avg_flow = device_metrics.column("flow_mean")
+                        show_chart(("flow",), lambda: flow_figure(avg_flow, selected_circuit, selected_line))
+                    
+                except Exception as e:
+                    st.error(f"Lỗi khi phân tích hiệu suất CIP: {str(e)}")
+    
+    # 8) Biểu đồ kiểm soát SPC (giới hạn từ toàn bộ lịch sử của data.csv, cập nhật theo từng lần CIP mới)
+    if tab_spc is not None and tab_spc.open:
+        with tab_spc, profiler.stage("tab: Kiểm soát SPC", len(df_filtered)):
+            st.subheader("8) Biểu đồ kiểm soát SPC")
+            if not os.path.isfile(DATA_PATH):
+                st.info(f"Biểu đồ kiểm soát cần file {DATA_PATH}.")
+            else:
+                st.markdown(
+                    "- Đường trung tâm và giới hạn ±3σ tính từ toàn bộ lịch sử của thiết bị (σ = khoảng trượt trung bình / 1.128).\n"
+                    "- Cảnh báo: điểm ngoài ±3σ, EWMA ngoài giới hạn, hoặc 8 lần CIP liên tiếp cùng một phía đường trung tâm."
                 )
+                spc_engine = get_spc_tracker().refresh()
+                spc_column = st.selectbox("Chọn thông số", SPC_COLUMNS, key="spc_column")
+                spc_table = spc_engine.table(selected_line, selected_circuit, spc_column)
+                if selected_thiet_bi != "Tất cả" and not spc_table.empty:
+                    spc_table = spc_table[spc_table["Thiết bị"] == selected_thiet_bi]
                 
-                # Thêm giá trị lên đỉnh mỗi cột
-                for bar in bars:
-                    height = bar.get_height()
-                    ax6.text(
-                        bar.get_x() + bar.get_width()/2.,
-                        height + 100,
-                        f'{height:.0f}',
-                        ha='center',
-                        va='bottom'
-                    )
-                
-                ax6.set_title(f"Lưu lượng hồi trung bình theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})")
-                ax6.set_xlabel("Thiết bị")
-                ax6.set_ylabel("Lưu lượng hồi trung bình (l/h)")
-                plt.xticks(rotation=45, ha='right')
-                plt.tight_layout()
-                st.pyplot(fig6)
-            
-        except Exception as e:
-            st.error(f"Lỗi khi phân tích hiệu suất CIP: {str(e)}")
+                if spc_table.empty:
+                    st.warning(f"Chưa có dữ liệu {spc_column} cho lựa chọn này.")
+                else:
+                    alarms = int((spc_table["Cảnh báo"] != "").sum())
+                    if alarms:
+                        st.error(f"{alarms} thiết bị đang mất kiểm soát ở lần CIP gần nhất ({spc_column}).")
+                    st.dataframe(spc_table.drop(columns=["Line", "Circuit", "Thông số"]), hide_index=True)
+                    
+                    if selected_thiet_bi == "Tất cả":
+                        st.info("Chọn một Thiết bị để xem biểu đồ kiểm soát.")
+                    else:
+                        state = spc_engine.get(selected_line, selected_circuit, selected_thiet_bi, spc_column)
+                        limits = state.limits() if state is not None else None
+                        if limits is None:
+                            st.warning("Chưa đủ số lần CIP để tính giới hạn kiểm soát cho thiết bị này.")
+                        else:
+                            show_chart(
+                                ("control", spc_column, state.n),
+                                lambda: control_chart_figure(
+                                    control_series(
+                                        state, df_filtered["Thời gian Bắt đầu CIP"], df_filtered[spc_column].to_numpy(dtype=float)
+                                    ),
+                                    *limits, spc_column, selected_thiet_bi, selected_circuit, selected_line
+                                )
+                            )
     
     # 9) Hiển thị bảng dữ liệu chi tiết
     with st.expander("Xem dữ liệu chi tiết"):
+        # Chênh lệch nhiệt độ của từng lần CIP
+        for temp_type, start_col, end_col in TEMP_COLUMNS:
+            if start_col in df_filtered.columns and end_col in df_filtered.columns:
+                df_filtered[temp_delta_column(temp_type)] = df_filtered[end_col] - df_filtered[start_col]
+        
         # Hiển thị các cột quan trọng trước
         columns_to_display = [
             'Thiết bị', 'Line', 'Circuit', 'Chương trình CIP',
@@ -0,0 +1,189 @@
+"""
+Tạo báo cáo hàng loạt (không cần Streamlit) cho mọi tổ hợp Line / Circuit / Thiết bị:
+các biểu đồ giống dashboard (PNG), một trang HTML cho mỗi tổ hợp và file summary.csv
+gộp bảng thống kê (mục 4) của tất cả Circuit.
+
+Các tổ hợp được render song song bằng process pool (matplotlib không an toàn đa luồng).
+Tổ hợp có dữ liệu không đổi so với lần chạy trước sẽ được bỏ qua.
+
+Chạy: python batch_report.py --output reports [--start 2025-02-01 --end 2025-02-28] [--workers 4]
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import pandas as pd  # noqa: E402
+
+from charts import (  # noqa: E402
+    compliance_figure, distribution_figure, duration_figure, figure_to_png, flow_figure, gap_figure,
+    temp_delta_figure
+)
+from cip_cleaning import clean_data  # noqa: E402
+from data_store import load_data  # noqa: E402
+from filter_index import FilterIndex  # noqa: E402
+from metrics import TEMP_COLUMNS, compute_device_metrics, temp_delta_column  # noqa: E402
+from shared_dataset import clean_csv  # noqa: E402
+
+ALL_DEVICES = "Tất cả"
+MANIFEST_NAME = "manifest.json"
+SUMMARY_NAME = "summary.csv"
+
+# Tăng số này khi thay đổi cách vẽ biểu đồ để buộc render lại mọi tổ hợp
+REPORT_VERSION = 1
+
+DISTRIBUTION_COLUMN = "Tổng thời gian CIP (phút)"
+
+
+def slug(value):
+    """Tên thư mục an toàn cho Line / Circuit / Thiết bị."""
+    return re.sub(r"[^\w.-]+", "_", str(value)).strip("_") or "_"
+
+
+def slice_hash(df):
+    """Mã băm nội dung của lát dữ liệu một tổ hợp, dùng để bỏ qua tổ hợp không đổi."""
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(str(REPORT_VERSION).encode())
+    return digest.hexdigest()[:16]
+
+
+def render_combination(task):
+    """
+    Chạy trong tiến trình con: vẽ mọi biểu đồ của một tổ hợp, ghi PNG + index.html.
+    Trả về (key, danh sách file đã ghi).
+    """
+    key, line, circuit, device, df, out_dir = task
+    os.makedirs(out_dir, exist_ok=True)
+    device_metrics = compute_device_metrics(df)
+
+    figures = [("distribution", lambda: distribution_figure(df, DISTRIBUTION_COLUMN, device, circuit, line))]
+    if not device_metrics.gaps().empty:
+        figures += [
+            ("gap", lambda: gap_figure(device_metrics.column("gap_mean"), circuit, line)),
+            ("compliance", lambda: compliance_figure(device_metrics.column("compliance_rate").round(1), circuit, line)),
+        ]
+    figures.append(("duration", lambda: duration_figure(device_metrics.column("duration_mean"), circuit, line)))
+    for temp_type, start_col, end_col in TEMP_COLUMNS:
+        if start_col in df.columns and end_col in df.columns:
+            figures.append((
+                slug(temp_delta_column(temp_type)),
+                lambda temp_type=temp_type: temp_delta_figure(
+                    device_metrics.column(temp_delta_column(temp_type)), temp_type, circuit, line
+                ),
+            ))
+    figures.append(("flow", lambda: flow_figure(device_metrics.column("flow_mean"), circuit, line)))
+
+    written = []
+    for name, build in figures:
+        fig = build()
+        if fig is None:
+            continue
+        path = os.path.join(out_dir, f"{name}.png")
+        with open(path, "wb") as f:
+            f.write(figure_to_png(fig))
+        written.append(os.path.basename(path))
+
+    stats_html = device_metrics.stats_table().to_html(index=False) if not device_metrics.gaps().empty else ""
+    images = "\n".join(f'<img src="{html.escape(name)}" style="max-width:100%">' for name in written)
+    title = html.escape(f"Line {line} / Circuit {circuit} / Thiết bị {device}")
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(
+            f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title></head>"
+            f"<body><h1>{title}</h1><p>{len(df)} bản ghi CIP</p>{stats_html}\n{images}</body></html>"
+        )
+    return key, written
+
+
+def build_tasks(df_clean, output, start=None, end=None):
+    """Liệt kê mọi tổ hợp (Line, Circuit, Thiết bị hoặc "Tất cả") có dữ liệu trong khoảng ngày."""
+    index = FilterIndex(df_clean)
+    starts = df_clean["Thời gian Bắt đầu CIP"]
+    bounds = index.window(
+        pd.Timestamp(start) if start else starts.min(),
+        pd.Timestamp(end) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1) if end else starts.max(),
+    )
+    tasks = []
+    for line in index.lines(bounds):
+        for circuit in index.circuits(bounds, line):
+            for device in [ALL_DEVICES] + index.devices(bounds, line, circuit):
+                df = index.select(
+                    df_clean, bounds, line, circuit, None if device == ALL_DEVICES else device
+                ).reset_index(drop=True)
+                out_dir = os.path.join(output, slug(line), slug(circuit), slug(device))
+                key = f"{line}/{circuit}/{device}"
+                tasks.append((key, line, circuit, device, df, out_dir))
+    return tasks
+
+
+def write_summary(tasks, output):
+    """Gộp bảng thống kê (mục 4) của các tổ hợp "Tất cả" thành summary.csv."""
+    tables = []
+    for _, line, circuit, device, df, _ in tasks:
+        if device != ALL_DEVICES:
+            continue
+        device_metrics = compute_device_metrics(df)
+        if device_metrics.gaps().empty:
+            continue
+        table = device_metrics.stats_table()
+        table.insert(0, "Circuit", circuit)
+        table.insert(0, "Line", line)
+        tables.append(table)
+    summary = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    summary.to_csv(os.path.join(output, SUMMARY_NAME), index=False)
+    return summary
+
+
+def run(df_clean, output, start=None, end=None, workers=None, force=False):
+    """Render các tổ hợp đã thay đổi song song, cập nhật manifest và summary. Trả về (số render, số bỏ qua)."""
+    os.makedirs(output, exist_ok=True)
+    manifest_path = os.path.join(output, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    tasks = build_tasks(df_clean, output, start, end)
+    hashes = {task[0]: slice_hash(task[4]) for task in tasks}
+    pending = [
+        task for task in tasks
+        if manifest.get(task[0]) != hashes[task[0]]
+        or not os.path.exists(os.path.join(task[5], "index.html"))
+    ]
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for key, _ in pool.map(render_combination, pending, chunksize=4):
+                manifest[key] = hashes[key]
+                # Ghi manifest sau mỗi tổ hợp để lần chạy bị ngắt vẫn giữ được tiến độ
+                with open(manifest_path, "w", encoding="utf-8") as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    write_summary(tasks, output)
+    return len(pending), len(tasks) - len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo báo cáo CIP cho mọi tổ hợp Line/Circuit/Thiết bị")
+    parser.add_argument("--data", default="data.csv", help="File CSV hoặc thư mục store Parquet")
+    parser.add_argument("--output", default="reports", help="Thư mục ghi báo cáo")
+    parser.add_argument("--start", help="Từ ngày (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Đến ngày (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=None, help="Số tiến trình (mặc định: số CPU)")
+    parser.add_argument("--force", action="store_true", help="Render lại mọi tổ hợp")
+    args = parser.parse_args()
+
+    # CSV lớn được làm sạch theo từng phần (bộ nhớ giới hạn), store Parquet thì đọc như dashboard
+    df_clean = clean_csv(args.data) if os.path.isfile(args.data) else clean_data(load_data(args.data))
+    rendered, skipped = run(df_clean, args.output, args.start, args.end, args.workers, args.force)
+    print(f"Đã render {rendered} tổ hợp, bỏ qua {skipped} tổ hợp không đổi. Báo cáo ở {args.output}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Micro-benchmark: so sánh cách cũ (.apply(convert_to_minutes) từng dòng)
+với bộ phân tích vector hóa trong cip_parsing.
+
+Chạy: python benchmarks/bench_parsing.py [số_dòng ...]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cip_parsing import parse_duration_minutes  # noqa: E402
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data.csv")
+COLUMN = "Tổng thời gian bước Xút"
+
+
+def convert_to_minutes(t_str):
+    """Bản sao của hàm cũ trong clean_data() để làm mốc so sánh."""
+    if pd.isna(t_str) or t_str == '0:00' or t_str == '':
+        return 0
+    try:
+        parts = t_str.split(':')
+        if len(parts) == 2:
+            hours = int(parts[0])
+            minutes = int(parts[1])
+            return hours * 60 + minutes
+        return 0
+    except:  # noqa: E722 - giữ nguyên hành vi của bản cũ
+        return 0
+
+
+def best_of(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(sizes):
+    base = pd.read_csv(DATA_PATH)[COLUMN]
+    print(f"{'rows':>10} {'apply (s)':>12} {'vectorized (s)':>15} {'speedup':>9}")
+    for n_rows in sizes:
+        series = pd.Series(base.sample(n_rows, replace=True, random_state=0).to_numpy(), name=COLUMN)
+        legacy = series.apply(convert_to_minutes)
+        vectorized, report = parse_duration_minutes(series)
+        assert report.malformed == 0 and (legacy.to_numpy() == vectorized.to_numpy()).all()
+
+        t_apply = best_of(lambda: series.apply(convert_to_minutes))
+        t_vector = best_of(lambda: parse_duration_minutes(series))
+        print(f"{n_rows:>10} {t_apply:>12.4f} {t_vector:>15.4f} {t_apply / t_vector:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
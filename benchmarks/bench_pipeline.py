@@ -0,0 +1,163 @@
+"""
+Benchmark toàn bộ pipeline của dashboard (không cần Streamlit server):
+load_data -> clean_data -> lọc như main() -> tính chỉ số -> render biểu đồ,
+trên dữ liệu giả lập từ benchmarks/synthetic.py.
+
+Mỗi giai đoạn được đo thời gian (wall time) và bộ nhớ cấp phát tối đa (tracemalloc),
+kết quả ghi thêm vào file JSONL để so sánh giữa các phiên bản.
+
+Chạy: python benchmarks/bench_pipeline.py --rows 10000 100000 1000000 --devices 200
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+from benchmarks.synthetic import generate_cip_records  # noqa: E402
+from charts import compliance_figure, distribution_figure, duration_figure, figure_to_png, gap_figure  # noqa: E402
+from cip_cleaning import clean_data  # noqa: E402
+from data_store import load_data  # noqa: E402
+from filter_index import FilterIndex  # noqa: E402
+from metrics import compute_device_metrics  # noqa: E402
+
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "results", "pipeline.jsonl")
+
+# Mỗi thiết bị tối đa khoảng 2000 lần CIP (~20 năm) để năm 2 chữ số "%y" không bị tràn
+ROWS_PER_DEVICE = 2000
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(stage, func, rows_in, trace_memory=True):
+    """
+    Chạy func() và trả về (kết quả, bản ghi đo lường của giai đoạn).
+    Thời gian đo ở lần chạy không bật tracemalloc (tracemalloc làm chậm đáng kể);
+    bộ nhớ cấp phát tối đa đo ở một lần chạy thứ hai có bật tracemalloc.
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    rows_out = len(result) if hasattr(result, "__len__") else None
+    return result, {
+        "stage": stage,
+        "seconds": round(elapsed, 6),
+        "peak_bytes": peak,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+    }
+
+
+def run_pipeline(n_rows, n_devices, workdir, trace_memory=True):
+    records = []
+    df_raw = generate_cip_records(n_rows, n_devices=n_devices)
+    csv_path = os.path.join(workdir, f"data_{n_rows}.csv")
+    df_raw.to_csv(csv_path, index=False)
+    del df_raw
+
+    df_raw, rec = measure("load_data", lambda: load_data(csv_path), n_rows, trace_memory)
+    records.append(rec)
+
+    df_clean, rec = measure("clean_data", lambda: clean_data(df_raw), len(df_raw), trace_memory)
+    records.append(rec)
+
+    # Lọc giống main(): một tháng ở giữa lịch sử, Line và Circuit đầu tiên, "Tất cả" thiết bị
+    starts = df_clean["Thời gian Bắt đầu CIP"]
+    start = (starts.min() + (starts.max() - starts.min()) / 2).normalize()
+    end = start + pd.Timedelta(days=31) - pd.Timedelta(seconds=1)
+
+    filter_index, rec = measure("filter_index_build", lambda: FilterIndex(df_clean), len(df_clean), trace_memory)
+    rec["rows_out"] = len(filter_index.group_lo)
+    records.append(rec)
+
+    def apply_filters():
+        bounds = filter_index.window(start, end)
+        line = filter_index.lines(bounds)[0]
+        circuit = filter_index.circuits(bounds, line)[0]
+        filter_index.devices(bounds, line, circuit)
+        return filter_index.select(df_clean, bounds, line, circuit)
+
+    df_filtered, rec = measure("filter", apply_filters, len(df_clean), trace_memory)
+    records.append(rec)
+
+    device_metrics, rec = measure("aggregate", lambda: compute_device_metrics(df_filtered), len(df_filtered), trace_memory)
+    rec["rows_out"] = len(device_metrics.per_device)
+    records.append(rec)
+
+    def render():
+        line, circuit = df_filtered["Line"].iloc[0], df_filtered["Circuit"].iloc[0]
+        figures = [
+            distribution_figure(df_filtered, "Tổng thời gian CIP (phút)", "Tất cả", circuit, line),
+            gap_figure(device_metrics.column("gap_mean"), circuit, line),
+            compliance_figure(device_metrics.column("compliance_rate").round(1), circuit, line),
+            duration_figure(device_metrics.column("duration_mean"), circuit, line),
+        ]
+        return [figure_to_png(fig) for fig in figures if fig is not None]
+
+    _, rec = measure("render", render, len(df_filtered), trace_memory)
+    records.append(rec)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline dashboard CIP trên dữ liệu giả lập")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--devices", type=int, default=None,
+                        help=f"Số thiết bị (mặc định: max(50, rows / {ROWS_PER_DEVICE}))")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="File JSONL để ghi thêm kết quả")
+    parser.add_argument("--skip-memory", action="store_true", help="Không đo bộ nhớ (chạy mỗi giai đoạn một lần)")
+    args = parser.parse_args()
+
+    meta = {
+        "run_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+    print(f"{'rows':>9} {'devices':>8} {'stage':>19} {'seconds':>9} {'peak MB':>9} {'rows out':>9}")
+    with tempfile.TemporaryDirectory() as workdir, open(args.output, "a", encoding="utf-8") as out:
+        for n_rows in args.rows:
+            n_devices = args.devices or max(50, -(-n_rows // ROWS_PER_DEVICE))
+            for rec in run_pipeline(n_rows, n_devices, workdir, not args.skip_memory):
+                rec.update(meta, rows=n_rows, devices=n_devices)
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                print(
+                    f"{n_rows:>9} {n_devices:>8} {rec['stage']:>19} {rec['seconds']:>9.3f} "
+                    f"{(rec['peak_bytes'] or 0) / 2**20:>9.1f} {rec['rows_out']!s:>9}"
+                )
+    print(f"Kết quả đã ghi vào {args.output}")
+
+
+if __name__ == "__main__":
+    main()
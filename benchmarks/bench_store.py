@@ -0,0 +1,78 @@
+"""
+Benchmark: đọc toàn bộ data.csv rồi lọc, so với đọc store Parquet phân vùng
+theo Line/tháng có predicate pushdown (một tháng, một Line).
+
+Dữ liệu được nhân bản từ data.csv (10x, 100x ...), mỗi bản dịch thời gian
+về sau đúng bằng độ dài lịch sử hiện có để lịch sử dài ra như thực tế.
+
+Chạy: python benchmarks/bench_store.py [hệ_số ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cip_parsing import TIMESTAMP_COLUMNS, TIMESTAMP_FORMAT  # noqa: E402
+from data_store import filter_frame, read_dataset, write_dataset  # noqa: E402
+
+
+def scale_history(df, factor):
+    """Nhân bản df factor lần, mỗi bản lùi thời gian thêm một khoảng bằng độ dài lịch sử."""
+    parsed = {col: pd.to_datetime(df[col], format=TIMESTAMP_FORMAT) for col in TIMESTAMP_COLUMNS}
+    span = parsed["Thời gian Bắt đầu CIP"].max() - parsed["Thời gian Bắt đầu CIP"].min() + pd.Timedelta(days=1)
+    copies = []
+    for i in range(factor):
+        copy = df.copy()
+        for col, values in parsed.items():
+            copy[col] = (values + span * i).dt.strftime(TIMESTAMP_FORMAT)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def timed(func, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(factors):
+    base = pd.read_csv(os.path.join(ROOT, "data.csv"))
+    line = base["Line"].iloc[0]
+    print(f"{'factor':>7} {'rows':>9} {'csv scan (s)':>13} {'store (s)':>10} {'speedup':>8} {'rows out':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for factor in factors:
+            df = scale_history(base, factor)
+            csv_path = os.path.join(tmp, f"data_{factor}.csv")
+            store_path = os.path.join(tmp, f"store_{factor}")
+            df.to_csv(csv_path, index=False)
+            write_dataset(df, store_path)
+
+            # Cửa sổ một tháng ở giữa lịch sử
+            starts = pd.to_datetime(df["Thời gian Bắt đầu CIP"], format=TIMESTAMP_FORMAT)
+            start = starts.min() + (starts.max() - starts.min()) / 2
+            end = start + pd.Timedelta(days=30)
+
+            t_csv, from_csv = timed(
+                lambda: filter_frame(pd.read_csv(csv_path), start=start, end=end, lines=[line])
+            )
+            t_store, from_store = timed(
+                lambda: read_dataset(store_path, start=start, end=end, lines=[line])
+            )
+            assert len(from_csv) == len(from_store)
+            print(
+                f"{factor:>7} {len(df):>9} {t_csv:>13.4f} {t_store:>10.4f} "
+                f"{t_csv / t_store:>7.1f}x {len(from_store):>9}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1, 10, 100])
@@ -0,0 +1,59 @@
+"""
+Benchmark bộ nhớ: clean_data() trong bộ nhớ so với stream_clean() theo từng phần,
+khi lịch sử dài dần (số thiết bị giữ nguyên). Bộ nhớ cấp phát tối đa đo bằng tracemalloc
+(gồm mảng NumPy/pandas; bộ nhớ riêng của pyarrow khi ghi Parquet không được tính).
+
+Với stream_clean, đỉnh bộ nhớ phải gần như không đổi khi số dòng tăng.
+
+Chạy: python benchmarks/bench_streaming.py [--rows 20000 80000] [--chunksize 50000]
+(mặc định đủ nhỏ để chạy trong CI; đo bộ nhớ thật sự cần --rows 600000 1200000)
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+from benchmarks.synthetic import generate_cip_records  # noqa: E402
+from cip_cleaning import clean_data  # noqa: E402
+from streaming_clean import stream_clean  # noqa: E402
+
+
+def peak_memory(func):
+    """Trả về (giây, MB cấp phát tối đa) của func()."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[20_000, 80_000])
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'in-memory s':>12} {'in-memory MB':>13} {'stream s':>9} {'stream MB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "data.csv")
+        for n_rows in args.rows:
+            generate_cip_records(n_rows, n_devices=args.devices).to_csv(csv_path, index=False)
+            mem_s, mem_mb = peak_memory(lambda: clean_data(pd.read_csv(csv_path)))
+            stream_s, stream_mb = peak_memory(
+                lambda: stream_clean(csv_path, os.path.join(tmp, "clean_store"), args.chunksize)
+            )
+            print(f"{n_rows:>10} {mem_s:>12.2f} {mem_mb:>13.1f} {stream_s:>9.2f} {stream_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
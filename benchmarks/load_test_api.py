@@ -0,0 +1,124 @@
+"""
+Load test cho metrics_api.py chạy trên localhost: nhiều client đồng thời poll /metrics
+(giữ kết nối keep-alive, gửi If-None-Match như một poller thật) với các bộ lọc khác nhau.
+In ra số request/giây, độ trễ p50/p95/p99 và số phản hồi 200 / 304.
+
+Chạy dịch vụ trước:  python metrics_api.py --port 8502
+Rồi:                 python benchmarks/load_test_api.py --url http://127.0.0.1:8502 --clients 16 --seconds 10
+
+--spawn: tự khởi động dịch vụ trong tiến trình này (cổng ngẫu nhiên) trên --data.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def build_queries(base_url, n_ranges=4):
+    """Danh sách truy vấn: toàn bộ, theo từng Line, Line/Circuit và vài khoảng ngày."""
+    host = urlparse(base_url)
+    conn = http.client.HTTPConnection(host.hostname, host.port, timeout=30)
+    conn.request("GET", "/metrics")
+    payload = json.loads(conn.getresponse().read())
+    conn.close()
+
+    queries = [{}]
+    pairs = sorted({(d["line"], d["circuit"]) for d in payload["devices"]}, key=str)
+    queries += [{"line": line} for line in sorted({line for line, _ in pairs}, key=str)]
+    queries += [{"line": line, "circuit": circuit} for line, circuit in pairs]
+    if payload["devices"]:
+        d = payload["devices"][0]
+        queries.append({"line": d["line"], "circuit": d["circuit"], "device": d["device"]})
+    # Vài khoảng ngày trượt (lần đầu là 200, các lần sau là 304)
+    for i in range(n_ranges):
+        start = (np.datetime64("2025-01-01") + np.timedelta64(7 * i, "D")).astype(str)
+        end = (np.datetime64(start) + np.timedelta64(30, "D")).astype(str)
+        queries.append({"start": start, "end": end})
+    return ["/metrics" + (f"?{urlencode(q)}" if q else "") for q in queries]
+
+
+def client_loop(base_url, paths, deadline, results, offset):
+    """Một client: vòng lặp qua các truy vấn, nhớ ETag của từng truy vấn để gửi If-None-Match."""
+    host = urlparse(base_url)
+    conn = http.client.HTTPConnection(host.hostname, host.port, timeout=30)
+    etags = {}
+    latencies, statuses = [], {}
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        headers = {"If-None-Match": etags[path]} if path in etags else {}
+        start = time.perf_counter()
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    conn.close()
+    results.append((latencies, statuses))
+
+
+def run(base_url, clients, seconds):
+    paths = build_queries(base_url)
+    results = []
+    deadline = time.perf_counter() + seconds
+    threads = [
+        threading.Thread(target=client_loop, args=(base_url, paths, deadline, results, k))
+        for k in range(clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = np.concatenate([np.asarray(lat) for lat, _ in results]) * 1000
+    statuses = {}
+    for _, counts in results:
+        for status, n in counts.items():
+            statuses[status] = statuses.get(status, 0) + n
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"{len(paths)} truy vấn khác nhau, {clients} client, {elapsed:.1f}s")
+    print(f"{len(latencies) / elapsed:.0f} request/s, độ trễ p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms")
+    print("Mã trạng thái:", ", ".join(f"{status}: {n}" for status, n in sorted(statuses.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test cho metrics_api.py trên localhost")
+    parser.add_argument("--url", default="http://127.0.0.1:8502")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--spawn", action="store_true", help="Tự khởi động dịch vụ trong tiến trình này")
+    parser.add_argument("--data", default=os.path.join(ROOT, "data.csv"), help="Dữ liệu cho --spawn")
+    args = parser.parse_args()
+
+    if args.spawn:
+        from metrics_api import create_server
+
+        server, service = create_server(args.data, "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            run(args.url, args.clients, args.seconds)
+            print("Cache:", service.health()["cache"])
+        finally:
+            server.shutdown()
+            service.dataset.stop()
+    else:
+        run(args.url, args.clients, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Sinh dữ liệu CIP giả lập theo đúng schema của Google Sheet / data.csv:
+cùng tên cột tiếng Việt, thời gian "dd/mm/yy HH:MM", thời lượng "H:MM",
+và các giá trị 0 bất thường ở 'Lưu lượng hồi (l/h)' như dữ liệu thật.
+
+    from benchmarks.synthetic import generate_cip_records
+    df = generate_cip_records(1_000_000, n_devices=400)
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    "Thiết bị", "Line", "Circuit", "Chương trình CIP", "Lưu lượng hồi (l/h)",
+    "Tổng thời gian bước Xút", "Độ dẫn điện Xút Bắt đầu", "Độ dẫn điện Xút Kết thúc",
+    "Nhiệt độ Xút Bắt đầu", "Nhiệt độ Xút Kết thúc", "Tổng thời gian bước nước nóng",
+    "Nhiệt độ Nước nóng Bắt đầu", "Nhiệt độ Nước nóng Kết thúc",
+    "Thời gian Bắt đầu CIP", "Thời gian Kết thúc CIP", "CIP kế tiếp",
+]
+
+TIMESTAMP_FORMAT = "%d/%m/%y %H:%M"
+
+# Tỷ lệ xấp xỉ theo data.csv hiện tại
+FLOW_ZERO_RATE = 0.19
+XUT_ZERO_RATE = 0.30
+HOT_WATER_ZERO_RATE = 0.27
+SEMI_RATE = 0.14
+
+
+def _format_duration(minutes):
+    """Mảng số phút -> chuỗi "H:MM"."""
+    minutes = pd.Series(minutes, dtype="int64")
+    return (minutes // 60).astype(str) + ":" + (minutes % 60).astype(str).str.zfill(2)
+
+
+def _format_timestamp(values):
+    return pd.Series(values).dt.strftime(TIMESTAMP_FORMAT)
+
+
+def generate_cip_records(n_rows, n_devices=50, n_lines=3, circuits_per_line=5,
+                         start="2023-01-01", seed=0):
+    """
+    Tạo n_rows lần CIP cho n_devices thiết bị, chia đều vào n_lines Line x circuits_per_line Circuit.
+    Mỗi thiết bị được CIP lần lượt, cách nhau 1-7 ngày (đôi khi lâu hơn để có vi phạm quy định 5 ngày).
+    """
+    rng = np.random.default_rng(seed)
+
+    lines = np.array([f"L{i + 1}" if i else "MMB" for i in range(n_lines)])
+    device_line = np.arange(n_devices) % n_lines
+    device_circuit = (np.arange(n_devices) // n_lines) % circuits_per_line + 1
+    device_names = np.array([f"T{d // 10 + 1}T{d % 10 + 1}" for d in range(n_devices)])
+    # Tên thiết bị chỉ cần duy nhất trong cùng (Line, Circuit)
+    device_names = np.char.add(device_names, np.char.add("_", (np.arange(n_devices) // (n_lines * circuits_per_line)).astype(str)))
+
+    # Các thiết bị được CIP xen kẽ: dòng i thuộc thiết bị i % n_devices
+    device = np.arange(n_rows) % n_devices
+    per_device = -(-n_rows // n_devices)
+    gaps_hours = rng.gamma(shape=4.0, scale=24.0, size=(per_device, n_devices))
+    offsets_hours = np.cumsum(gaps_hours, axis=0).ravel()[:n_rows]
+    begin = pd.Timestamp(start) + pd.to_timedelta(np.round(offsets_hours * 60), unit="min")
+
+    xut_minutes = rng.integers(25, 40, n_rows)
+    hot_minutes = rng.integers(3, 9, n_rows)
+    total_minutes = xut_minutes + hot_minutes + rng.integers(20, 40, n_rows)
+    end = begin + pd.to_timedelta(total_minutes, unit="min")
+    next_due = end + pd.to_timedelta(rng.choice([5, 7], n_rows), unit="D")
+
+    flow = rng.normal(11500, 7800, n_rows).clip(-500, 42000).round().astype(np.int64)
+    flow[rng.random(n_rows) < FLOW_ZERO_RATE] = 0
+    xut_minutes[rng.random(n_rows) < XUT_ZERO_RATE] = 0
+    hot_minutes[rng.random(n_rows) < HOT_WATER_ZERO_RATE] = 0
+
+    df = pd.DataFrame({
+        "Thiết bị": device_names[device],
+        "Line": lines[device_line[device]],
+        "Circuit": device_circuit[device],
+        "Chương trình CIP": np.where(rng.random(n_rows) < SEMI_RATE, "Semi", "Full"),
+        "Lưu lượng hồi (l/h)": flow,
+        "Tổng thời gian bước Xút": _format_duration(xut_minutes),
+        "Độ dẫn điện Xút Bắt đầu": rng.normal(31.8, 5.5, n_rows).round(2),
+        "Độ dẫn điện Xút Kết thúc": rng.normal(26.6, 19.1, n_rows).clip(0).round(2),
+        "Nhiệt độ Xút Bắt đầu": rng.normal(83.4, 3.4, n_rows).round(2),
+        "Nhiệt độ Xút Kết thúc": rng.normal(65.1, 42.6, n_rows).clip(0).round(2),
+        "Tổng thời gian bước nước nóng": _format_duration(hot_minutes),
+        "Nhiệt độ Nước nóng Bắt đầu": rng.normal(90.7, 3.4, n_rows).round(2),
+        "Nhiệt độ Nước nóng Kết thúc": rng.normal(75.1, 41.1, n_rows).clip(0).round(2),
+        "Thời gian Bắt đầu CIP": _format_timestamp(begin),
+        "Thời gian Kết thúc CIP": _format_timestamp(end),
+        "CIP kế tiếp": _format_timestamp(next_due),
+    })
+    return df[COLUMNS]
@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+
+from charts import figure_to_png
+
+# Giới hạn bộ nhớ mặc định cho ảnh biểu đồ đã render (PNG)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ChartCache:
+    """
+    Cache LRU cho ảnh biểu đồ đã render (PNG bytes), giới hạn theo tổng dung lượng.
+    Khóa gồm phiên bản dữ liệu và trạng thái bộ lọc (Line, Circuit, Thiết bị, khoảng ngày,
+    thông số) nên mọi phiên Streamlit dùng chung được; đổi dữ liệu là tự động lỡ cache.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # pyplot không an toàn đa luồng -> chỉ render một biểu đồ tại một thời điểm
+        self._render_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            if len(png) > self.max_bytes:
+                return
+            self._entries[key] = png
+            self._size += len(png)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def get_or_render(self, key, render):
+        """
+        Trả về PNG bytes của biểu đồ theo key; nếu chưa có thì gọi render() để tạo figure.
+        render() có thể trả về None (không đủ dữ liệu để vẽ) -> trả về None, không cache.
+        """
+        png = self.get(key)
+        if png is not None:
+            return png
+        with self._render_lock:
+            fig = render()
+            if fig is None:
+                return None
+            png = figure_to_png(fig)
+        self.put(key, png)
+        return png
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
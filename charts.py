@@ -0,0 +1,247 @@
+import io
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+from metrics import COMPLIANCE_THRESHOLD_DAYS
+from sketches import POINT_BUDGET, downsample_points
+from spc import EWMA_LAMBDA, LIMIT_SIGMA
+
+# Cùng thiết lập savefig mặc định với st.pyplot (dpi=200, cắt viền thừa)
+PNG_DPI = 200
+
+
+def figure_to_png(fig):
+    """Render figure thành PNG bytes rồi đóng figure để giải phóng bộ nhớ của pyplot."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=PNG_DPI, bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def distribution_figure(df, column, selected_thiet_bi, selected_circuit, selected_line, point_budget=POINT_BUDGET):
+    """
+    Mục 1: stripplot khi chọn một thiết bị (hiển thị các điểm dữ liệu riêng lẻ, tối đa
+    point_budget điểm giữ nguyên hình dạng phân phối), boxplot theo Thiết bị khi chọn "Tất cả".
+    Trả về None nếu chỉ có một thiết bị (không thể tạo boxplot).
+    """
+    if selected_thiet_bi != "Tất cả":
+        values = downsample_points(df[column], point_budget)
+        n_total = int(df[column].notna().sum())
+        fig, ax = plt.subplots(figsize=(8, 4))
+        sns.stripplot(
+            y=values,
+            jitter=True,
+            size=8 if len(values) < 500 else 3,
+            ax=ax
+        )
+        title = f"{column} cho {selected_thiet_bi} (Circuit: {selected_circuit}, Line: {selected_line})"
+        if len(values) < n_total:
+            title += f"\n{len(values)}/{n_total} điểm (lấy mẫu giữ phân phối)"
+        ax.set_title(title)
+        ax.set_ylabel(column)
+        return fig
+
+    if df["Thiết bị"].nunique() <= 1:
+        return None
+
+    if isinstance(df["Thiết bị"].dtype, pd.CategoricalDtype):
+        # Chỉ vẽ các thiết bị có trong df đã lọc (categorical giữ mọi thiết bị của toàn bộ dữ liệu)
+        df = df.assign(**{"Thiết bị": df["Thiết bị"].cat.remove_unused_categories()})
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    sns.boxplot(
+        data=df,
+        x="Thiết bị",
+        y=column,
+        ax=ax
+    )
+    ax.set_title(f"{column} theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})")
+    ax.set_xlabel("Thiết bị")
+    ax.set_ylabel(column)
+    plt.setp(ax.get_xticklabels(), rotation=45)
+    fig.tight_layout()
+    return fig
+
+
+def sketch_boxplot_figure(device_sketches, column, selected_circuit, selected_line):
+    """
+    Mục 1 khi lát dữ liệu lớn: boxplot theo Thiết bị vẽ từ sketch phân vị đã tính sẵn
+    (sketches.DistributionSketches), thời gian vẽ chỉ phụ thuộc số thiết bị.
+    Dấu x đánh dấu min/max nằm ngoài râu. Trả về None nếu có ít hơn hai thiết bị.
+    """
+    if len(device_sketches) <= 1:
+        return None
+    stats = [sketch.box_stats(str(device)) for device, sketch in device_sketches]
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.bxp(stats, showfliers=False, patch_artist=True, boxprops={"facecolor": "lightsteelblue"})
+    for position, stat in enumerate(stats, start=1):
+        extremes = [v for v in (stat["min"], stat["max"]) if v < stat["whislo"] or v > stat["whishi"]]
+        ax.plot([position] * len(extremes), extremes, "x", color="gray")
+    ax.set_title(
+        f"{column} theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})\n"
+        f"tóm tắt từ {sum(stat['n'] for stat in stats)} bản ghi"
+    )
+    ax.set_xlabel("Thiết bị")
+    ax.set_ylabel(column)
+    plt.setp(ax.get_xticklabels(), rotation=45)
+    fig.tight_layout()
+    return fig
+
+
+def bar_figure(values, title, ylabel, color, label_format, label_offset, ylim=None, threshold=None):
+    """
+    Biểu đồ cột theo Thiết bị (index của values) có ghi giá trị trên đỉnh mỗi cột.
+    threshold: vẽ thêm đường kẻ ngang màu đỏ biểu thị quy định số ngày.
+    """
+    fig, ax = plt.subplots(figsize=(10, 6))
+    bars = ax.bar(values.index.astype(str), values.values, color=color)
+
+    if threshold is not None:
+        ax.axhline(threshold, color='red', linestyle='--', label=f'Quy định {threshold} ngày')
+
+    # Thêm giá trị lên đỉnh mỗi cột
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(
+            bar.get_x() + bar.get_width()/2.,
+            height + label_offset,
+            label_format.format(height),
+            ha='center',
+            va='bottom'
+        )
+
+    ax.set_title(title)
+    ax.set_xlabel("Thiết bị")
+    ax.set_ylabel(ylabel)
+    if ylim is not None:
+        ax.set_ylim(*ylim)
+    if threshold is not None:
+        ax.legend()
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    fig.tight_layout()
+    return fig
+
+
+def gap_figure(avg_time_gap, selected_circuit, selected_line):
+    """Mục 2: thời gian trung bình giữa các lần CIP theo Thiết bị."""
+    return bar_figure(
+        avg_time_gap,
+        f"Thời gian trung bình giữa các lần CIP theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})",
+        "Thời gian trung bình (ngày)",
+        'skyblue',
+        '{:.1f}',
+        0.1,
+        # Đặt giới hạn trục y để có không gian cho số
+        ylim=(0, avg_time_gap.max() * 1.2),
+        threshold=COMPLIANCE_THRESHOLD_DAYS,
+    )
+
+
+def compliance_figure(compliance_data, selected_circuit, selected_line):
+    """Mục 3: tỷ lệ tuân thủ quy định 5 ngày theo Thiết bị."""
+    return bar_figure(
+        compliance_data,
+        f"Tỷ lệ tuân thủ quy định {COMPLIANCE_THRESHOLD_DAYS} ngày theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})",
+        "Tỷ lệ tuân thủ (%)",
+        'lightgreen',
+        '{:.1f}%',
+        1,
+        # Giới hạn đến 105% để có không gian cho số
+        ylim=(0, 105),
+    )
+
+
+def compliance_trend_figure(trend, selected_thiet_bi, selected_circuit, selected_line):
+    """
+    Mục 3: xu hướng tỷ lệ tuân thủ quy định 5 ngày theo cửa sổ trượt (mỗi cột của trend là một cửa sổ,
+    index là mốc thời gian). Trả về None nếu không có mốc nào có khoảng cách hợp lệ.
+    """
+    if trend.empty or trend.isna().all().all():
+        return None
+    fig, ax = plt.subplots(figsize=(10, 4))
+    for label in trend.columns:
+        ax.plot(trend.index, trend[label], label=f"Cửa sổ {label}")
+    target = selected_thiet_bi if selected_thiet_bi != "Tất cả" else "mọi Thiết bị"
+    ax.set_title(
+        f"Xu hướng tỷ lệ tuân thủ quy định {COMPLIANCE_THRESHOLD_DAYS} ngày - {target} "
+        f"(Circuit: {selected_circuit}, Line: {selected_line})"
+    )
+    ax.set_xlabel("Thời điểm")
+    ax.set_ylabel("Tỷ lệ tuân thủ (%)")
+    ax.set_ylim(0, 105)
+    ax.legend()
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    return fig
+
+
+def control_chart_figure(series, center, sigma, column, selected_thiet_bi, selected_circuit, selected_line):
+    """
+    Mục 8: biểu đồ kiểm soát của một thông số cho một thiết bị (series từ spc.control_series).
+    Trên: giá trị từng lần CIP với đường trung tâm và giới hạn ±3σ, điểm cảnh báo tô đỏ.
+    Dưới: EWMA với giới hạn EWMA. Trả về None nếu không có điểm nào.
+    """
+    if series is None or series.empty:
+        return None
+    flagged = series["flags"].map(bool)
+    ewma_width = LIMIT_SIGMA * sigma * (EWMA_LAMBDA / (2 - EWMA_LAMBDA)) ** 0.5
+
+    fig, (ax_value, ax_ewma) = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
+    ax_value.plot(series["time"], series["value"], marker="o", markersize=3, linewidth=0.8)
+    ax_value.plot(series.loc[flagged, "time"], series.loc[flagged, "value"], "o", color="red", label="Cảnh báo")
+    for level, style in ((center, "-"), (center - LIMIT_SIGMA * sigma, "--"), (center + LIMIT_SIGMA * sigma, "--")):
+        ax_value.axhline(level, color="gray" if style == "-" else "red", linestyle=style, linewidth=1)
+    ax_value.set_title(
+        f"Biểu đồ kiểm soát {column} - {selected_thiet_bi} (Circuit: {selected_circuit}, Line: {selected_line})"
+    )
+    ax_value.set_ylabel(column)
+    if flagged.any():
+        ax_value.legend()
+
+    ax_ewma.plot(series["time"], series["ewma"], color="purple", linewidth=1)
+    for level, style in ((center, "-"), (center - ewma_width, "--"), (center + ewma_width, "--")):
+        ax_ewma.axhline(level, color="gray" if style == "-" else "red", linestyle=style, linewidth=1)
+    ax_ewma.set_ylabel(f"EWMA (λ={EWMA_LAMBDA:g})")
+    ax_ewma.set_xlabel("Thời gian Bắt đầu CIP")
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    return fig
+
+
+def duration_figure(avg_cip_duration, selected_circuit, selected_line):
+    """Mục 5: thời gian CIP trung bình theo Thiết bị."""
+    return bar_figure(
+        avg_cip_duration,
+        f"Thời gian CIP trung bình theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})",
+        "Thời gian trung bình (phút)",
+        'lightcoral',
+        '{:.1f}',
+        0.5,
+    )
+
+
+def temp_delta_figure(avg_temp_diff, temp_type, selected_circuit, selected_line):
+    """Mục 6: chênh lệch nhiệt độ trung bình theo Thiết bị."""
+    return bar_figure(
+        avg_temp_diff,
+        f"Chênh lệch {temp_type} trung bình theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})",
+        "Chênh lệch nhiệt độ trung bình (°C)",
+        'lightblue',
+        '{:.1f}°C',
+        0.2,
+    )
+
+
+def flow_figure(avg_flow, selected_circuit, selected_line):
+    """Mục 7: lưu lượng hồi trung bình theo Thiết bị."""
+    return bar_figure(
+        avg_flow,
+        f"Lưu lượng hồi trung bình theo Thiết bị (Circuit: {selected_circuit}, Line: {selected_line})",
+        "Lưu lượng hồi trung bình (l/h)",
+        'lightsalmon',
+        '{:.0f}',
+        100,
+    )
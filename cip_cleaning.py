@@ -0,0 +1,168 @@
+import numpy as np
+
+from cip_parsing import DURATION_COLUMNS, parse_cip_columns
+from instrumentation import profiled
+
+GROUP_COLUMNS = ["Line", "Circuit", "Thiết bị"]
+START_COLUMN = "Thời gian Bắt đầu CIP"
+END_COLUMN = "Thời gian Kết thúc CIP"
+SORT_COLUMNS = GROUP_COLUMNS + [START_COLUMN]
+# Cột phụ (tùy chọn) của dữ liệu đọc từ store: lần CIP kế tiếp của thiết bị, tính sẵn trên toàn bộ
+# lịch sử khi ghi store, để một lát dữ liệu theo khoảng ngày vẫn có khoảng cách của lần CIP cuối
+NEXT_START_COLUMN = "_next_start"
+
+# Schema gọn của DataFrame đã làm sạch (mỗi phiên dashboard giữ một bản trong bộ nhớ):
+# - Khóa thiết bị và chương trình lặp lại rất nhiều -> categorical (mã số nguyên + bảng giá trị)
+CATEGORY_COLUMNS = GROUP_COLUMNS + ["Chương trình CIP"]
+# - Nhiệt độ / độ dẫn điện có 2 chữ số thập phân -> float32 là đủ
+FLOAT32_COLUMNS = [
+    "Độ dẫn điện Xút Bắt đầu", "Độ dẫn điện Xút Kết thúc",
+    "Nhiệt độ Xút Bắt đầu", "Nhiệt độ Xút Kết thúc",
+    "Nhiệt độ Nước nóng Bắt đầu", "Nhiệt độ Nước nóng Kết thúc",
+]
+# - Lưu lượng và số phút là số nguyên -> int32 (float32 nếu có ô thiếu / sai định dạng)
+INT32_COLUMNS = [
+    "Lưu lượng hồi (l/h)",
+    "Tổng thời gian bước Xút (phút)",
+    "Tổng thời gian bước nước nóng (phút)",
+    "Tổng thời gian CIP (phút)",
+]
+
+
+def clean_rows(df):
+    """
+    Các bước làm sạch chỉ phụ thuộc vào từng dòng (chạy được trên từng phần của dữ liệu):
+    1) Tách các dòng outlier (có 0 ở Lưu lượng hồi, Tổng thời gian bước Xút, Tổng thời gian bước nước nóng).
+    2) Chuyển cột thời gian bắt đầu/ kết thúc CIP và CIP kế tiếp sang datetime.
+    3) Chuyển các cột thời gian Xút / Nước nóng sang phút (tạo thêm cột (phút)).
+    4) Tính tổng thời gian CIP từ thời gian bắt đầu đến kết thúc.
+    Trả về (df_clean, danh sách ParseReport).
+    """
+    # 1) Tách outlier
+    outlier_condition = (
+        (df['Lưu lượng hồi (l/h)'] == 0) |
+        (df['Tổng thời gian bước Xút'] == 0) |
+        (df['Tổng thời gian bước nước nóng'] == 0)
+    )
+    df_clean = df[~outlier_condition].copy()
+
+    # 2) + 3) Chuyển các cột mốc thời gian (Bắt đầu/Kết thúc CIP, CIP kế tiếp) sang datetime
+    #         và "Tổng thời gian bước Xút" & "Tổng thời gian bước nước nóng" sang số phút
+    #         (vector hóa, ô sai định dạng được đếm lại thay vì âm thầm thành 0)
+    df_clean, reports = parse_cip_columns(df_clean)
+
+    # 4) Tính tổng thời gian CIP (từ bắt đầu đến kết thúc)
+    # Đảm bảo dữ liệu datetime hợp lệ trước khi tính toán
+    valid_times = (~df_clean[START_COLUMN].isna()) & (~df_clean[END_COLUMN].isna())
+    df_clean.loc[valid_times, 'Tổng thời gian CIP (phút)'] = (
+        (df_clean.loc[valid_times, END_COLUMN] -
+         df_clean.loc[valid_times, START_COLUMN]).dt.total_seconds() / 60
+    )
+    return df_clean, reports
+
+
+def add_time_gaps(df_clean):
+    """
+    Sắp xếp theo (Line, Circuit, Thiết bị, Thời gian Bắt đầu CIP) rồi tính
+    5) khoảng cách giữa 2 lần CIP liên tiếp cho cùng một thiết bị (next_start, time_gap_days).
+    Sắp xếp nhiều cột của pandas là ổn định: các dòng trùng khóa giữ thứ tự gốc.
+    Nếu df có cột NEXT_START_COLUMN (lát dữ liệu từ store) thì dùng cột đó làm next_start và bỏ cột.
+    """
+    df_clean.sort_values(by=SORT_COLUMNS, inplace=True)
+
+    if NEXT_START_COLUMN in df_clean.columns:
+        df_clean['next_start'] = df_clean.pop(NEXT_START_COLUMN).astype(df_clean[START_COLUMN].dtype)
+    else:
+        df_clean['next_start'] = df_clean.groupby(GROUP_COLUMNS)[START_COLUMN].shift(-1)
+    df_clean['time_gap_days'] = (
+        (df_clean['next_start'] - df_clean[END_COLUMN])
+        .dt.total_seconds() / 86400
+    )
+    return df_clean
+
+
+def _to_int32(series):
+    """int32 nếu mọi giá trị là số nguyên trong phạm vi int32, nếu không thì float32 (giữ NaN)."""
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    info = np.iinfo(np.int32)
+    if np.isfinite(values).all() and (np.mod(values, 1) == 0).all() and (
+        len(values) == 0 or (values.min() >= info.min and values.max() <= info.max)
+    ):
+        return series.astype(np.int32)
+    return series.astype(np.float32)
+
+
+def compact_frame(df_clean):
+    """
+    Áp dụng schema gọn lên df đã làm sạch (sửa tại chỗ) và bỏ các cột thời lượng dạng chuỗi
+    "H:MM" (đã có cột "(phút)"). Categorical giữ categories theo thứ tự tăng dần nên
+    sắp xếp / lọc cho kết quả như chuỗi gốc. Trả về df.
+    """
+    df_clean.drop(columns=[c for c in DURATION_COLUMNS if c in df_clean.columns], inplace=True)
+    for col in CATEGORY_COLUMNS:
+        if col in df_clean.columns:
+            df_clean[col] = df_clean[col].astype("category")
+    for col in FLOAT32_COLUMNS:
+        if col in df_clean.columns:
+            df_clean[col] = df_clean[col].astype(np.float32)
+    for col in INT32_COLUMNS:
+        if col in df_clean.columns:
+            df_clean[col] = _to_int32(df_clean[col])
+    return df_clean
+
+
+def memory_report(before, after):
+    """
+    So sánh bộ nhớ (memory_usage(deep=True)) và kiểu dữ liệu của từng cột trước/sau compact_frame().
+    before/after là (Series memory_usage, Series dtypes). Trả về danh sách dict, dòng cuối là tổng.
+    """
+    (mem_before, dtypes_before), (mem_after, dtypes_after) = before, after
+    rows = []
+    for col in mem_before.index:
+        if col == "Index":
+            continue
+        rows.append({
+            "column": col,
+            "dtype_before": str(dtypes_before[col]),
+            "dtype_after": str(dtypes_after[col]) if col in dtypes_after.index else "(bỏ)",
+            "bytes_before": int(mem_before[col]),
+            "bytes_after": int(mem_after.get(col, 0)),
+        })
+    rows.append({
+        "column": "Tổng",
+        "dtype_before": "",
+        "dtype_after": "",
+        "bytes_before": int(mem_before.sum()),
+        "bytes_after": int(mem_after.sum()),
+    })
+    return rows
+
+
+def _memory_snapshot(df):
+    return df.memory_usage(deep=True), df.dtypes
+
+
+def finish_clean(df_clean, reports):
+    """
+    Bước cuối chung cho clean_data() và streaming_clean.read_clean_store(): ghi parse_reports,
+    áp dụng schema gọn và ghi báo cáo bộ nhớ trước/sau vào df.attrs["memory_report"].
+    reports là danh sách dict của các cột có ô sai định dạng.
+    """
+    before = _memory_snapshot(df_clean)
+    compact_frame(df_clean)
+    df_clean.attrs["parse_reports"] = reports
+    df_clean.attrs["memory_report"] = memory_report(before, _memory_snapshot(df_clean))
+    return df_clean
+
+
+@profiled("clean_data")
+def clean_data(df):
+    """
+    Làm sạch toàn bộ dữ liệu thô trong bộ nhớ: clean_rows(), add_time_gaps() rồi schema gọn.
+    Các ô sai định dạng được ghi vào df.attrs["parse_reports"],
+    bộ nhớ trước/sau khi áp dụng schema vào df.attrs["memory_report"].
+    Với lịch sử rất lớn, xem streaming_clean.py (đọc và làm sạch theo từng phần).
+    """
+    df_clean, reports = clean_rows(df)
+    add_time_gaps(df_clean)
+    return finish_clean(df_clean, [r.to_dict() for r in reports if r.malformed])
@@ -0,0 +1,131 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+# Các cột thời lượng dạng "H:MM" trong Google Sheet
+DURATION_COLUMNS = [
+    "Tổng thời gian bước Xút",
+    "Tổng thời gian bước nước nóng",
+]
+
+# Các cột mốc thời gian dạng "dd/mm/yy HH:MM" trong Google Sheet
+TIMESTAMP_COLUMNS = [
+    "Thời gian Bắt đầu CIP",
+    "Thời gian Kết thúc CIP",
+    "CIP kế tiếp",
+]
+
+TIMESTAMP_FORMAT = "%d/%m/%y %H:%M"
+
+# Số ô lỗi tối đa giữ lại làm ví dụ trong báo cáo
+SAMPLE_SIZE = 5
+
+
+@dataclass
+class ParseReport:
+    """Kết quả kiểm tra một cột: tổng số ô, số ô sai định dạng và vài ví dụ."""
+    column: str
+    total: int
+    malformed: int
+    sample: list = field(default_factory=list)
+
+    def to_dict(self):
+        return {
+            "column": self.column,
+            "total": self.total,
+            "malformed": self.malformed,
+            "sample": self.sample,
+        }
+
+
+def _factorize(series):
+    """
+    Mã hóa cột thành (codes, uniques) bằng bảng băm của pandas (chạy trong C).
+    Các cột thời gian lặp lại rất nhiều giá trị, nên chỉ cần phân tích các giá trị duy nhất
+    rồi ánh xạ ngược bằng chỉ số NumPy. Ô NaN có code = -1.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    uniques = pd.Series(uniques, dtype="string").str.strip()
+    return codes, uniques
+
+
+def _report(column, raw, malformed_mask):
+    malformed = int(malformed_mask.sum())
+    sample = raw[malformed_mask].head(SAMPLE_SIZE).astype(str).tolist() if malformed else []
+    return ParseReport(column=column, total=len(raw), malformed=malformed, sample=sample)
+
+
+def parse_duration_minutes(series, column=None):
+    """
+    Chuyển chuỗi "H:MM" sang số phút, vector hóa (factorize + split + phép tính NumPy, không vòng lặp Python).
+    - Ô trống / NaN -> 0 phút (không có bước này).
+    - Ô sai định dạng -> NaN và được đếm trong ParseReport. Gồm cả số phút >= 60 ("1:75") và dạng
+      "H:MM:SS": cách cũ (apply từng ô) âm thầm trả về 135 và 0 phút cho hai trường hợp này.
+    Trả về (mảng số phút dạng Series, ParseReport). Nếu không có ô lỗi, kết quả là int64.
+    """
+    column = column or series.name
+    codes, uniques = _factorize(series)
+
+    parts = uniques.str.split(":", n=1, expand=True)
+    if parts.shape[1] < 2:
+        # Không giá trị nào có dấu ":" -> mọi ô không trống đều sai định dạng
+        # (hoặc cột rỗng / toàn NaN, vd. một khối chỉ gồm dòng outlier): thêm các cột còn thiếu
+        parts = parts.reindex(columns=[0, 1])
+    hours = pd.to_numeric(parts[0], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    minutes = pd.to_numeric(parts[1], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+    blank_u = (uniques == "").to_numpy(dtype=bool, na_value=True)
+    valid_u = (
+        (hours >= 0) & (np.mod(hours, 1) == 0) &
+        (minutes >= 0) & (minutes < 60) & (np.mod(minutes, 1) == 0)
+    )
+    values_u = np.where(valid_u, hours * 60 + minutes, np.nan)
+    values_u[blank_u] = 0
+
+    # Thêm một phần tử cuối cho code = -1 (ô NaN -> 0 phút, không lỗi)
+    values = np.append(values_u, 0.0)[codes]
+    malformed = np.append(~valid_u & ~blank_u, False)[codes]
+
+    report = _report(column, series, malformed)
+    if report.malformed == 0:
+        values = values.astype(np.int64)
+    return pd.Series(values, index=series.index, name=series.name), report
+
+
+def parse_timestamps(series, column=None, fmt=TIMESTAMP_FORMAT):
+    """
+    Chuyển chuỗi thời gian theo định dạng fmt sang datetime (vector hóa).
+    Ô trống -> NaT; ô có giá trị nhưng không đọc được -> NaT và được đếm trong ParseReport.
+    """
+    column = column or series.name
+    codes, uniques = _factorize(series)
+    parsed_u = pd.to_datetime(uniques, format=fmt, errors="coerce")
+    blank_u = (uniques == "").to_numpy(dtype=bool, na_value=True)
+    malformed_u = parsed_u.isna().to_numpy(dtype=bool) & ~blank_u
+
+    parsed = pd.Series(
+        np.append(parsed_u.to_numpy(), np.datetime64("NaT"))[codes],
+        index=series.index,
+        name=series.name,
+    )
+    malformed = np.append(malformed_u, False)[codes]
+    return parsed, _report(column, series, malformed)
+
+
+def parse_cip_columns(df):
+    """
+    Phân tích mọi cột thời lượng và mốc thời gian có trong df.
+    Ghi đè các cột mốc thời gian bằng datetime, thêm cột "<tên cột> (phút)" cho cột thời lượng.
+    Trả về (df, danh sách ParseReport). df được sửa tại chỗ.
+    """
+    reports = []
+    for col in TIMESTAMP_COLUMNS:
+        if col in df.columns:
+            df[col], report = parse_timestamps(df[col], col)
+            reports.append(report)
+    for col in DURATION_COLUMNS:
+        if col in df.columns:
+            df[f"{col} (phút)"], report = parse_duration_minutes(df[col], col)
+            reports.append(report)
+    return df, reports
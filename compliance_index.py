@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from metrics import COMPLIANCE_THRESHOLD_DAYS, GAP_COLUMN
+
+# Cửa sổ trượt của biểu đồ xu hướng tuân thủ: (nhãn, số ngày)
+TREND_WINDOWS = [("7 ngày (tuần)", 7), ("30 ngày (tháng)", 30)]
+# Số điểm tối đa trên trục thời gian của biểu đồ xu hướng (bước tính theo ngày, giãn ra nếu khoảng dài)
+TREND_MAX_POINTS = 400
+
+
+class ComplianceIndex:
+    """
+    Tổng tích lũy số khoảng cách hợp lệ (> 0 ngày) và số khoảng cách tuân thủ (<= threshold_days)
+    theo thứ tự dòng của FilterIndex (mỗi thiết bị là một đoạn dòng, thời gian bắt đầu tăng dần),
+    xây một lần cho mỗi phiên bản dữ liệu. Số lần tuân thủ của một thiết bị trong khoảng ngày bất kỳ
+    = hiệu hai phần tử của tổng tích lũy tại hai ranh giới dòng (hai lần tìm kiếm nhị phân của
+    FilterIndex), không phải quét lại time_gap_days. Cùng cách tính với compute_device_metrics.
+    """
+
+    def __init__(self, df, index, threshold_days=COMPLIANCE_THRESHOLD_DAYS):
+        self.index = index
+        self.threshold_days = threshold_days
+        gaps = df[GAP_COLUMN].to_numpy(dtype=float, na_value=np.nan)
+        valid = gaps > 0
+        # Phần tử i = tổng của các dòng 0..i-1, nên các dòng a..b-1 cho cum[b] - cum[a]
+        self.cum_total = np.concatenate([[0], np.cumsum(valid, dtype=np.int64)])
+        self.cum_compliant = np.concatenate([[0], np.cumsum(valid & (gaps <= threshold_days), dtype=np.int64)])
+
+    def counts(self, lo, hi):
+        """(số lần tuân thủ, số khoảng cách hợp lệ) của các dòng lo..hi-1 (mảng ranh giới bất kỳ)."""
+        return self.cum_compliant[hi] - self.cum_compliant[lo], self.cum_total[hi] - self.cum_total[lo]
+
+    def _groups(self, line, circuit, device=None):
+        members = self.index.tree.get(line, {}).get(circuit, [])
+        return [(d, g) for d, g in members if device is None or d == device]
+
+    def rates(self, bounds, line, circuit, device=None):
+        """
+        Mục 3: tỷ lệ tuân thủ (%) theo Thiết bị của (line, circuit) trong khoảng ngày bounds
+        (kết quả của FilterIndex.window). Bỏ thiết bị không có khoảng cách hợp lệ, sắp xếp giảm dần.
+        """
+        groups = self._groups(line, circuit, device)
+        if not groups:
+            return pd.Series(dtype=float, name="compliance_rate")
+        group_ids = np.array([g for _, g in groups])
+        compliant, total = self.counts(bounds[0][group_ids], bounds[1][group_ids])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rates = np.where(total > 0, compliant / total * 100, np.nan)
+        series = pd.Series(
+            rates, index=pd.Index([d for d, _ in groups], name="Thiết bị"), name="compliance_rate"
+        )
+        return series.dropna().sort_values(ascending=False)
+
+    def rolling(self, line, circuit, device, start, end, windows=TREND_WINDOWS, max_points=TREND_MAX_POINTS):
+        """
+        Xu hướng tuân thủ theo cửa sổ trượt: tại mỗi mốc t (cuối mỗi ngày từ start đến end, giãn bước
+        nếu quá max_points mốc), tỷ lệ tuân thủ gộp mọi thiết bị được chọn trên các lần CIP bắt đầu
+        trong (t - số ngày, t]. Mỗi mốc x thiết bị chỉ tốn hai lần tìm kiếm nhị phân.
+        Trả về DataFrame index là mốc thời gian, mỗi cửa sổ một cột (%), NaN khi không có khoảng cách nào.
+        """
+        group_ids = np.array([g for _, g in self._groups(line, circuit, device)], dtype=np.int64)
+        days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D")
+        step = max(1, int(np.ceil(len(days) / max_points)))
+        # Mốc t là cuối ngày; luôn giữ ngày cuối cùng
+        points = days[::-1][::step][::-1] + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+
+        trend = pd.DataFrame(index=pd.DatetimeIndex(points, name="Thời điểm"))
+        if not len(group_ids):
+            return trend
+        hi = self.index.search(group_ids[:, None], points, side="right")
+        for label, window_days in windows:
+            lo = self.index.search(group_ids[:, None], points - pd.Timedelta(days=window_days), side="right")
+            compliant, total = self.counts(lo, hi)
+            compliant, total = compliant.sum(axis=0), total.sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                trend[label] = np.where(total > 0, compliant / total * 100, np.nan)
+        return trend
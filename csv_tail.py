@@ -0,0 +1,71 @@
+import hashlib
+import io
+import os
+
+import pandas as pd
+
+# Số byte cuối của phần đã đọc, dùng để kiểm tra file chỉ được ghi thêm (không bị ghi lại)
+TAIL_CHECK_BYTES = 256
+
+
+class CsvTail:
+    """
+    Theo dõi một file CSV chỉ-ghi-thêm (data.csv do fetch_sheet_data.py ghi): nhớ vị trí đã đọc
+    và mã băm đoạn cuối của phần đó. poll() trả về
+    - ("unchanged", None): file không đổi (chỉ tốn một os.stat),
+    - ("appended", các dòng mới): chỉ đọc phần sau vị trí đã đọc,
+    - ("rewritten", toàn bộ file): lần đầu, hoặc file ngắn đi / đoạn cuối đã đọc không còn như cũ.
+    Chỉ nhận các dòng đã ghi trọn (kết thúc bằng xuống dòng). state() là dict JSON được,
+    truyền lại vào CsvTail(path, state) để tiếp tục sau khi khởi động lại.
+    """
+
+    def __init__(self, path, state=None):
+        self.path = path
+        state = state or {}
+        self.offset = state.get("offset", 0)
+        self.tail_size = state.get("tail_size", 0)
+        self.tail_sha1 = state.get("tail_sha1")
+        self.header = state.get("header")
+        self.mtime_ns = state.get("mtime_ns")
+
+    def state(self):
+        return {
+            "offset": self.offset,
+            "tail_size": self.tail_size,
+            "tail_sha1": self.tail_sha1,
+            "header": self.header,
+            "mtime_ns": self.mtime_ns,
+        }
+
+    def _remember(self, data, offset):
+        tail = data[max(0, len(data) - TAIL_CHECK_BYTES):]
+        self.offset = offset
+        self.tail_size = len(tail)
+        self.tail_sha1 = hashlib.sha1(tail).hexdigest()
+
+    def poll(self):
+        stat = os.stat(self.path)
+        if self.header is not None and stat.st_mtime_ns == self.mtime_ns:
+            return "unchanged", None
+        with open(self.path, "rb") as f:
+            appended = False
+            if self.header is not None and stat.st_size >= self.offset >= self.tail_size:
+                f.seek(self.offset - self.tail_size)
+                tail = f.read(self.tail_size)
+                appended = hashlib.sha1(tail).hexdigest() == self.tail_sha1
+            if appended:
+                data = f.read()
+                data = data[:data.rfind(b"\n") + 1]
+                self.mtime_ns = stat.st_mtime_ns
+                if not data:
+                    return "unchanged", None
+                self._remember(tail + data, self.offset + len(data))
+                return "appended", pd.read_csv(io.BytesIO(data), header=None, names=self.header)
+            f.seek(0)
+            data = f.read()
+        data = data[:data.rfind(b"\n") + 1]
+        frame = pd.read_csv(io.BytesIO(data))
+        self.header = frame.columns.tolist()
+        self._remember(data, len(data))
+        self.mtime_ns = stat.st_mtime_ns
+        return "rewritten", frame
@@ -0,0 +1,88 @@
+import hashlib
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    # pyarrow là tùy chọn: thiếu thì không có cache trên đĩa
+    pa = None
+
+# Thư mục lưu bản sao dữ liệu đã làm sạch (dạng cột nhị phân - Parquet)
+CACHE_DIR = ".cache"
+
+# Tăng số này mỗi khi logic clean_data() thay đổi để vô hiệu hóa cache cũ trên đĩa
+CACHE_FORMAT_VERSION = 3
+
+# Lỗi khi đọc/ghi cache Parquet: thiếu pyarrow, lỗi file, hoặc lỗi chuyển kiểu của Arrow
+# (vd. ArrowTypeError với cột object lẫn số và chuỗi) -> bỏ qua cache thay vì làm hỏng dashboard
+CACHE_ERRORS = (ImportError, OSError, ValueError) + ((pa.ArrowException,) if pa is not None else ())
+
+# (đường dẫn) -> (mtime_ns, size, hash) để không phải băm lại file khi file chưa đổi
+_fingerprints = {}
+
+
+def file_fingerprint(path):
+    """
+    Trả về mã băm nội dung (sha256, rút gọn) của file.
+    Chỉ băm lại khi mtime hoặc kích thước file thay đổi, nên gọi mỗi lần rerun vẫn rất rẻ.
+    """
+    stat = os.stat(path)
+    cached = _fingerprints.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    fingerprint = digest.hexdigest()[:16]
+    _fingerprints[path] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+    return fingerprint
+
+
+def cache_path(fingerprint, name="clean"):
+    """Đường dẫn file cache Parquet ứng với một phiên bản dữ liệu."""
+    return os.path.join(CACHE_DIR, f"{name}_v{CACHE_FORMAT_VERSION}_{fingerprint}.parquet")
+
+
+def read_cached_frame(fingerprint, name="clean"):
+    """Đọc DataFrame đã làm sạch từ cache trên đĩa. Trả về None nếu chưa có hoặc không đọc được."""
+    path = cache_path(fingerprint, name)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except CACHE_ERRORS:
+        # Thiếu pyarrow hoặc file hỏng -> coi như chưa có cache
+        return None
+
+
+def write_cached_frame(fingerprint, df, name="clean"):
+    """
+    Ghi DataFrame đã làm sạch ra cache trên đĩa.
+    Ghi qua file tạm rồi đổi tên để tiến trình khác không bao giờ đọc phải file ghi dở,
+    sau đó xóa các bản cache cũ của cùng loại dữ liệu.
+    """
+    path = cache_path(fingerprint, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except CACHE_ERRORS:
+        # Không ghi được cache thì bỏ qua, dashboard vẫn chạy bình thường
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    prefix = f"{name}_v"
+    for entry in os.listdir(CACHE_DIR):
+        full_path = os.path.join(CACHE_DIR, entry)
+        if entry.startswith(prefix) and entry.endswith(".parquet") and full_path != path:
+            try:
+                os.remove(full_path)
+            except OSError:
+                pass
+    return path
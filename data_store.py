@@ -0,0 +1,209 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import pandas as pd
+
+from cip_cleaning import NEXT_START_COLUMN, add_time_gaps, clean_rows
+from cip_parsing import parse_timestamps
+from instrumentation import profiled
+
+DATA_PATH = "data.csv"
+# Thư mục chứa dữ liệu dạng cột (Parquet) phân vùng theo Line và tháng
+DATA_STORE_PATH = "data_store"
+MANIFEST_NAME = "_manifest.json"
+
+START_COLUMN = "Thời gian Bắt đầu CIP"
+PARTITION_COLUMNS = ["Line", "month"]
+# Cột phụ (datetime) dùng để lọc từng dòng theo khoảng thời gian, không trả về cho người gọi
+START_KEY = "_start"
+
+
+def _month_bounds(start, end):
+    """Chuỗi "YYYY-MM" của tháng đầu/cuối trong khoảng [start, end] (None = không giới hạn)."""
+    first = pd.Timestamp(start).strftime("%Y-%m") if start is not None else None
+    last = pd.Timestamp(end).strftime("%Y-%m") if end is not None else None
+    return first, last
+
+
+def _partitioning():
+    """
+    Kiểu của các cột phân vùng Hive, khai báo tường minh: nếu để pyarrow tự suy luận, Line toàn số
+    (vd. Line=1) sẽ thành int và bộ lọc Line theo chuỗi không khớp.
+    """
+    # Import muộn: chỉ cần pyarrow khi thực sự đọc store
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema = pa.schema([(col, pa.string()) for col in PARTITION_COLUMNS])
+    return ds.partitioning(schema, flavor="hive")
+
+
+def frame_version(df):
+    """Mã băm nội dung của DataFrame thô, dùng làm phiên bản dữ liệu của store."""
+    hashed = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    digest = hashlib.sha256(hashed.tobytes())
+    digest.update(json.dumps(list(df.columns), ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _swap_root(root, target):
+    """
+    Trỏ root (symlink tương đối) sang thư mục target bằng một os.replace nguyên tử: không có lúc nào
+    root không tồn tại. Giữ lại phiên bản liền trước cho người đọc đang dở, xóa các phiên bản cũ hơn.
+    """
+    previous = os.path.realpath(root) if os.path.islink(root) else None
+    if os.path.isdir(root) and not os.path.islink(root):
+        # Store cũ là thư mục thật (trước khi dùng symlink): đổi tên thành một phiên bản, chỉ một lần
+        previous = f"{root}.{uuid.uuid4().hex[:12]}"
+        os.rename(root, previous)
+    tmp_link = f"{root}.link"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.basename(target), tmp_link)
+    os.replace(tmp_link, root)
+
+    keep = {os.path.realpath(target), previous}
+    for path in glob.glob(f"{glob.escape(root)}.*"):
+        if os.path.isdir(path) and not os.path.islink(path) and os.path.realpath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _line_days(df_raw):
+    """
+    Lần CIP kế tiếp của mỗi dòng (NaT với dòng outlier) và các ngày có lần CIP theo từng Line,
+    theo đúng cách làm sạch của dashboard (clean_rows + add_time_gaps) trên toàn bộ lịch sử.
+    """
+    cleaned, _ = clean_rows(df_raw)
+    add_time_gaps(cleaned)
+    next_start = cleaned["next_start"].reindex(df_raw.index)
+    cleaned = cleaned[cleaned[START_COLUMN].notna()]
+    days = cleaned[START_COLUMN].dt.strftime("%Y-%m-%d").groupby(cleaned["Line"].astype(str))
+    return next_start, {line: sorted(set(values)) for line, values in days}
+
+
+def write_dataset(df_raw, root=DATA_STORE_PATH):
+    """
+    Ghi dữ liệu thô thành dataset Parquet phân vùng theo Line/tháng (Hive: Line=.../month=.../).
+    Mỗi lần ghi tạo một thư mục phiên bản mới (<root>.<mã>) rồi trỏ root sang nó (_swap_root),
+    để người đọc không bao giờ thấy dữ liệu ghi dở hay thiếu store.
+    Mỗi dòng có thêm cột NEXT_START_COLUMN (lần CIP kế tiếp của thiết bị trên toàn bộ lịch sử),
+    nên một lát theo khoảng ngày vẫn tính được khoảng cách của lần CIP cuối như khi đọc cả data.csv.
+    Trả về manifest (số dòng, khoảng thời gian, danh sách Line và các ngày có CIP của từng Line,
+    phiên bản dữ liệu).
+    """
+    df = df_raw.copy()
+    starts, _ = parse_timestamps(df[START_COLUMN], START_COLUMN)
+    df[START_KEY] = starts
+    df["month"] = starts.dt.strftime("%Y-%m")
+    df[NEXT_START_COLUMN], line_days = _line_days(df_raw)
+
+    target = f"{root}.{uuid.uuid4().hex[:12]}"
+    df.to_parquet(target, partition_cols=PARTITION_COLUMNS, index=False)
+
+    manifest = {
+        "version": frame_version(df_raw),
+        "columns": list(df_raw.columns),
+        "rows": len(df),
+        "min_start": starts.min().isoformat() if starts.notna().any() else None,
+        "max_start": starts.max().isoformat() if starts.notna().any() else None,
+        "lines": sorted(df["Line"].dropna().astype(str).unique().tolist()),
+        "line_days": line_days,
+        # Cột phụ có trong các file Parquet ngoài các cột gốc
+        "extra_columns": [NEXT_START_COLUMN],
+    }
+    with open(os.path.join(target, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    _swap_root(root, target)
+    return manifest
+
+
+def lines_in_window(manifest, start_date, end_date):
+    """
+    Các Line có lần CIP (đã làm sạch) trong [start_date, end_date] theo manifest, giống danh sách Line
+    của chế độ data.csv, mà không phải đọc dữ liệu. Store cũ chưa có line_days: mọi Line.
+    """
+    line_days = manifest.get("line_days")
+    if line_days is None:
+        return manifest["lines"]
+    first, last = pd.Timestamp(start_date).strftime("%Y-%m-%d"), pd.Timestamp(end_date).strftime("%Y-%m-%d")
+    return [line for line in manifest["lines"] if any(first <= day <= last for day in line_days.get(line, []))]
+
+
+def read_manifest(root=DATA_STORE_PATH):
+    with open(os.path.join(root, MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_dataset(root=DATA_STORE_PATH, start=None, end=None, lines=None, columns=None, with_next_start=False):
+    """
+    Đọc dataset với điều kiện đẩy xuống (predicate pushdown):
+    - Lọc phân vùng theo Line và tháng -> bỏ qua hẳn các file không liên quan.
+    - Lọc từng dòng theo Thời gian Bắt đầu CIP trong [start, end].
+    - Chỉ đọc các cột trong columns (mặc định: mọi cột gốc).
+    Trả về DataFrame có cùng cột và kiểu như pd.read_csv("data.csv"); with_next_start=True thêm cột
+    NEXT_START_COLUMN (nếu store có) để clean_data tính khoảng cách như trên toàn bộ lịch sử.
+    root được phân giải một lần (symlink -> thư mục phiên bản), nên manifest và dữ liệu cùng một phiên bản.
+    """
+    root = os.path.realpath(root)
+    manifest = read_manifest(root)
+    columns = list(columns) if columns is not None else manifest["columns"]
+    if with_next_start and NEXT_START_COLUMN in manifest.get("extra_columns", []):
+        columns = columns + [NEXT_START_COLUMN]
+
+    filters = []
+    first_month, last_month = _month_bounds(start, end)
+    if first_month is not None:
+        filters.append(("month", ">=", first_month))
+        filters.append((START_KEY, ">=", pd.Timestamp(start)))
+    if last_month is not None:
+        filters.append(("month", "<=", last_month))
+        filters.append((START_KEY, "<=", pd.Timestamp(end)))
+    if lines is not None:
+        filters.append(("Line", "in", [str(line) for line in lines]))
+
+    df = pd.read_parquet(root, columns=columns, filters=filters or None, partitioning=_partitioning())
+    if "Line" in df.columns:
+        # Cột phân vùng được đọc lại dưới dạng categorical -> trả về chuỗi như CSV
+        df["Line"] = df["Line"].astype(str)
+    return df[columns].reset_index(drop=True)
+
+
+def filter_frame(df, start=None, end=None, lines=None, columns=None):
+    """Áp dụng cùng điều kiện như read_dataset() lên DataFrame thô đã đọc từ CSV."""
+    mask = pd.Series(True, index=df.index)
+    if start is not None or end is not None:
+        starts, _ = parse_timestamps(df[START_COLUMN], START_COLUMN)
+        if start is not None:
+            mask &= starts >= pd.Timestamp(start)
+        if end is not None:
+            mask &= starts <= pd.Timestamp(end)
+    if lines is not None:
+        mask &= df["Line"].astype(str).isin([str(line) for line in lines])
+    df = df[mask]
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+
+@profiled("load_data")
+def load_data(path=DATA_PATH, start=None, end=None, lines=None, columns=None, with_next_start=False):
+    """
+    Đọc dữ liệu gốc mà không đổi tên cột.
+    - path là file CSV: đọc toàn bộ rồi lọc (nếu có điều kiện).
+    - path là thư mục store Parquet: chỉ đọc các phân vùng Line/tháng và cột cần thiết
+      (with_next_start: kèm lần CIP kế tiếp tính sẵn của mỗi dòng, xem write_dataset).
+    start/end lọc theo Thời gian Bắt đầu CIP, lines lọc theo Line.
+    """
+    if os.path.isdir(path):
+        return read_dataset(
+            path, start=start, end=end, lines=lines, columns=columns, with_next_start=with_next_start
+        )
+    df = pd.read_csv(path)
+    if start is not None or end is not None or lines is not None or columns is not None:
+        df = filter_frame(df, start=start, end=end, lines=lines, columns=columns)
+    return df
@@ -0,0 +1,175 @@
+import threading
+from bisect import bisect_right, insort
+
+import numpy as np
+import pandas as pd
+
+from cip_cleaning import GROUP_COLUMNS, START_COLUMN
+from cip_parsing import parse_timestamps
+from csv_tail import CsvTail
+
+DATA_PATH = "data.csv"
+DUE_COLUMN = "CIP kế tiếp"
+# Mặc định cảnh báo các thiết bị đến hạn CIP trong bao nhiêu giờ tới
+DEFAULT_WITHIN_HOURS = 24
+# Mốc thời gian trong sheet là giờ nhà máy (không kèm múi giờ); máy chủ dashboard có thể chạy UTC
+PLANT_TIMEZONE = "Asia/Ho_Chi_Minh"
+
+
+def _ns(timestamp):
+    return pd.Timestamp(timestamp).as_unit("ns").value
+
+
+def plant_now():
+    """Thời điểm hiện tại theo giờ nhà máy (PLANT_TIMEZONE), không kèm múi giờ như các mốc trong sheet."""
+    return pd.Timestamp.now(tz=PLANT_TIMEZONE).tz_localize(None)
+
+
+def schedule_rows(df):
+    """
+    Các cột cần cho lịch CIP kế tiếp từ dữ liệu thô (pd.read_csv): khóa thiết bị, Thời gian Bắt đầu CIP
+    và CIP kế tiếp đã chuyển sang datetime; các cột khác không được phân tích.
+    Không bỏ dòng outlier như clean_rows: lần CIP có 0 ở lưu lượng / thời gian bước vẫn là lần CIP
+    đã chạy và đặt lại hạn, bỏ nó đi sẽ báo quá hạn sai theo hạn của lần trước đó.
+    """
+    rows = df[GROUP_COLUMNS].copy()
+    for col in (START_COLUMN, DUE_COLUMN):
+        rows[col], _ = parse_timestamps(df[col], col)
+    return rows
+
+
+class DueIndex:
+    """
+    Lịch CIP kế tiếp của lần CIP mới nhất theo (Line, Circuit, Thiết bị): danh sách
+    (hạn CIP kế tiếp, mã thiết bị) luôn sắp xếp tăng dần, nên "quá hạn / đến hạn trong N giờ
+    tính tại thời điểm T" chỉ cần một lần tìm kiếm nhị phân rồi lấy phần đầu danh sách.
+    Dòng mới (update) chỉ thay mục của thiết bị tương ứng, không quét lại lịch sử.
+    Thiết bị mà lần CIP mới nhất không có CIP kế tiếp thì không nằm trong lịch.
+    """
+
+    def __init__(self):
+        self._keys = []        # mã thiết bị -> (Line, Circuit, Thiết bị)
+        self._ids = {}         # (Line, Circuit, Thiết bị) -> mã thiết bị
+        self._latest = {}      # mã thiết bị -> (bắt đầu CIP mới nhất, hạn CIP kế tiếp), ns
+        self._schedule = []    # [(hạn CIP kế tiếp ns, mã thiết bị)] tăng dần
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._schedule)
+
+    @classmethod
+    def from_frame(cls, rows):
+        """
+        Xây từ các dòng của schedule_rows (thứ tự bất kỳ). Sắp xếp ổn định theo thời gian bắt đầu,
+        nên khi trùng thời gian bắt đầu thì dòng ghi sau thắng, giống update().
+        """
+        index = cls()
+        rows = rows[rows[START_COLUMN].notna()].sort_values(START_COLUMN, kind="stable")
+        latest = rows.drop_duplicates(GROUP_COLUMNS, keep="last")
+        starts = latest[START_COLUMN].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        due = latest[DUE_COLUMN].to_numpy(dtype="datetime64[ns]")
+        has_due = ~np.isnat(due)
+        due = due.astype(np.int64)
+        keys = zip(*(latest[col].tolist() for col in GROUP_COLUMNS))
+        for key_id, (key, start_ns, due_ns, scheduled) in enumerate(zip(keys, starts.tolist(), due.tolist(), has_due)):
+            index._keys.append(key)
+            index._ids[key] = key_id
+            index._latest[key_id] = (start_ns, due_ns if scheduled else None)
+            if scheduled:
+                index._schedule.append((due_ns, key_id))
+        index._schedule.sort()
+        return index
+
+    def update(self, rows):
+        """
+        Cập nhật từ các dòng mới (đã qua schedule_rows, thứ tự bất kỳ): mỗi dòng mới hơn lần CIP
+        mới nhất của thiết bị thì thay hạn CIP kế tiếp của thiết bị đó. O(log n) mỗi dòng
+        (cộng chi phí dời phần tử của list, rất nhỏ với vài nghìn thiết bị). Trả về số thiết bị đã đổi.
+        """
+        rows = rows[rows[START_COLUMN].notna()]
+        starts = rows[START_COLUMN].to_numpy(dtype="datetime64[ns]").astype(np.int64).tolist()
+        due = rows[DUE_COLUMN].to_numpy(dtype="datetime64[ns]")
+        has_due = (~np.isnat(due)).tolist()
+        keys = zip(*(rows[col].tolist() for col in GROUP_COLUMNS))
+        changed = 0
+        with self._lock:
+            for key, start_ns, due_ns, scheduled in zip(keys, starts, due.astype(np.int64).tolist(), has_due):
+                key_id = self._ids.get(key)
+                if key_id is None:
+                    key_id = len(self._keys)
+                    self._keys.append(key)
+                    self._ids[key] = key_id
+                else:
+                    previous = self._latest[key_id]
+                    # Cùng thời gian bắt đầu: dòng ghi sau thắng (giống sắp xếp ổn định của clean_data)
+                    if start_ns < previous[0]:
+                        continue
+                    if previous[1] is not None:
+                        del self._schedule[bisect_right(self._schedule, (previous[1], key_id)) - 1]
+                new_due = due_ns if scheduled else None
+                self._latest[key_id] = (start_ns, new_due)
+                if new_due is not None:
+                    insort(self._schedule, (new_due, key_id))
+                changed += 1
+        return changed
+
+    def due(self, as_of, within_hours=DEFAULT_WITHIN_HOURS):
+        """
+        Các thiết bị có hạn CIP kế tiếp trước as_of + within_hours, sắp xếp theo hạn tăng dần.
+        DataFrame: Line, Circuit, Thiết bị, Lần CIP gần nhất, CIP kế tiếp, Quá hạn (giờ)
+        (âm = còn bao nhiêu giờ nữa đến hạn).
+        """
+        as_of_ns = _ns(as_of)
+        horizon = as_of_ns + int(within_hours * 3600 * 10**9)
+        with self._lock:
+            entries = self._schedule[:bisect_right(self._schedule, (horizon, len(self._keys)))]
+            records = [(*self._keys[key_id], self._latest[key_id][0], due_ns) for due_ns, key_id in entries]
+        table = pd.DataFrame(records, columns=GROUP_COLUMNS + ["Lần CIP gần nhất", DUE_COLUMN])
+        for col in ("Lần CIP gần nhất", DUE_COLUMN):
+            table[col] = pd.to_datetime(table[col].astype("int64"), unit="ns")
+        table["Quá hạn (giờ)"] = ((as_of_ns - table[DUE_COLUMN].astype("int64")) / 3.6e12).round(1)
+        return table
+
+    def overdue_count(self, as_of):
+        """Số thiết bị đã quá hạn CIP kế tiếp tại as_of (một lần tìm kiếm nhị phân)."""
+        with self._lock:
+            return bisect_right(self._schedule, (_ns(as_of) - 1, len(self._keys)))
+
+
+class DueTracker:
+    """
+    Giữ DueIndex khớp với data.csv cho cả tiến trình. fetch_sheet_data.py thường chỉ ghi thêm dòng
+    vào cuối file, nên mỗi lần refresh chỉ đọc phần mới (csv_tail.CsvTail), lấy các mốc thời gian
+    (schedule_rows) rồi update. Nếu file bị ghi lại thì xây lại toàn bộ.
+    Lịch dùng mọi dòng thô kể cả outlier (xem schedule_rows), khác với dữ liệu làm sạch của dashboard.
+    """
+
+    def __init__(self, path=DATA_PATH):
+        self.path = path
+        self.index = None
+        self._tail = CsvTail(path)
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.appended_rows = 0
+
+    def refresh(self):
+        """Đọc phần mới của data.csv (nếu có). Chỉ tốn một os.stat khi file không đổi."""
+        with self._lock:
+            kind, frame = self._tail.poll()
+            if kind == "rewritten":
+                self.index = DueIndex.from_frame(schedule_rows(frame))
+                self.rebuilds += 1
+            elif kind == "appended":
+                rows = schedule_rows(frame)
+                self.index.update(rows)
+                self.appended_rows += len(rows)
+            return self.index
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "offset": self._tail.offset,
+            "scheduled": len(self.index) if self.index is not None else 0,
+            "rebuilds": self.rebuilds,
+            "appended_rows": self.appended_rows,
+        }
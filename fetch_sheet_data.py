@@ -1,11 +1,97 @@
+import argparse
+import hashlib
+import json
 import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
 import gspread
 import pandas as pd
+import requests
 from google.oauth2.credentials import Credentials
+from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
+from gspread.utils import numericise_all, rowcol_to_a1
+
+# Phạm vi truy cập: quyền đọc Google Sheets, và quyền đọc metadata Drive để lấy thời điểm sửa cuối
+# của spreadsheet (revision_signal). REFRESH_TOKEN cấp trước đây chỉ có quyền Sheets: cần tạo lại
+# token với cả hai phạm vi và cập nhật secret REFRESH_TOKEN; cho đến lúc đó script vẫn chạy được
+# với SHEETS_SCOPES nhưng luôn phải kiểm tra checksum theo khối thay vì dừng sớm khi sheet không đổi.
+SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+SCOPES = SHEETS_SCOPES + ["https://www.googleapis.com/auth/drive.metadata.readonly"]
+
+DATA_PATH = "data.csv"
+# Trạng thái lần tải gần nhất (số dòng đã lấy, checksum từng khối) - được commit cùng data.csv
+STATE_PATH = "fetch_state.json"
+# Số dòng trong một khối khi tính checksum để phát hiện dòng cũ bị sửa
+BLOCK_SIZE = 200
+# Khối cũ được kiểm tra lại đổi sau mỗi khoảng này (theo đồng hồ, không lưu trong trạng thái
+# để fetch_state.json không đổi khi sheet không đổi)
+AUDIT_ROTATE_SECONDS = 60
+
+# Mã thoát khi sheet không có gì thay đổi (workflow dùng để bỏ qua bước commit)
+EXIT_UNCHANGED = 3
+
+# Danh sách sheet cần tải (JSON), ví dụ:
+# [{"spreadsheet_id": "...", "worksheet": 0, "source": "MMB"}, {"spreadsheet_id": "...", "worksheet": "Line 2"}]
+TARGETS_ENV = "SHEET_TARGETS"
+# Cột ghi nguồn (spreadsheet/worksheet) của từng dòng khi gộp nhiều sheet
+SOURCE_COLUMN = "Nguồn"
+# Các cột bắt buộc của mỗi sheet CIP
+REQUIRED_COLUMNS = [
+    "Thiết bị", "Line", "Circuit", "Chương trình CIP", "Lưu lượng hồi (l/h)",
+    "Tổng thời gian bước Xút", "Độ dẫn điện Xút Bắt đầu", "Độ dẫn điện Xút Kết thúc",
+    "Nhiệt độ Xút Bắt đầu", "Nhiệt độ Xút Kết thúc", "Tổng thời gian bước nước nóng",
+    "Nhiệt độ Nước nóng Bắt đầu", "Nhiệt độ Nước nóng Kết thúc",
+    "Thời gian Bắt đầu CIP", "Thời gian Kết thúc CIP", "CIP kế tiếp",
+]
+
+# Số luồng tải đồng thời tối đa (giới hạn để không vượt quota đọc của Sheets API)
+MAX_WORKERS = 4
+# Thử lại khi gặp lỗi quota / lỗi tạm thời: 1s, 2s, 4s, ... tối đa 32s, có jitter
+MAX_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 32.0
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class FetchStats:
+    """Thống kê một lần tải dữ liệu từ Google Sheet."""
+    mode: str
+    rows_fetched: int
+    bytes_transferred: int
+    elapsed_seconds: float
+    # False nếu data.csv không thay đổi sau lần tải này
+    changed: bool = True
+
+    def summary(self):
+        return (
+            f"[{self.mode}] {self.rows_fetched} dòng, "
+            f"~{self.bytes_transferred} bytes, {self.elapsed_seconds:.2f}s"
+            + ("" if self.changed else " (không đổi)")
+        )
+
+
+class SchemaError(ValueError):
+    """Header của sheet không khớp các cột bắt buộc (thiếu, đổi tên hoặc đổi thứ tự)."""
+
+
+@dataclass(frozen=True)
+class SheetTarget:
+    """Một worksheet cần tải: worksheet là số thứ tự (0 = sheet đầu tiên) hoặc tên tab."""
+    spreadsheet_id: str
+    worksheet: object = 0
+    source: str = None
+
+    @property
+    def label(self):
+        return self.source or f"{self.spreadsheet_id}/{self.worksheet}"
 
-# Phạm vi truy cập, chỉ cần quyền đọc Google Sheets
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
 
 def get_credentials_from_env():
     """
@@ -16,33 +102,41 @@ def get_credentials_from_env():
     client_secret = os.environ["CLIENT_SECRET"]  # Tương ứng secrets.CLIENT_SECRET
     refresh_token = os.environ["REFRESH_TOKEN"]  # Tương ứng secrets.REFRESH_TOKEN
 
-    token_data = {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "refresh_token": refresh_token,
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "scopes": SCOPES,
-        "token": ""  # Access token để trống, sẽ được refresh
-    }
+    def credentials(scopes):
+        token_data = {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "refresh_token": refresh_token,
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "scopes": scopes,
+            "token": ""  # Access token để trống, sẽ được refresh
+        }
+        creds = Credentials.from_authorized_user_info(token_data, scopes)
+        # Nếu token đã hết hạn, tự refresh
+        if not creds.valid:
+            creds.refresh(Request())
+        return creds
 
-    creds = Credentials.from_authorized_user_info(token_data, SCOPES)
-    # Nếu token đã hết hạn, tự refresh
-    if not creds.valid:
-        creds.refresh(Request())
+    try:
+        return credentials(SCOPES)
+    except RefreshError:
+        # Refresh token cũ chưa được cấp quyền Drive -> chỉ dùng quyền Sheets (xem ghi chú ở SCOPES)
+        print("Cảnh báo: REFRESH_TOKEN chưa có quyền drive.metadata.readonly, "
+              "không dùng được tín hiệu phiên bản của sheet", file=sys.stderr)
+        return credentials(SHEETS_SCOPES)
 
-    return creds
+def get_client():
+    """Client gspread đã xác thực, dùng chung cho mọi sheet cần tải."""
+    return gspread.authorize(get_credentials_from_env())
 
-def fetch_data_from_sheet():
+def open_worksheet():
     """
     Hàm này:
     1. Lấy credentials
     2. Kết nối Google Sheet qua gspread
-    3. Mở Sheet theo SHEET_ID
-    4. Đọc dữ liệu, chuyển thành DataFrame
-    5. Trả về DataFrame
+    3. Mở Sheet theo SHEET_ID và trả về worksheet đầu tiên
     """
-    creds = get_credentials_from_env()
-    client = gspread.authorize(creds)
+    client = get_client()
 
     # Lấy sheet_id từ biến môi trường (đã lưu trong GitHub Secrets)
     sheet_id = os.environ["SHEET_ID"]
@@ -50,20 +144,456 @@ def fetch_data_from_sheet():
 
     # Mở Google Sheet
     workbook = client.open_by_url(sheet_url)
-    worksheet = workbook.get_worksheet(0)  # Lấy sheet đầu tiên (gid=0)
+    return workbook.get_worksheet(0)  # Lấy sheet đầu tiên (gid=0)
+
+def fetch_data_from_sheet(worksheet=None):
+    """
+    Đọc toàn bộ worksheet (mặc định là sheet đầu tiên của SHEET_ID) và trả về DataFrame.
+    """
+    if worksheet is None:
+        worksheet = open_worksheet()
 
     # Đọc toàn bộ dữ liệu thành list of dict
     data = worksheet.get_all_records()
     df = pd.DataFrame(data)
     return df
 
+def rows_to_frame(header, rows):
+    """
+    Chuyển các dòng giá trị thô (chuỗi) thành DataFrame giống kết quả của get_all_records():
+    thêm ô trống cho dòng bị cắt cuối và chuyển chuỗi số sang số.
+    """
+    width = len(header)
+    records = [numericise_all(list(row[:width]) + [""] * (width - len(row))) for row in rows]
+    return pd.DataFrame(records, columns=header)
+
+def block_checksums(rows, block_size=None):
+    """Checksum sha1 của từng khối block_size dòng (khối cuối có thể chưa đủ)."""
+    block_size = block_size or BLOCK_SIZE
+    checksums = []
+    for start in range(0, len(rows), block_size):
+        block = [[str(cell) for cell in row] for row in rows[start:start + block_size]]
+        payload = json.dumps(block, ensure_ascii=False).encode("utf-8")
+        checksums.append(hashlib.sha1(payload).hexdigest())
+    return checksums
+
+def payload_size(values):
+    """Ước lượng số byte dữ liệu nhận về (kích thước JSON của các giá trị)."""
+    return len(json.dumps(values, ensure_ascii=False).encode("utf-8"))
+
+def file_sha256(path):
+    """Mã băm sha256 nội dung file, None nếu file không tồn tại."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_csv_atomic(df, data_path=DATA_PATH, append=False):
+    """
+    Ghi df ra data_path qua file tạm rồi đổi tên, nên người đọc (dashboard) không bao giờ thấy
+    file ghi dở. Nếu nội dung mới giống hệt file hiện có thì giữ nguyên file cũ (không đổi mtime).
+    append=True: nối df vào cuối file tại chỗ (xem append_csv). Trả về True nếu file đã thay đổi.
+    """
+    if append:
+        return append_csv(df, data_path)
+    tmp_path = f"{data_path}.tmp"
+    try:
+        df.to_csv(tmp_path, index=False)
+        if file_sha256(tmp_path) == file_sha256(data_path):
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, data_path)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def append_csv(df, data_path=DATA_PATH):
+    """
+    Nối các dòng của df vào cuối data_path tại chỗ, không sao chép file cũ (data.csv chỉ lớn dần).
+    Toàn bộ dòng mới được ghi trong một lần rồi fsync; nếu lỗi thì cắt file về kích thước cũ.
+    Người đọc tăng dần (CsvTail) chỉ lấy các dòng đã kết thúc bằng xuống dòng nên không thấy dòng ghi dở.
+    """
+    if df.empty:
+        return False
+    payload = df.to_csv(header=False, index=False).encode("utf-8")
+    with open(data_path, "ab") as f:
+        size = f.tell()
+        try:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(size)
+            raise
+    return True
+
+def load_state(state_path=STATE_PATH):
+    """Trạng thái lần tải trước; None nếu chưa có hoặc file hỏng (khi đó sync tải lại toàn bộ)."""
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if isinstance(state, dict) else None
+
+def save_state(state, state_path=STATE_PATH):
+    """Ghi trạng thái (qua file tạm), bỏ qua nếu không có gì thay đổi để git không thấy khác biệt."""
+    if load_state(state_path) == state:
+        return
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, state_path)
+
+def revision_signal(worksheet):
+    """
+    Tín hiệu phiên bản rẻ của sheet: thời điểm sửa cuối (modifiedTime) của spreadsheet qua Drive API,
+    chỉ là một lời gọi metadata, không tải dữ liệu. Cần token có quyền drive.metadata.readonly;
+    nếu không lấy được thì trả về None và sync() dùng checksum theo khối như bình thường.
+    """
+    spreadsheet = getattr(worksheet, "spreadsheet", None)
+    if spreadsheet is None:
+        return None
+    try:
+        return with_backoff(spreadsheet.get_lastUpdateTime)
+    except (gspread.exceptions.APIError, AttributeError, KeyError):
+        return None
+
+def is_unchanged(state, revision, data_path=DATA_PATH, key="revision"):
+    """True nếu sheet có cùng tín hiệu phiên bản (state[key]) với lần tải trước và data.csv vẫn là file đã ghi lúc đó."""
+    return (
+        revision is not None
+        and state is not None
+        and state.get(key) == revision
+        and state.get("data_sha256") is not None
+        and state.get("data_sha256") == file_sha256(data_path)
+    )
+
+def full_sync(worksheet, data_path=DATA_PATH, state_path=STATE_PATH):
+    """Tải lại toàn bộ sheet, ghi đè data.csv và tạo lại trạng thái."""
+    start_time = time.perf_counter()
+    values = worksheet.get_all_values()
+    header, rows = values[0], values[1:]
+
+    changed = write_csv_atomic(rows_to_frame(header, rows), data_path)
+    save_state({
+        "header": header,
+        "rows_ingested": len(rows),
+        "block_size": BLOCK_SIZE,
+        "block_checksums": block_checksums(rows),
+    }, state_path)
+    return FetchStats("full", len(rows), payload_size(values), time.perf_counter() - start_time, changed)
+
+def read_rows(worksheet, first_row, width, last_row=None):
+    """Đọc các dòng từ first_row (đánh số theo sheet) đến last_row hoặc hết sheet, đệm ô trống cuối dòng."""
+    last_col = rowcol_to_a1(1, width).rstrip("0123456789")
+    range_name = f"A{first_row}:{last_col}{last_row or ''}"
+    values = [list(row) for row in worksheet.get(range_name)]
+    return [row + [""] * (width - len(row)) for row in values]
+
+def incremental_sync(worksheet, data_path=DATA_PATH, state_path=STATE_PATH, audit_counter=None):
+    """
+    Chỉ tải các dòng mới kể từ lần trước và nối vào cuối data.csv (ghi nguyên tử qua file tạm).
+    - Khối cuối cùng đã lấy được đọc lại trong cùng một lần đọc range để so checksum.
+    - Mỗi lần chạy kiểm tra thêm một khối cũ theo vòng (audit_counter, mặc định đổi sau mỗi
+      AUDIT_ROTATE_SECONDS), nên sau vài lần chạy mọi khối đều được đối chiếu mà không phải
+      tải lại cả sheet.
+    Nếu header đổi, dòng cũ bị sửa/xóa hoặc thiếu trạng thái thì chuyển sang full_sync.
+    Không có dòng mới -> data.csv và trạng thái giữ nguyên, FetchStats.changed = False.
+    """
+    state = load_state(state_path)
+    if (
+        state is None
+        or not os.path.exists(data_path)
+        or state.get("block_size") != BLOCK_SIZE
+        or not all(key in state for key in ("header", "rows_ingested", "block_checksums"))
+    ):
+        return full_sync(worksheet, data_path, state_path)
+
+    start_time = time.perf_counter()
+    header = worksheet.row_values(1)
+    bytes_transferred = payload_size(header)
+    if header != state["header"]:
+        return full_sync(worksheet, data_path, state_path)
+
+    rows_ingested = state["rows_ingested"]
+    # Dòng dữ liệu đầu tiên (0-based) của khối chứa dòng cuối đã lấy
+    verify_start = ((rows_ingested - 1) // BLOCK_SIZE) * BLOCK_SIZE if rows_ingested else 0
+    values = read_rows(worksheet, verify_start + 2, len(header))  # +1 vì header, +1 vì sheet đánh số từ 1
+    bytes_transferred += payload_size(values)
+    known_rows = values[:rows_ingested - verify_start]
+    new_rows = values[rows_ingested - verify_start:]
+
+    verify_block = verify_start // BLOCK_SIZE
+    if rows_ingested and (
+        len(known_rows) < rows_ingested - verify_start
+        or block_checksums(known_rows)[0] != state["block_checksums"][verify_block]
+    ):
+        # Dòng cũ đã bị sửa hoặc xóa -> tải lại toàn bộ
+        return full_sync(worksheet, data_path, state_path)
+
+    if verify_block > 0:
+        if audit_counter is None:
+            audit_counter = int(time.time() // AUDIT_ROTATE_SECONDS)
+        audit_block = audit_counter % verify_block
+        audit_start = audit_block * BLOCK_SIZE
+        audit_rows = read_rows(worksheet, audit_start + 2, len(header), audit_start + BLOCK_SIZE + 1)
+        bytes_transferred += payload_size(audit_rows)
+        if block_checksums(audit_rows)[:1] != state["block_checksums"][audit_block:audit_block + 1]:
+            return full_sync(worksheet, data_path, state_path)
+    # Trạng thái cũ có thể còn khóa audit_block (trước đây lưu vòng kiểm tra trong file)
+    state.pop("audit_block", None)
+
+    changed = False
+    if new_rows:
+        changed = write_csv_atomic(rows_to_frame(header, new_rows), data_path, append=True)
+        state["rows_ingested"] = rows_ingested + len(new_rows)
+        state["block_checksums"] = (
+            state["block_checksums"][:verify_block] + block_checksums(known_rows + new_rows)
+        )
+    save_state(state, state_path)
+
+    return FetchStats(
+        "incremental", len(new_rows), bytes_transferred, time.perf_counter() - start_time, changed
+    )
+
+def _record_revision(revision, data_path, state_path, key="revision"):
+    """Lưu tín hiệu phiên bản và mã băm data.csv vừa ghi để lần sau kiểm tra is_unchanged()."""
+    state = load_state(state_path) or {}
+    state[key] = revision
+    state["data_sha256"] = file_sha256(data_path)
+    save_state(state, state_path)
+
+def sync(worksheet, data_path=DATA_PATH, state_path=STATE_PATH, full=False):
+    """
+    Đồng bộ data.csv với worksheet: mặc định tải tăng dần, full=True để tải lại toàn bộ.
+    Trước khi tải, so tín hiệu phiên bản (revision_signal) với lần trước: không đổi thì
+    dừng ngay mà không đọc dữ liệu (FetchStats mode "unchanged", changed=False).
+    """
+    start_time = time.perf_counter()
+    revision = revision_signal(worksheet)
+    if not full and is_unchanged(load_state(state_path), revision, data_path):
+        return FetchStats("unchanged", 0, 0, time.perf_counter() - start_time, changed=False)
+
+    if full:
+        stats = full_sync(worksheet, data_path, state_path)
+    else:
+        stats = incremental_sync(worksheet, data_path, state_path)
+    _record_revision(revision, data_path, state_path)
+    return stats
+
+def load_targets(path=None):
+    """Đọc danh sách SheetTarget từ file JSON (path) hoặc biến môi trường SHEET_TARGETS. None nếu không cấu hình."""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    elif os.environ.get(TARGETS_ENV):
+        raw = json.loads(os.environ[TARGETS_ENV])
+    else:
+        return None
+    return [SheetTarget(**item) for item in raw]
+
+def is_retryable(exc):
+    """Lỗi quota (429), lỗi máy chủ tạm thời (5xx) hoặc lỗi kết nối thì nên thử lại."""
+    if isinstance(exc, gspread.exceptions.APIError):
+        return exc.code in RETRYABLE_STATUS
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def with_backoff(func, max_retries=None, base_delay=None, max_delay=None, sleep=time.sleep):
+    """
+    Gọi func(), thử lại theo backoff lũy thừa (có jitter) khi gặp lỗi có thể thử lại.
+    Tham số None lấy giá trị MAX_RETRIES / BACKOFF_* của module tại thời điểm gọi.
+    """
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    base_delay = BACKOFF_BASE_SECONDS if base_delay is None else base_delay
+    max_delay = BACKOFF_MAX_SECONDS if max_delay is None else max_delay
+    for attempt in range(max_retries + 1):
+        try:
+            return func()
+        except Exception as exc:
+            if attempt == max_retries or not is_retryable(exc):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            sleep(delay * random.uniform(0.5, 1.0))
+
+def validate_schema(header, target):
+    """
+    Kiểm tra header của sheet bắt đầu bằng đúng các cột bắt buộc theo thứ tự chuẩn (cột thêm ở
+    cuối được bỏ qua). Cột bị đổi tên hoặc đổi chỗ cũng bị từ chối, không chỉ cột bị thiếu:
+    dữ liệu các sheet được gộp theo vị trí cột nên lệch một cột là sai cả cột.
+    """
+    header = list(header[:len(REQUIRED_COLUMNS)])
+    if header == REQUIRED_COLUMNS:
+        return
+    missing = [col for col in REQUIRED_COLUMNS if col not in header]
+    if missing:
+        raise SchemaError(f"Sheet {target.label} thiếu cột: {', '.join(missing)}")
+    position = next(i for i, (got, expected) in enumerate(zip(header, REQUIRED_COLUMNS)) if got != expected)
+    raise SchemaError(
+        f"Sheet {target.label} sai thứ tự cột: cột {position + 1} là '{header[position]}', "
+        f"cần '{REQUIRED_COLUMNS[position]}'"
+    )
+
+class _WorkbookCache:
+    """
+    Mở mỗi spreadsheet một lần cho cả lần đồng bộ (kiểm tra phiên bản rồi tải các worksheet),
+    dù có nhiều worksheet cùng spreadsheet. An toàn đa luồng: các spreadsheet khác nhau được mở
+    song song, chỉ các luồng cần cùng một spreadsheet mới chờ nhau.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._workbooks = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def workbook(self, spreadsheet_id):
+        with self._lock:
+            lock = self._locks.setdefault(spreadsheet_id, threading.Lock())
+        with lock:
+            workbook = self._workbooks.get(spreadsheet_id)
+            if workbook is None:
+                workbook = with_backoff(lambda: self.client.open_by_key(spreadsheet_id))
+                self._workbooks[spreadsheet_id] = workbook
+        return workbook
+
+    def worksheet(self, target):
+        workbook = self.workbook(target.spreadsheet_id)
+        if isinstance(target.worksheet, int):
+            return with_backoff(lambda: workbook.get_worksheet(target.worksheet))
+        return with_backoff(lambda: workbook.worksheet(target.worksheet))
+
+def fetch_target(workbooks, target):
+    """Tải một worksheet, kiểm tra schema và thêm cột Nguồn. Trả về (DataFrame, số byte)."""
+    worksheet = workbooks.worksheet(target)
+    values = with_backoff(worksheet.get_all_values)
+    if not values:
+        raise SchemaError(f"Sheet {target.label} trống")
+    validate_schema(values[0], target)
+    df = rows_to_frame(values[0], values[1:])[REQUIRED_COLUMNS].copy()
+    df[SOURCE_COLUMN] = target.label
+    return df, payload_size(values)
+
+def _pool(max_workers, n_tasks):
+    return ThreadPoolExecutor(max_workers=max(1, min(max_workers, n_tasks)))
+
+def fetch_targets(client, targets, max_workers=MAX_WORKERS, workbooks=None):
+    """
+    Tải đồng thời nhiều worksheet bằng một client dùng chung (thread pool giới hạn max_workers)
+    và gộp thành một DataFrame theo đúng thứ tự targets. Trả về (DataFrame, FetchStats).
+    workbooks: _WorkbookCache đã dùng ở target_revisions để không mở lại các spreadsheet.
+    """
+    start_time = time.perf_counter()
+    workbooks = workbooks or _WorkbookCache(client)
+    with _pool(max_workers, len(targets)) as pool:
+        results = list(pool.map(lambda target: fetch_target(workbooks, target), targets))
+    df = pd.concat([frame for frame, _ in results], ignore_index=True)
+    stats = FetchStats(
+        f"multi:{len(targets)}", len(df), sum(size for _, size in results), time.perf_counter() - start_time
+    )
+    return df, stats
+
+def target_revisions(workbooks, targets, max_workers=MAX_WORKERS):
+    """
+    Tín hiệu phiên bản của từng spreadsheet trong targets ({spreadsheet_id: modifiedTime}), lấy đồng thời.
+    Spreadsheet được mở qua workbooks (_WorkbookCache) để fetch_targets dùng lại.
+    None nếu có spreadsheet không lấy được tín hiệu (khi đó luôn phải tải lại).
+    """
+    def revision(spreadsheet_id):
+        spreadsheet = workbooks.workbook(spreadsheet_id)
+        try:
+            return with_backoff(spreadsheet.get_lastUpdateTime)
+        except (gspread.exceptions.APIError, AttributeError, KeyError):
+            return None
+
+    spreadsheet_ids = list(dict.fromkeys(target.spreadsheet_id for target in targets))
+    with _pool(max_workers, len(spreadsheet_ids)) as pool:
+        revisions = dict(zip(spreadsheet_ids, pool.map(revision, spreadsheet_ids)))
+    if any(value is None for value in revisions.values()):
+        return None
+    return revisions
+
+def sync_targets(client, targets, data_path=DATA_PATH, state_path=STATE_PATH, max_workers=MAX_WORKERS):
+    """
+    Đồng bộ data.csv với nhiều worksheet: bỏ qua nếu mọi spreadsheet có cùng tín hiệu phiên bản
+    như lần trước, nếu không thì tải đồng thời, gộp và ghi nguyên tử (chỉ khi nội dung khác).
+    """
+    start_time = time.perf_counter()
+    workbooks = _WorkbookCache(client)
+    revisions = target_revisions(workbooks, targets, max_workers)
+    if is_unchanged(load_state(state_path), revisions, data_path, key="target_revisions"):
+        return FetchStats("unchanged", 0, 0, time.perf_counter() - start_time, changed=False)
+
+    df, stats = fetch_targets(client, targets, max_workers, workbooks)
+    stats.changed = write_csv_atomic(df, data_path)
+    _record_revision(revisions, data_path, state_path, key="target_revisions")
+    return stats
+
+def refresh_rollups(root=None):
+    """
+    Cộng các dòng mới của data.csv vào bảng tổng hợp theo ngày (rollups.py) để dashboard không phải
+    tính lại. Chỉ là tối ưu cho dashboard: lỗi ở đây được báo nhưng không làm hỏng lần tải.
+    """
+    try:
+        # Import muộn: việc tải dữ liệu không phụ thuộc vào bảng tổng hợp
+        from rollups import ROLLUP_PATH, RollupTracker
+
+        root = root or ROLLUP_PATH
+        tracker = RollupTracker(DATA_PATH, root)
+        rollups, _ = tracker.refresh()
+    except Exception as e:
+        print(f"Cảnh báo: không cập nhật được bảng tổng hợp: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+    print(f"Bảng tổng hợp {root}: {len(rollups)} dòng, {len(rollups.months)} tháng "
+          f"(dòng mới: {tracker.appended_rows}, tính lại: {tracker.rebuilds}).")
+    return tracker
+
 def main():
-    # Gọi hàm fetch_data_from_sheet
-    df = fetch_data_from_sheet()
+    parser = argparse.ArgumentParser(description="Tải dữ liệu CIP từ Google Sheet vào data.csv")
+    parser.add_argument("--full", action="store_true", help="Tải lại toàn bộ sheet thay vì chỉ dòng mới")
+    parser.add_argument(
+        "--store", nargs="?", const="data_store", default=None, metavar="DIR",
+        help="Ghi thêm dataset Parquet phân vùng theo Line/tháng (cần pyarrow), mặc định ./data_store"
+    )
+    parser.add_argument(
+        "--targets", metavar="FILE",
+        help=f"File JSON liệt kê nhiều spreadsheet/worksheet cần tải (hoặc biến môi trường {TARGETS_ENV})"
+    )
+    parser.add_argument(
+        "--rollups", nargs="?", const="", default=None, metavar="DIR",
+        help="Cập nhật luôn bảng tổng hợp theo ngày của dashboard (mặc định thư mục của rollups.py), "
+             "khi script chạy cùng máy với dashboard"
+    )
+    args = parser.parse_args()
+
+    targets = load_targets(args.targets)
+    if targets:
+        # Nhiều sheet: tải đồng thời, gộp và ghi lại toàn bộ data.csv
+        stats = sync_targets(get_client(), targets)
+    else:
+        stats = sync(open_worksheet(), full=args.full)
+
+    if args.rollups is not None:
+        refresh_rollups(args.rollups or None)
+
+    if not stats.changed:
+        print(f"Sheet không thay đổi, giữ nguyên {DATA_PATH}. {stats.summary()}")
+        if not args.store or os.path.isdir(args.store):
+            return EXIT_UNCHANGED
+    else:
+        print(f"Dữ liệu đã được lưu vào {DATA_PATH} thành công. {stats.summary()}")
+
+    if args.store:
+        # Import muộn: job lấy dữ liệu thông thường không cần pyarrow
+        from data_store import write_dataset
 
-    # Lưu dữ liệu ra file CSV để sử dụng sau (VD: data.csv)
-    df.to_csv("data.csv", index=False)
-    print("Dữ liệu đã được lưu vào data.csv thành công.")
+        manifest = write_dataset(pd.read_csv(DATA_PATH), args.store)
+        print(f"Đã ghi {manifest['rows']} dòng vào store {args.store} (Line: {', '.join(manifest['lines'])}).")
+    return 0 if stats.changed else EXIT_UNCHANGED
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+GROUP_COLUMNS = ["Line", "Circuit", "Thiết bị"]
+START_COLUMN = "Thời gian Bắt đầu CIP"
+
+# Giá trị phần giây dành cho NaT trong khóa ghép (lớn hơn mọi mốc thời gian hợp lệ)
+NAT_SECONDS = (1 << 32) - 1
+
+
+class FilterIndex:
+    """
+    Chỉ mục cho bộ lọc Line → Circuit → Thiết bị và khoảng thời gian, xây một lần cho mỗi
+    phiên bản dữ liệu. df phải được sắp xếp theo (Line, Circuit, Thiết bị, Thời gian Bắt đầu CIP)
+    như kết quả của clean_data(), nên mỗi thiết bị là một đoạn dòng liên tiếp [lo, hi) và
+    trong đoạn đó thời gian bắt đầu tăng dần -> lọc theo ngày chỉ cần searchsorted.
+    """
+
+    def __init__(self, df):
+        # Mã categorical cho từng cột nhóm
+        self.codes = {}
+        self.categories = {}
+        for col in GROUP_COLUMNS:
+            codes, categories = pd.factorize(df[col], use_na_sentinel=False)
+            self.codes[col] = codes
+            self.categories[col] = categories
+
+        # Ranh giới các nhóm (Line, Circuit, Thiết bị): vị trí mà một trong các mã thay đổi
+        n_rows = len(df)
+        changed = np.zeros(n_rows, dtype=bool)
+        if n_rows:
+            changed[0] = True
+            for col in GROUP_COLUMNS:
+                changed[1:] |= self.codes[col][1:] != self.codes[col][:-1]
+        self.group_lo = np.flatnonzero(changed)
+        self.group_hi = np.append(self.group_lo[1:], n_rows)
+
+        self.group_keys = [
+            tuple(self.categories[col][self.codes[col][lo]] for col in GROUP_COLUMNS)
+            for lo in self.group_lo
+        ]
+
+        # Bảng tra lồng nhau Line -> Circuit -> [(Thiết bị, số thứ tự nhóm)]
+        self.tree = {}
+        for group_id, (line, circuit, device) in enumerate(self.group_keys):
+            self.tree.setdefault(line, {}).setdefault(circuit, []).append((device, group_id))
+
+        # Mã của từng cấp cho mỗi nhóm, đánh số theo thứ tự xuất hiện (= thứ tự của tree), để các
+        # truy vấn theo cấp là phép NumPy trên mảng số nhóm thay vì vòng lặp Python qua tree
+        self.group_line, self.line_names = pd.factorize(
+            pd.Series([line for line, _, _ in self.group_keys], dtype=object), use_na_sentinel=False
+        )
+        self.group_circuit, circuit_keys = pd.factorize(
+            pd.Series([key[:2] for key in self.group_keys], dtype=object), use_na_sentinel=False
+        )
+        self.circuit_names = [circuit for _, circuit in circuit_keys]
+        self.line_ids = {line: i for i, line in enumerate(self.line_names)}
+        self.circuit_ids = {key: i for i, key in enumerate(circuit_keys)}
+        self.group_by_key = {key: i for i, key in enumerate(self.group_keys)}
+        self.device_names = np.array([device for _, _, device in self.group_keys], dtype=object)
+
+        # Khóa ghép (số thứ tự nhóm << 32 | số giây kể từ mốc): tăng dần trên toàn bộ df,
+        # nên một lần searchsorted vector hóa tìm được ranh giới ngày cho mọi nhóm cùng lúc.
+        # NaT nhận giá trị lớn nhất của phần giây nên luôn nằm cuối mỗi nhóm.
+        starts = df[START_COLUMN]
+        # Mốc base lùi 1 giây để mọi dòng có phần giây >= 1: mốc truy vấn trước toàn bộ dữ liệu
+        # bị kẹp về 0 sẽ không trùng với dòng sớm nhất
+        self.base = (starts.min() if starts.notna().any() else pd.Timestamp(0)) - pd.Timedelta(seconds=1)
+        group_ids = np.repeat(np.arange(len(self.group_lo), dtype=np.int64), self.group_hi - self.group_lo)
+        self.keys = (group_ids << 32) | self._seconds(starts)
+
+    def _seconds(self, timestamps):
+        """Số giây kể từ mốc base, kẹp trong [0, 2^32 - 2]; NaT -> 2^32 - 1."""
+        seconds = (pd.Series(timestamps) - self.base).dt.total_seconds().to_numpy()
+        seconds = np.clip(seconds, 0, NAT_SECONDS - 1)
+        return np.where(np.isnan(seconds), NAT_SECONDS, seconds).astype(np.int64)
+
+    def window(self, start, end):
+        """
+        Với mỗi nhóm, trả về (a, b) sao cho các dòng a..b-1 có Thời gian Bắt đầu CIP trong [start, end].
+        Tương đương hai lần tìm kiếm nhị phân cho mỗi nhóm, thực hiện vector hóa cho mọi nhóm.
+        """
+        group_ids = np.arange(len(self.group_lo), dtype=np.int64)
+        lo_bounds = self.search(group_ids, pd.Timestamp(start).ceil("s"), side="left")
+        hi_bounds = self.search(group_ids, pd.Timestamp(end).floor("s"), side="right")
+        return lo_bounds, hi_bounds
+
+    def search(self, group_ids, timestamps, side="left"):
+        """
+        Vị trí dòng (theo thứ tự của df) trong nhóm group_ids ứng với mốc thời gian timestamps, như
+        np.searchsorted: side="left" -> dòng đầu tiên bắt đầu từ mốc đó trở đi, side="right" -> dòng
+        đầu tiên bắt đầu sau mốc. group_ids và timestamps được broadcast với nhau.
+        """
+        seconds = self._seconds(pd.DatetimeIndex(np.atleast_1d(timestamps)).floor("s"))
+        if np.ndim(timestamps) == 0:
+            seconds = seconds[0]
+        return np.searchsorted(self.keys, (np.asarray(group_ids, dtype=np.int64) << 32) | seconds, side=side)
+
+    @staticmethod
+    def _has_rows(bounds):
+        """Mảng bool theo nhóm: nhóm có ít nhất một dòng trong khoảng thời gian."""
+        return bounds[1] > bounds[0]
+
+    def _group_mask(self, bounds, line=None, circuit=None, device=None):
+        """Mảng bool theo nhóm: có dòng trong khoảng thời gian và khớp bộ lọc (None = không lọc cột đó)."""
+        mask = self._has_rows(bounds)
+        if device is not None:
+            selected = np.zeros_like(mask)
+            group_id = self.group_by_key.get((line, circuit, device))
+            if group_id is not None:
+                selected[group_id] = mask[group_id]
+            return selected
+        if circuit is not None:
+            return mask & (self.group_circuit == self.circuit_ids.get((line, circuit), -1))
+        if line is not None:
+            return mask & (self.group_line == self.line_ids.get(line, -1))
+        return mask
+
+    def lines(self, bounds):
+        """Các Line có ít nhất một lần CIP trong khoảng thời gian."""
+        present = np.bincount(self.group_line[self._has_rows(bounds)], minlength=len(self.line_names))
+        return [self.line_names[i] for i in np.flatnonzero(present)]
+
+    def circuits(self, bounds, line):
+        """Các Circuit của line có ít nhất một lần CIP trong khoảng thời gian."""
+        present = np.bincount(self.group_circuit[self._group_mask(bounds, line)], minlength=len(self.circuit_names))
+        return [self.circuit_names[i] for i in np.flatnonzero(present)]
+
+    def devices(self, bounds, line, circuit):
+        """Các Thiết bị của (line, circuit) có ít nhất một lần CIP trong khoảng thời gian."""
+        return self.device_names[self._group_mask(bounds, line, circuit)].tolist()
+
+    def positions(self, bounds, line=None, circuit=None, device=None):
+        """Vị trí các dòng (theo thứ tự của df) khớp bộ lọc; None nghĩa là không lọc cột đó."""
+        group_ids = np.flatnonzero(self._group_mask(bounds, line, circuit, device))
+        lo, hi = bounds[0][group_ids], bounds[1][group_ids]
+        lengths = hi - lo
+        # Nối các đoạn [lo, hi) không cần vòng lặp: vị trí = lo của đoạn + thứ tự trong đoạn
+        starts = np.cumsum(lengths) - lengths
+        return np.repeat(lo - starts, lengths) + np.arange(lengths.sum(), dtype=np.int64)
+
+    def select(self, df, bounds, line=None, circuit=None, device=None):
+        """Các dòng của df (cùng df đã dùng để xây chỉ mục) khớp bộ lọc."""
+        return df.iloc[self.positions(bounds, line, circuit, device)]
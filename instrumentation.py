@@ -0,0 +1,162 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# Bật đo đạc bằng biến môi trường CIP_PROFILE=1 (hoặc ?debug=1 trên URL của dashboard)
+PROFILE_ENV = "CIP_PROFILE"
+# Nếu đặt, mỗi lần chạy ghi thêm các bản ghi vào file JSONL này để phân tích offline
+PROFILE_LOG_ENV = "CIP_PROFILE_LOG"
+
+# tracemalloc là toàn cục cho cả tiến trình (start/stop/reset_peak ảnh hưởng mọi luồng), nên tại một
+# thời điểm chỉ một profiler được đo bộ nhớ; các profiler khác chỉ đo thời gian và số dòng
+_memory_lock = threading.Lock()
+_memory_owner = None
+
+
+def env_enabled():
+    return os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes")
+
+
+class _NullStage:
+    """Context manager rỗng dùng khi tắt đo đạc: không đo gì, gần như không tốn chi phí."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_rows_out(self, rows):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name, rows_in):
+        self.profiler = profiler
+        self.record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+
+    def set_rows_out(self, rows):
+        self.record["rows_out"] = rows
+
+    def __enter__(self):
+        if self.profiler.traces_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # Giữ lại đỉnh của giai đoạn cha trước khi đặt lại để đo giai đoạn này
+            for parent in self.profiler._stack:
+                parent["_peak"] = max(parent["_peak"], peak)
+            self.record["_base"] = current
+            self.record["_peak"] = current
+            tracemalloc.reset_peak()
+        # Thêm bản ghi ngay khi bắt đầu để danh sách theo thứ tự bắt đầu các giai đoạn
+        self.record["depth"] = len(self.profiler._stack)
+        self.profiler.records.append(self.record)
+        self.profiler._stack.append(self.record)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        self.profiler._stack.pop()
+        self.record["seconds"] = round(elapsed, 6)
+        if self.profiler.traces_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            for record in self.profiler._stack + [self.record]:
+                record["_peak"] = max(record["_peak"], peak)
+            self.record["peak_bytes"] = self.record.pop("_peak") - self.record.pop("_base")
+        else:
+            self.record["peak_bytes"] = None
+        return False
+
+
+class Profiler:
+    """
+    Ghi lại thời gian, số dòng vào/ra và bộ nhớ cấp phát tối đa (tracemalloc) của từng giai đoạn.
+    Khi enabled=False mọi lời gọi stage() trả về cùng một context manager rỗng.
+    Chỉ một profiler tại một thời điểm được đo bộ nhớ (traces_memory, giữ từ start() đến stop());
+    nếu phiên khác đang đo thì peak_bytes là None, thời gian và số dòng vẫn được ghi.
+    Bộ nhớ đo được là của cả tiến trình (gồm cả các luồng khác đang chạy).
+    """
+
+    def __init__(self, enabled=False, log_path=None):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.records = []
+        self._stack = []
+        self.traces_memory = False
+        self._started_tracing = False
+
+    def start(self):
+        global _memory_owner
+        if not self.enabled:
+            return self
+        with _memory_lock:
+            if _memory_owner is None:
+                _memory_owner = self
+                self.traces_memory = True
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracing = True
+        return self
+
+    def stop(self):
+        """Trả quyền đo bộ nhớ (dừng tracemalloc nếu profiler này đã bật) và ghi bản ghi ra JSONL nếu có log_path."""
+        global _memory_owner
+        with _memory_lock:
+            if self.traces_memory:
+                if self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+                self.traces_memory = False
+                _memory_owner = None
+        if self.enabled and self.log_path and self.records:
+            run_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                for record in self.records:
+                    f.write(json.dumps(dict(record, run_at=run_at), ensure_ascii=False, default=str) + "\n")
+
+    def stage(self, name, rows_in=None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, rows_in)
+
+
+NULL_PROFILER = Profiler(enabled=False)
+
+# Profiler đang hoạt động của luồng hiện tại (mỗi phiên Streamlit chạy trong một luồng riêng)
+_active = threading.local()
+
+
+def get_profiler():
+    return getattr(_active, "profiler", NULL_PROFILER)
+
+
+def activate(profiler):
+    _active.profiler = profiler
+    return profiler
+
+
+def profiled(name):
+    """
+    Decorator đo một hàm nhận/trả về DataFrame bằng profiler đang hoạt động.
+    Số dòng vào lấy từ đối số đầu tiên (nếu có len), số dòng ra từ kết quả.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = get_profiler()
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            rows_in = len(args[0]) if args and hasattr(args[0], "__len__") and not isinstance(args[0], str) else None
+            with profiler.stage(name, rows_in) as stage:
+                result = func(*args, **kwargs)
+                stage.set_rows_out(len(result) if hasattr(result, "__len__") else None)
+            return result
+        return wrapper
+    return decorator
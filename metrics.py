@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+
+import pandas as pd
+
+# Quy định: hai lần CIP liên tiếp không được cách nhau quá 5 ngày
+COMPLIANCE_THRESHOLD_DAYS = 5
+
+DEVICE_COLUMN = "Thiết bị"
+GAP_COLUMN = "time_gap_days"
+DURATION_COLUMN = "Tổng thời gian CIP (phút)"
+FLOW_COLUMN = "Lưu lượng hồi (l/h)"
+
+# (tên hiển thị, cột bắt đầu, cột kết thúc) của các chênh lệch nhiệt độ
+TEMP_COLUMNS = [
+    ("Nhiệt độ Xút", "Nhiệt độ Xút Bắt đầu", "Nhiệt độ Xút Kết thúc"),
+    ("Nhiệt độ Nước nóng", "Nhiệt độ Nước nóng Bắt đầu", "Nhiệt độ Nước nóng Kết thúc"),
+]
+
+# Tên cột của bảng thống kê (mục 4) trên dashboard
+STATS_TABLE_COLUMNS = {
+    "gap_mean": "Trung bình (ngày)",
+    "gap_min": "Tối thiểu (ngày)",
+    "gap_max": "Tối đa (ngày)",
+    "gap_std": "Độ lệch chuẩn (ngày)",
+    "gap_count": "Số lần CIP",
+    "compliance_rate": "Tỷ lệ tuân thủ (%)",
+    "violation_count": "Số lần vượt quy định",
+}
+
+
+def temp_delta_column(temp_type):
+    return f"Chênh lệch {temp_type}"
+
+
+@dataclass
+class DeviceMetrics:
+    """
+    Các chỉ số theo Thiết bị, tính trong một lần groupby.
+    per_device có index là Thiết bị và các cột:
+    gap_mean/gap_min/gap_max/gap_std/gap_count (chỉ tính khoảng cách > 0 ngày),
+    compliant_count, violation_count, compliance_rate (%), duration_mean,
+    "Chênh lệch <nhiệt độ>" cho từng loại nhiệt độ, flow_mean.
+    """
+    per_device: pd.DataFrame
+    threshold_days: float = COMPLIANCE_THRESHOLD_DAYS
+
+    def gaps(self):
+        """Các thiết bị có ít nhất một khoảng cách hợp lệ giữa hai lần CIP."""
+        return self.per_device[self.per_device["gap_count"] > 0]
+
+    def stats_table(self):
+        """Bảng thống kê chi tiết về khoảng cách giữa các lần CIP, đã làm tròn và đổi tên cột."""
+        table = self.gaps()[list(STATS_TABLE_COLUMNS)].copy()
+        rounded = ["gap_mean", "gap_min", "gap_max", "gap_std", "compliance_rate"]
+        table[rounded] = table[rounded].round(2)
+        table = table.rename(columns=STATS_TABLE_COLUMNS).reset_index()
+        return table.sort_values(STATS_TABLE_COLUMNS["compliance_rate"], ascending=False)
+
+    def column(self, name, ascending=False):
+        """Một cột chỉ số (bỏ thiết bị không có giá trị), sắp xếp để vẽ biểu đồ cột."""
+        return self.per_device[name].dropna().sort_values(ascending=ascending)
+
+
+def compute_device_metrics(df, threshold_days=COMPLIANCE_THRESHOLD_DAYS):
+    """
+    Tính mọi chỉ số theo Thiết bị của df (đã lọc) trong một lần groupby, không dùng lambda Python:
+    khoảng cách giữa hai lần CIP, tỷ lệ tuân thủ quy định threshold_days ngày,
+    thời gian CIP trung bình, chênh lệch nhiệt độ trung bình và lưu lượng hồi trung bình.
+    """
+    # Chỉ các khoảng cách > 0 ngày được tính (giống bộ lọc time_gap_days > 0 trước đây)
+    gaps = df[GAP_COLUMN].where(df[GAP_COLUMN] > 0)
+    has_gap = gaps.notna()
+
+    work = pd.DataFrame({
+        DEVICE_COLUMN: df[DEVICE_COLUMN],
+        "gap": gaps,
+        "compliant": ((gaps <= threshold_days) & has_gap).astype("int64"),
+        "violation": ((gaps > threshold_days) & has_gap).astype("int64"),
+        "duration": df[DURATION_COLUMN] if DURATION_COLUMN in df.columns else float("nan"),
+        "flow": df[FLOW_COLUMN] if FLOW_COLUMN in df.columns else float("nan"),
+    })
+    aggregations = {
+        "gap_mean": ("gap", "mean"),
+        "gap_min": ("gap", "min"),
+        "gap_max": ("gap", "max"),
+        "gap_std": ("gap", "std"),
+        "gap_count": ("gap", "count"),
+        "compliant_count": ("compliant", "sum"),
+        "violation_count": ("violation", "sum"),
+        "duration_mean": ("duration", "mean"),
+        "flow_mean": ("flow", "mean"),
+    }
+    for temp_type, start_col, end_col in TEMP_COLUMNS:
+        if start_col in df.columns and end_col in df.columns:
+            delta = temp_delta_column(temp_type)
+            work[delta] = df[end_col] - df[start_col]
+            aggregations[delta] = (delta, "mean")
+
+    per_device = work.groupby(DEVICE_COLUMN, observed=True).agg(**aggregations)
+    per_device["compliance_rate"] = (
+        per_device["compliant_count"] / per_device["gap_count"].where(per_device["gap_count"] > 0) * 100
+    )
+    return DeviceMetrics(per_device=per_device, threshold_days=threshold_days)
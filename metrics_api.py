@@ -0,0 +1,290 @@
+"""
+Dịch vụ HTTP chỉ-đọc trả về chỉ số CIP theo thiết bị dạng JSON (cho MES, job cảnh báo ...),
+cùng cách tính với dashboard (clean_data + compute_device_metrics), không cần Streamlit.
+
+    GET /metrics?line=MMB&circuit=4&device=T7T2&start=2025-02-01&end=2025-02-28
+        Mọi tham số đều tùy chọn; start/end (YYYY-MM-DD, gồm cả ngày end) lọc theo Thời gian Bắt đầu CIP.
+    GET /health
+        Phiên bản dữ liệu, số dòng, trạng thái tải lại.
+
+Mỗi phản hồi có ETag = băm(phiên bản dữ liệu + bộ lọc), nên client gửi If-None-Match nhận 304
+mà không phải tính lại gì. Bảng chỉ số toàn bộ khoảng thời gian được tính một lần cho mỗi phiên bản
+dữ liệu; các khoảng ngày khác được tính khi cần rồi lưu trong cache LRU. data.csv được theo dõi và
+tải lại ở luồng nền như dashboard (shared_dataset.SharedDataset).
+
+Chạy: python metrics_api.py [--host 127.0.0.1] [--port 8502] [--data data.csv]
+"""
+import argparse
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from metrics import compute_device_metrics
+from shared_dataset import DATA_PATH, SharedDataset, build_clean_data, csv_source
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+# Số phản hồi (phiên bản dữ liệu + bộ lọc) giữ trong cache
+CACHE_ENTRIES = 512
+
+FILTER_PARAMS = ("line", "circuit", "device", "start", "end")
+# Cột của DeviceMetrics.per_device được trả về, theo tên trong JSON
+METRIC_FIELDS = {
+    "gap_count": "gap_count",
+    "gap_mean": "gap_mean_days",
+    "gap_min": "gap_min_days",
+    "gap_max": "gap_max_days",
+    "compliance_rate": "compliance_rate",
+    "violation_count": "violation_count",
+    "duration_mean": "duration_mean_minutes",
+    "flow_mean": "flow_mean",
+}
+
+
+class BadRequest(ValueError):
+    """Tham số truy vấn không hợp lệ (trả về 400)."""
+
+
+def _json_value(value):
+    """Số NumPy -> số Python, NaN -> null."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def parse_filters(query):
+    """Chuẩn hóa tham số truy vấn thành dict bộ lọc (giá trị chuỗi hoặc None)."""
+    unknown = set(query) - set(FILTER_PARAMS)
+    if unknown:
+        raise BadRequest(f"Tham số không hỗ trợ: {', '.join(sorted(unknown))}")
+    filters = {name: (query[name][-1] if query.get(name) else None) for name in FILTER_PARAMS}
+    for name in ("start", "end"):
+        if filters[name] is not None:
+            try:
+                filters[name] = pd.Timestamp(filters[name]).date().isoformat()
+            except ValueError:
+                raise BadRequest(f"Ngày không hợp lệ: {name}={filters[name]}")
+    if filters["start"] and filters["end"] and filters["start"] > filters["end"]:
+        raise BadRequest("start phải trước hoặc bằng end")
+    return filters
+
+
+def compute_metrics(snapshot, filters):
+    """
+    Chỉ số theo (Line, Circuit, Thiết bị) của snapshot trong bộ lọc, giống các mục 2-7 của dashboard:
+    lọc dòng theo Thời gian Bắt đầu CIP trong khoảng ngày rồi compute_device_metrics theo từng Circuit.
+    """
+    df, index = snapshot.df, snapshot.index
+    starts = df["Thời gian Bắt đầu CIP"]
+    start = pd.Timestamp(filters["start"]) if filters["start"] else starts.min()
+    end = (
+        pd.Timestamp(filters["end"]) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+        if filters["end"] else starts.max()
+    )
+    bounds = index.window(start, end) if starts.notna().any() else None
+
+    devices = []
+    for line, circuits in index.tree.items():
+        if filters["line"] is not None and str(line) != filters["line"]:
+            continue
+        for circuit, members in circuits.items():
+            if filters["circuit"] is not None and str(circuit) != filters["circuit"]:
+                continue
+            if bounds is None:
+                continue
+            device = None
+            if filters["device"] is not None:
+                device = next((d for d, _ in members if str(d) == filters["device"]), None)
+                if device is None:
+                    continue
+            df_slice = index.select(df, bounds, line, circuit, device)
+            if df_slice.empty:
+                continue
+            per_device = compute_device_metrics(df_slice).per_device
+            cip_counts = df_slice.groupby("Thiết bị", observed=True).size()
+            # to_dict("records") giữ kiểu của từng cột (số đếm vẫn là int)
+            rows = per_device[list(METRIC_FIELDS)].to_dict("records")
+            for name, row in zip(per_device.index, rows):
+                record = {"line": _json_value(line), "circuit": _json_value(circuit), "device": _json_value(name)}
+                record["cip_count"] = int(cip_counts.get(name, 0))
+                record.update({key: _json_value(row[col]) for col, key in METRIC_FIELDS.items()})
+                devices.append(record)
+
+    return {
+        "data_version": snapshot.version,
+        "filters": filters,
+        "count": len(devices),
+        "devices": devices,
+    }
+
+
+class MetricsService:
+    """
+    Trả lời truy vấn /metrics từ SharedDataset. Phản hồi đã tính được lưu theo
+    (phiên bản dữ liệu, bộ lọc) trong cache LRU; ETag chỉ phụ thuộc khóa này nên
+    kiểm tra If-None-Match không cần tính gì.
+    """
+
+    def __init__(self, dataset, cache_entries=CACHE_ENTRIES):
+        self.dataset = dataset
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._precomputed_version = None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def etag(version, filters):
+        key = json.dumps([version, filters], sort_keys=True)
+        return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
+
+    def _cached(self, key):
+        with self._lock:
+            body = self._cache.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def _store(self, key, body):
+        with self._lock:
+            self._cache[key] = body
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def _body(self, snapshot, filters):
+        key = self.etag(snapshot.version, filters)
+        body = self._cached(key)
+        if body is None:
+            payload = compute_metrics(snapshot, filters)
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self._store(key, body)
+        return key, body
+
+    def precompute(self):
+        """Tính sẵn bảng chỉ số toàn bộ khoảng thời gian khi có phiên bản dữ liệu mới."""
+        snapshot = self.dataset.current()
+        if snapshot.version != self._precomputed_version:
+            self._body(snapshot, parse_filters({}))
+            self._precomputed_version = snapshot.version
+
+    def metrics(self, query, if_none_match=None):
+        """Trả về (status, etag, body bytes hoặc None cho 304)."""
+        filters = parse_filters(query)
+        snapshot = self.dataset.current()
+        etag = self.etag(snapshot.version, filters)
+        if if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            with self._lock:
+                self.not_modified += 1
+            return 304, etag, None
+        _, body = self._body(snapshot, filters)
+        return 200, etag, body
+
+    def health(self):
+        with self._lock:
+            cache = {"entries": len(self._cache), "hits": self.hits, "misses": self.misses,
+                     "not_modified": self.not_modified}
+        return dict(self.dataset.stats(), cache=cache)
+
+
+def make_handler(service):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 để client giữ kết nối (keep-alive) giữa các lần poll
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body=None, etag=None):
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+                # Client luôn hỏi lại bằng If-None-Match, dữ liệu đổi là thấy ngay
+                self.send_header("Cache-Control", "no-cache")
+            if body is not None:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body) if body is not None else 0))
+            self.end_headers()
+            if body is not None:
+                self.wfile.write(body)
+
+        def _send_json(self, status, payload):
+            self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                if url.path == "/metrics":
+                    status, etag, body = service.metrics(
+                        parse_qs(url.query), self.headers.get("If-None-Match")
+                    )
+                    self._send(status, body, etag)
+                elif url.path == "/health":
+                    self._send_json(200, service.health())
+                else:
+                    self._send_json(404, {"error": f"Không có đường dẫn {url.path}"})
+            except BadRequest as e:
+                self._send_json(400, {"error": str(e)})
+            except Exception as e:
+                self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, format, *args):
+            # Không ghi log mỗi request (poller gọi rất thường xuyên)
+            pass
+
+    return MetricsHandler
+
+
+class _PrecomputingDataset(SharedDataset):
+    """SharedDataset tính sẵn bảng chỉ số ngay sau mỗi lần tải lại, trong luồng nền."""
+
+    service = None
+
+    def refresh(self, wait_for_settle=True):
+        swapped = super().refresh(wait_for_settle)
+        if swapped and self.service is not None:
+            self.service.precompute()
+        return swapped
+
+
+def create_server(data_path=DATA_PATH, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Tạo (server, service); server.serve_forever() để chạy."""
+    dataset = _PrecomputingDataset(lambda: csv_source(data_path), build_clean_data)
+    service = MetricsService(dataset)
+    dataset.service = service
+    service.precompute()
+    dataset.start()
+    return ThreadingHTTPServer((host, port), make_handler(service)), service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dịch vụ JSON chỉ số CIP theo thiết bị")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data", default=DATA_PATH, help="File CSV dữ liệu thô")
+    args = parser.parse_args()
+
+    server, service = create_server(args.data, args.host, args.port)
+    print(f"Đang phục vụ chỉ số CIP tại http://{args.host}:{args.port}/metrics "
+          f"(phiên bản dữ liệu {service.dataset.current().version})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.dataset.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cip_cleaning import END_COLUMN, GROUP_COLUMNS, START_COLUMN, clean_rows
+from csv_tail import CsvTail
+from data_cache import CACHE_DIR, file_fingerprint
+from metrics import (
+    COMPLIANCE_THRESHOLD_DAYS, DEVICE_COLUMN, DURATION_COLUMN, FLOW_COLUMN, TEMP_COLUMNS, DeviceMetrics,
+    temp_delta_column
+)
+
+DATA_PATH = "data.csv"
+# Thư mục bảng tổng hợp: trong .cache/ như trạng thái SPC (trạng thái gắn với file data.csv
+# trên máy này, gồm cả mtime), không commit
+ROLLUP_PATH = os.path.join(CACHE_DIR, "rollups")
+# Mỗi tháng một file CSV: <ROLLUP_PATH>/daily/YYYY-MM.csv
+TABLE_DIR = "daily"
+STATE_NAME = "state.json"
+# Tăng khi đổi cấu trúc bảng tổng hợp -> bảng cũ bị bỏ, tính lại từ đầu
+ROLLUP_VERSION = 1
+
+DAY_COLUMN = "Ngày"
+KEY_COLUMNS = GROUP_COLUMNS + [DAY_COLUMN]
+MONTH_LEVEL = "Tháng"
+# Đại lượng tổng hợp -> cột trung bình tương ứng trong DeviceMetrics.per_device
+MEASURES = {"gap": "gap_mean", "duration": "duration_mean", "flow": "flow_mean"}
+MEASURES.update({temp_delta_column(temp_type): temp_delta_column(temp_type) for temp_type, _, _ in TEMP_COLUMNS})
+STATS = ("count", "sum", "sumsq", "min", "max")
+STAT_COLUMNS = ["cip_count", "gap_compliant"] + [f"{m}_{s}" for m in MEASURES for s in STATS]
+# Gộp hai phần của cùng một khóa: cộng số đếm / tổng, lấy min của min và max của max
+COMBINE = {col: "min" if col.endswith("_min") else "max" if col.endswith("_max") else "sum" for col in STAT_COLUMNS}
+
+
+def _empty_table(levels):
+    index = pd.MultiIndex.from_arrays([[]] * len(levels), names=levels)
+    return pd.DataFrame({col: pd.Series(dtype=float) for col in STAT_COLUMNS}, index=index)
+
+
+class RollupOrderError(ValueError):
+    """Dòng mới bắt đầu trước lần CIP cuối cùng đã tổng hợp của cùng thiết bị (cần tính lại từ đầu)."""
+
+
+def _combine(frames):
+    """Gộp các bảng tổng hợp có chung khóa (Line, Circuit, Thiết bị, ngày)."""
+    return pd.concat(frames).groupby(level=KEY_COLUMNS, sort=False).agg(COMBINE)
+
+
+class DailyRollups:
+    """
+    Bảng tổng hợp theo (Line, Circuit, Thiết bị, ngày bắt đầu CIP): số lần CIP, và với mỗi đại lượng
+    (khoảng cách > 0 ngày, thời gian CIP, lưu lượng hồi, chênh lệch nhiệt độ) số đếm / tổng /
+    tổng bình phương / min / max; thêm số khoảng cách tuân thủ quy định. Khoảng cách của một lần CIP
+    chỉ biết khi lần kế tiếp của thiết bị đến, nên lần CIP cuối cùng của mỗi thiết bị được giữ lại
+    (carried) và khoảng cách của nó được cộng vào ngày của nó khi có dòng mới.
+    Bảng chia theo tháng ("YYYY-MM" -> DataFrame) để cập nhật / ghi file chỉ chạm các tháng có dòng mới.
+    Đối tượng không bị sửa: updated() trả về bảng mới (phiên đang đọc không thấy bảng cập nhật dở).
+    """
+
+    def __init__(self, months=None, carried=None, threshold_days=COMPLIANCE_THRESHOLD_DAYS, changed_months=(),
+                 month_totals=None):
+        self.months = months or {}
+        # Tổng theo thiết bị của từng tháng (tính khi cần, dùng lại cho các tháng không đổi)
+        self._month_totals = dict(month_totals or {})
+        self._monthly = None
+        # (Line, Circuit, Thiết bị) -> (bắt đầu, kết thúc) của lần CIP cuối cùng đã tổng hợp
+        self.carried = carried or {}
+        self.threshold_days = threshold_days
+        # Các tháng khác với bảng trước khi updated() (cần ghi lại file)
+        self.changed_months = set(changed_months)
+
+    def __len__(self):
+        return sum(len(frame) for frame in self.months.values())
+
+    def _contributions(self, rows):
+        """Phần đóng góp của các dòng mới (và khoảng cách của các dòng carried) theo khóa + ngày."""
+        work = pd.DataFrame({
+            "Line": rows["Line"].astype(str),
+            "Circuit": rows["Circuit"],
+            DEVICE_COLUMN: rows[DEVICE_COLUMN].astype(str),
+            START_COLUMN: rows[START_COLUMN],
+            END_COLUMN: rows[END_COLUMN],
+            "_carried": False,
+            "duration": rows[DURATION_COLUMN] if DURATION_COLUMN in rows.columns else np.nan,
+            "flow": rows[FLOW_COLUMN] if FLOW_COLUMN in rows.columns else np.nan,
+        })
+        for temp_type, start_col, end_col in TEMP_COLUMNS:
+            delta = temp_delta_column(temp_type)
+            work[delta] = rows[end_col] - rows[start_col] if end_col in rows.columns else np.nan
+
+        touched = set(zip(*(work[col].tolist() for col in GROUP_COLUMNS)))
+        carried = [(*key, *self.carried[key]) for key in touched if key in self.carried]
+        carried = pd.DataFrame(carried, columns=GROUP_COLUMNS + [START_COLUMN, END_COLUMN]).astype(
+            {START_COLUMN: "datetime64[us]", END_COLUMN: "datetime64[us]"}
+        )
+        carried["_carried"] = True
+        # Dòng carried đứng trước dòng mới trùng thời gian bắt đầu (sắp xếp ổn định)
+        both = pd.concat([carried, work], ignore_index=True).sort_values(
+            GROUP_COLUMNS + [START_COLUMN], kind="stable", ignore_index=True
+        )
+        by_group = both.groupby(GROUP_COLUMNS, sort=False)
+        if (both["_carried"] & (by_group.cumcount() > 0)).any():
+            raise RollupOrderError("Có dòng mới bắt đầu trước lần CIP cuối cùng đã tổng hợp của thiết bị")
+
+        gap = (by_group[START_COLUMN].shift(-1) - both[END_COLUMN]).dt.total_seconds() / 86400
+        both["gap"] = gap.where(gap > 0)
+        # Dòng carried đã được tổng hợp, chỉ còn khoảng cách của nó
+        measures = [m for m in MEASURES if m != "gap"]
+        both.loc[both["_carried"], measures] = np.nan
+        both["cip"] = (~both["_carried"]).astype("int64")
+        both["compliant"] = (both["gap"] <= self.threshold_days).astype("int64")
+        both[DAY_COLUMN] = both[START_COLUMN].dt.normalize()
+
+        aggregations = {"cip_count": ("cip", "sum"), "gap_compliant": ("compliant", "sum")}
+        for m in MEASURES:
+            both[f"{m}__sq"] = both[m] ** 2
+            aggregations.update({
+                f"{m}_count": (m, "count"), f"{m}_sum": (m, "sum"), f"{m}_sumsq": (f"{m}__sq", "sum"),
+                f"{m}_min": (m, "min"), f"{m}_max": (m, "max"),
+            })
+        delta = both.groupby(KEY_COLUMNS, sort=False).agg(**aggregations)
+
+        last = by_group.tail(1)
+        new_carried = {
+            key: (start, end)
+            for key, start, end in zip(
+                zip(*(last[col].tolist() for col in GROUP_COLUMNS)), last[START_COLUMN], last[END_COLUMN]
+            )
+        }
+        return delta, new_carried
+
+    def updated(self, rows):
+        """
+        Bảng mới sau khi cộng các dòng mới (đã qua clean_rows). Chỉ các tháng có dòng mới hoặc có
+        dòng carried nhận khoảng cách được gộp lại; các tháng khác dùng chung với bảng cũ.
+        RollupOrderError nếu dòng mới cũ hơn lần CIP cuối cùng đã tổng hợp của thiết bị.
+        """
+        rows = rows[rows[START_COLUMN].notna()]
+        if rows.empty:
+            return self
+        delta, new_carried = self._contributions(rows)
+        months = dict(self.months)
+        labels = delta.index.get_level_values(DAY_COLUMN).strftime("%Y-%m")
+        for month, part in delta.groupby(labels):
+            old = months.get(month)
+            months[month] = (_combine([old, part]) if old is not None else part).sort_index()
+        changed = set(labels)
+        totals = {month: total for month, total in self._month_totals.items() if month not in changed}
+        return DailyRollups(months, {**self.carried, **new_carried}, self.threshold_days, changed, totals)
+
+    def _monthly_table(self):
+        """Bảng tổng theo (tháng, Line, Circuit, Thiết bị): một dòng mỗi thiết bị mỗi tháng."""
+        if self._monthly is None:
+            for month, frame in self.months.items():
+                if month not in self._month_totals:
+                    self._month_totals[month] = frame.groupby(level=GROUP_COLUMNS, sort=False).agg(COMBINE)
+            if self._month_totals:
+                self._monthly = pd.concat(self._month_totals, names=[MONTH_LEVEL])
+            else:
+                self._monthly = _empty_table([MONTH_LEVEL] + GROUP_COLUMNS)
+        return self._monthly
+
+    def device_metrics(self, line, circuit, device, start_date, end_date):
+        """
+        DeviceMetrics của (line, circuit[, device]) cho các lần CIP bắt đầu trong các ngày
+        start_date..end_date, chỉ từ bảng tổng hợp: chi phí theo số thiết bị x số ngày.
+        """
+        start, end = pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize()
+        # Tháng nằm trọn trong khoảng ngày dùng bảng tổng theo tháng, chỉ (tối đa) hai tháng
+        # ở hai đầu khoảng phải đọc bảng theo ngày
+        start_month, end_month = start.to_period("M"), end.to_period("M")
+        first_full = start_month if start == start_month.start_time else start_month + 1
+        last_full = end_month if end == end_month.end_time.normalize() else end_month - 1
+        first_full, last_full = first_full.strftime("%Y-%m"), last_full.strftime("%Y-%m")
+        edges = {
+            month.strftime("%Y-%m") for month in (start_month, end_month)
+            if not first_full <= month.strftime("%Y-%m") <= last_full
+        }
+
+        def select(table, extra=None):
+            mask = (
+                (table.index.get_level_values("Line") == str(line))
+                & (table.index.get_level_values("Circuit") == circuit)
+            )
+            if device is not None:
+                mask &= table.index.get_level_values(DEVICE_COLUMN) == str(device)
+            if extra is not None:
+                mask &= extra
+            return table[mask].droplevel([level for level in table.index.names if level not in GROUP_COLUMNS])
+
+        monthly = self._monthly_table()
+        months = monthly.index.get_level_values(MONTH_LEVEL)
+        parts = [select(monthly, (months >= first_full) & (months <= last_full))]
+        for month in sorted(edges):
+            if month in self.months:
+                daily = self.months[month]
+                days = daily.index.get_level_values(DAY_COLUMN)
+                parts.append(select(daily, (days >= start) & (days <= end)))
+        sums = pd.concat(parts).groupby(level=DEVICE_COLUMN).agg(COMBINE)
+
+        per_device = pd.DataFrame(index=sums.index)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for m, mean_col in MEASURES.items():
+                count = sums[f"{m}_count"].where(sums[f"{m}_count"] > 0)
+                per_device[mean_col] = sums[f"{m}_sum"] / count
+            n = sums["gap_count"]
+            variance = (sums["gap_sumsq"] - sums["gap_sum"] ** 2 / n.where(n > 0)) / (n - 1).where(n > 1)
+            per_device["gap_min"] = sums["gap_min"]
+            per_device["gap_max"] = sums["gap_max"]
+            per_device["gap_std"] = np.sqrt(variance.clip(lower=0))
+            per_device["gap_count"] = n.astype("int64")
+            per_device["compliant_count"] = sums["gap_compliant"].astype("int64")
+            per_device["violation_count"] = per_device["gap_count"] - per_device["compliant_count"]
+            per_device["compliance_rate"] = per_device["compliant_count"] / n.where(n > 0) * 100
+        return DeviceMetrics(per_device=per_device, threshold_days=self.threshold_days)
+
+    def to_files(self, root, months=None):
+        """
+        Ghi các tháng (mặc định: mọi tháng, và xóa file của tháng không còn) ra root/daily/YYYY-MM.csv
+        (CSV, không cần pyarrow; ghi qua file tạm).
+        """
+        directory = os.path.join(root, TABLE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        if months is None:
+            months = self.months
+            for stale in set(glob.glob(os.path.join(directory, "*.csv"))) - {
+                os.path.join(directory, f"{month}.csv") for month in months
+            }:
+                os.remove(stale)
+        for month in months:
+            path = os.path.join(directory, f"{month}.csv")
+            table = self.months[month].reset_index()
+            table[DAY_COLUMN] = table[DAY_COLUMN].dt.strftime("%Y-%m-%d")
+            table.to_csv(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+
+    def carried_json(self):
+        return [
+            [*key, start.isoformat(), None if pd.isna(end) else end.isoformat()]
+            for key, (start, end) in sorted(self.carried.items(), key=str)
+        ]
+
+    @classmethod
+    def from_files(cls, root, carried_json):
+        months = {}
+        for path in sorted(glob.glob(os.path.join(root, TABLE_DIR, "*.csv"))):
+            table = pd.read_csv(path, dtype={"Line": str, DEVICE_COLUMN: str}, parse_dates=[DAY_COLUMN])
+            months[os.path.basename(path)[:-len(".csv")]] = table.set_index(KEY_COLUMNS).sort_index()
+        carried = {
+            tuple(record[:3]): (pd.Timestamp(record[3]), pd.Timestamp(record[4]) if record[4] else pd.NaT)
+            for record in carried_json
+        }
+        return cls(months, carried)
+
+
+class RollupTracker:
+    """
+    Giữ DailyRollups khớp với data.csv: chỉ các dòng mới ghi thêm (csv_tail.CsvTail) được cộng vào
+    bảng; file bị ghi lại hoặc dòng mới sai thứ tự thì tính lại từ đầu. Bảng và trạng thái
+    (vị trí đã đọc, dòng carried, mã băm data.csv đã tổng hợp) được lưu trong root, nên
+    khởi động lại dashboard không phải tính lại từ đầu.
+    refresh() cập nhật ngay trong luồng gọi; latest() không bao giờ chờ: trả về bảng đã xong gần nhất
+    và cập nhật trong luồng nền (dùng trên luồng xử lý request của dashboard).
+    """
+
+    def __init__(self, path=DATA_PATH, root=ROLLUP_PATH):
+        self.path = path
+        self.root = root
+        self.rollups = DailyRollups()
+        self._tail = CsvTail(path)
+        # Mã băm (data_cache.file_fingerprint) của data.csv mà bảng đang phản ánh
+        self.data_fingerprint = None
+        self._lock = threading.Lock()
+        # Luồng nền đang chạy refresh() (latest()), chỉ một luồng tại một thời điểm
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self.rebuilds = 0
+        self.appended_rows = 0
+        self.last_error = None
+        self.resumed = self._load()
+        # (bảng, mã băm) của lần cập nhật xong gần nhất, gán một lần nên luồng đọc không thấy cặp lệch nhau
+        self._latest = (self.rollups, self.data_fingerprint)
+
+    def _state_path(self):
+        return os.path.join(self.root, STATE_NAME)
+
+    def _load(self):
+        try:
+            with open(self._state_path(), encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("version") != ROLLUP_VERSION:
+                return False
+            rollups = DailyRollups.from_files(self.root, state["carried"])
+        except (OSError, ValueError, KeyError):
+            return False
+        self.rollups = rollups
+        self._tail = CsvTail(self.path, state["tail"])
+        self.data_fingerprint = state.get("data_fingerprint")
+        return True
+
+    def _save(self, months):
+        """months: các tháng cần ghi lại (None = ghi lại toàn bộ bảng)."""
+        if months is None or months:
+            self.rollups.to_files(self.root, months)
+        os.makedirs(self.root, exist_ok=True)
+        state = {
+            "version": ROLLUP_VERSION,
+            "data_fingerprint": self.data_fingerprint,
+            "tail": self._tail.state(),
+            "carried": self.rollups.carried_json(),
+        }
+        tmp_path = f"{self._state_path()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._state_path())
+
+    def _rebuild(self, frame):
+        rows, _ = clean_rows(frame)
+        self.rollups = DailyRollups().updated(rows)
+        self.rebuilds += 1
+
+    def refresh(self):
+        """
+        Cộng các dòng mới của data.csv (nếu có) vào bảng. Trả về (DailyRollups, mã băm data.csv
+        mà bảng phản ánh); mã băm là None nếu data.csv đổi ngay trong lúc cập nhật.
+        """
+        with self._lock:
+            before = file_fingerprint(self.path)
+            if before == self.data_fingerprint:
+                return self.rollups, self.data_fingerprint
+            kind, frame = self._tail.poll()
+            months = set()
+            if kind == "rewritten":
+                self._rebuild(frame)
+                months = None
+            elif kind == "appended":
+                rows, _ = clean_rows(frame)
+                try:
+                    self.rollups = self.rollups.updated(rows)
+                    months = self.rollups.changed_months
+                    self.appended_rows += len(rows)
+                except RollupOrderError:
+                    self._tail = CsvTail(self.path)
+                    kind, frame = self._tail.poll()
+                    self._rebuild(frame)
+                    months = None
+            after = file_fingerprint(self.path)
+            self.data_fingerprint = after if after == before else None
+            self._save(months)
+            self._latest = (self.rollups, self.data_fingerprint)
+            return self._latest
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+            self.last_error = None
+        except Exception as e:
+            # Giữ bảng cũ (không khớp phiên bản mới -> dashboard tính trực tiếp), thử lại ở lần gọi sau
+            self.last_error = f"{type(e).__name__}: {e}"
+
+    def latest(self):
+        """
+        (DailyRollups, mã băm data.csv) của lần cập nhật xong gần nhất, không chờ. Nếu data.csv đã đổi
+        thì bắt đầu refresh() trong luồng nền (nếu chưa có); trong lúc đó mã băm trả về khác phiên bản
+        mới và người gọi tính trực tiếp từ dữ liệu.
+        """
+        latest = self._latest
+        try:
+            current = file_fingerprint(self.path)
+        except OSError:
+            return latest
+        if current != latest[1]:
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(
+                        target=self._refresh_in_background, name="cip-rollup-refresh", daemon=True
+                    )
+                    self._worker.start()
+        return latest
+
+    def wait(self, timeout=None):
+        """Chờ luồng nền của latest() (nếu có) chạy xong."""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "rows": len(self.rollups),
+            "months": len(self.rollups.months),
+            "devices": len(self.rollups.carried),
+            "data_fingerprint": self.data_fingerprint,
+            "resumed": self.resumed,
+            "rebuilds": self.rebuilds,
+            "appended_rows": self.appended_rows,
+            "refreshing": self._worker is not None and self._worker.is_alive(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from cip_cleaning import clean_data
+from data_cache import file_fingerprint, read_cached_frame, write_cached_frame
+from filter_index import FilterIndex
+
+DATA_PATH = "data.csv"
+# Chu kỳ kiểm tra data.csv / store có thay đổi không (chỉ os.stat + đọc manifest, rất rẻ)
+POLL_SECONDS = 5.0
+# File vừa được sửa trong khoảng này có thể đang ghi dở -> đợi lần kiểm tra sau
+SETTLE_SECONDS = 2.0
+# data.csv từ kích thước này trở lên được làm sạch theo từng phần (streaming_clean): đỉnh bộ nhớ
+# thấp hơn (~680 MB so với ~880 MB ở 1,2 triệu dòng) và chênh lệch tăng theo độ dài lịch sử
+STREAMING_MIN_BYTES = 64 * 2**20
+
+
+def csv_source(path=DATA_PATH):
+    """Nguồn dữ liệu mặc định: data.csv và mã băm nội dung (chỉ băm lại khi mtime/kích thước đổi)."""
+    return path, file_fingerprint(path)
+
+
+def clean_csv(path=DATA_PATH, streaming_min_bytes=STREAMING_MIN_BYTES):
+    """
+    Dữ liệu đã làm sạch của file CSV path. File lớn được làm sạch theo từng phần với bộ nhớ
+    giới hạn (kết quả giống hệt clean_data); nếu thiếu pyarrow, dữ liệu không theo thứ tự
+    thời gian hoặc các phần không ghép được (FALLBACK_ERRORS) thì làm sạch cả file trong bộ nhớ.
+    """
+    if os.path.getsize(path) >= streaming_min_bytes:
+        try:
+            # Import muộn: chỉ cần pyarrow khi làm sạch theo từng phần
+            from streaming_clean import FALLBACK_ERRORS, clean_csv_streaming
+        except ImportError:
+            pass
+        else:
+            try:
+                return clean_csv_streaming(path)
+            except FALLBACK_ERRORS:
+                pass
+    return clean_data(pd.read_csv(path))
+
+
+def build_clean_data(path, data_version):
+    """
+    Dữ liệu đã làm sạch của một phiên bản (mã băm) data.csv. Bản Parquet trong .cache/
+    giúp khởi động nguội không phải làm sạch lại; mã băm đổi thì cache tự động bị vô hiệu hóa.
+    """
+    df_clean = read_cached_frame(data_version)
+    if df_clean is not None:
+        return df_clean
+
+    df_clean = clean_csv(path)
+    write_cached_frame(data_version, df_clean)
+    return df_clean
+
+
+@dataclass(frozen=True)
+class DatasetSnapshot:
+    """
+    Một phiên bản dữ liệu đã làm sạch, dùng chung chỉ-đọc cho mọi phiên Streamlit / mọi request API.
+    Không ai sửa df tại chỗ: pandas dùng copy-on-write nên phiên nào thêm cột / gán giá trị
+    trên kết quả lọc sẽ chỉ sửa bản sao của mình.
+    """
+    version: str
+    path: str
+    df: pd.DataFrame
+    index: FilterIndex
+    loaded_at: float = field(default_factory=time.time)
+
+
+class SharedDataset:
+    """
+    Giữ một DatasetSnapshot cho cả tiến trình và một luồng nền theo dõi nguồn dữ liệu.
+    - source() -> (path, version): phiên bản hiện tại của nguồn (rẻ, gọi mỗi chu kỳ).
+    - build(path, version) -> DataFrame đã làm sạch (chậm, chỉ chạy trong luồng nền
+      hoặc ở lần tải đầu tiên).
+    Khi phiên bản đổi, dữ liệu mới được xây xong hoàn toàn rồi mới hoán đổi tham chiếu
+    (một phép gán), nên phiên đang chạy không bao giờ thấy dữ liệu xây dở hay phải chờ tải lại.
+    Nếu xây lỗi (vd. file đang ghi dở), giữ nguyên bản cũ và thử lại ở chu kỳ sau.
+    """
+
+    def __init__(self, source, build, poll_seconds=POLL_SECONDS, settle_seconds=SETTLE_SECONDS):
+        self.source = source
+        self.build = build
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self._snapshot = None
+        # Chỉ một lần xây tại một thời điểm (lần tải đầu tiên hoặc luồng nền)
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reloads = 0
+        self.last_error = None
+
+    def current(self):
+        """Snapshot hiện tại. Chỉ lần gọi đầu tiên (chưa có dữ liệu) phải chờ tải."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh(wait_for_settle=False)
+            snapshot = self._snapshot
+        return snapshot
+
+    def _settling(self, path):
+        """True nếu file nguồn vừa được sửa (có thể đang ghi dở)."""
+        try:
+            return time.time() - os.stat(path).st_mtime < self.settle_seconds
+        except OSError:
+            return True
+
+    def refresh(self, wait_for_settle=True):
+        """Xây lại và hoán đổi snapshot nếu phiên bản nguồn đã đổi. Trả về True nếu có hoán đổi."""
+        with self._build_lock:
+            try:
+                path, version = self.source()
+                snapshot = self._snapshot
+                if snapshot is not None and snapshot.version == version:
+                    return False
+                if wait_for_settle and snapshot is not None and self._settling(path):
+                    return False
+                df = self.build(path, version)
+                new_snapshot = DatasetSnapshot(version=version, path=path, df=df, index=FilterIndex(df))
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if self._snapshot is None:
+                    raise
+                return False
+            self._snapshot = new_snapshot
+            self.last_error = None
+            if snapshot is not None:
+                self.reloads += 1
+            return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.refresh()
+
+    def start(self):
+        """Bắt đầu luồng nền theo dõi nguồn dữ liệu (daemon, dừng cùng tiến trình)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="cip-dataset-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "path": snapshot.path if snapshot else None,
+            "rows": len(snapshot.df) if snapshot else 0,
+            "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.loaded_at)) if snapshot else None,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "poll_seconds": self.poll_seconds,
+        }
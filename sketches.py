@@ -0,0 +1,199 @@
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from filter_index import START_COLUMN
+
+# Số bin của histogram (thêm 2 bin tràn dưới/trên cho giá trị ngoài khoảng phân vị 0.1%-99.9%)
+SKETCH_BINS = 128
+EDGE_QUANTILES = (0.001, 0.999)
+# Số điểm tối đa vẽ trong stripplot; giới hạn thời gian render bất kể dữ liệu lớn đến đâu
+POINT_BUDGET = 2000
+# Lát dữ liệu nhiều hơn số dòng này thì boxplot "Tất cả" vẽ từ sketch thay vì từ từng dòng
+SKETCH_MIN_ROWS = 5000
+
+
+@dataclass
+class HistogramSketch:
+    """
+    Tóm tắt phân phối có thể gộp: số đếm theo bin (cạnh bin dùng chung cho cả cột), min, max.
+    Gộp hai sketch = cộng số đếm, lấy min của min và max của max.
+    """
+    counts: np.ndarray
+    edges: np.ndarray
+    vmin: float = np.inf
+    vmax: float = -np.inf
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def merge(self, other):
+        return HistogramSketch(
+            self.counts + other.counts, self.edges, min(self.vmin, other.vmin), max(self.vmax, other.vmax)
+        )
+
+    def quantile(self, q):
+        """Phân vị xấp xỉ (nội suy tuyến tính trong bin), sai số tối đa một độ rộng bin."""
+        n = self.count
+        if n == 0:
+            return np.nan
+        if q <= 0:
+            return self.vmin
+        if q >= 1:
+            return self.vmax
+        # Cạnh đầy đủ: bin tràn dưới [vmin, e0], các bin trong, bin tràn trên [e_last, vmax]
+        bounds = np.concatenate([[min(self.vmin, self.edges[0])], self.edges, [max(self.vmax, self.edges[-1])]])
+        cum = np.cumsum(self.counts)
+        target = q * n
+        i = int(np.searchsorted(cum, target, side="left"))
+        below = cum[i - 1] if i > 0 else 0
+        frac = (target - below) / self.counts[i]
+        value = bounds[i] + frac * (bounds[i + 1] - bounds[i])
+        return float(np.clip(value, self.vmin, self.vmax))
+
+    def box_stats(self, label):
+        """Thống kê boxplot (định dạng của Axes.bxp): tứ phân vị, râu 1.5 IQR kẹp trong [min, max]."""
+        q1, med, q3 = (self.quantile(q) for q in (0.25, 0.5, 0.75))
+        iqr = q3 - q1
+        return {
+            "label": label,
+            "q1": q1,
+            "med": med,
+            "q3": q3,
+            "whislo": max(self.vmin, q1 - 1.5 * iqr),
+            "whishi": min(self.vmax, q3 + 1.5 * iqr),
+            "fliers": [],
+            "min": self.vmin,
+            "max": self.vmax,
+            "n": self.count,
+        }
+
+
+class _ColumnSketches:
+    """Histogram của một cột cho mọi đoạn (nhóm, tháng), xây một lần bằng np.bincount."""
+
+    def __init__(self, values, segment_of_row, n_segments, bins):
+        finite = np.isfinite(values)
+        if finite.any():
+            lo, hi = np.quantile(values[finite], EDGE_QUANTILES)
+        else:
+            lo, hi = 0.0, 1.0
+        if hi <= lo:
+            hi = lo + 1.0
+        self.edges = np.linspace(lo, hi, bins + 1)
+        self.n_bins = bins + 2
+        self.values = values
+
+        bin_of_row = self.bin_of(values)
+        keys = segment_of_row[finite] * self.n_bins + bin_of_row[finite]
+        self.counts = np.bincount(keys, minlength=n_segments * self.n_bins).reshape(n_segments, self.n_bins)
+        self.counts = self.counts.astype(np.int32)
+
+        per_segment = pd.Series(values[finite]).groupby(segment_of_row[finite])
+        self.seg_min = np.full(n_segments, np.inf)
+        self.seg_max = np.full(n_segments, -np.inf)
+        if finite.any():
+            mins, maxs = per_segment.min(), per_segment.max()
+            self.seg_min[mins.index.to_numpy()] = mins.to_numpy()
+            self.seg_max[maxs.index.to_numpy()] = maxs.to_numpy()
+
+    def bin_of(self, values):
+        """0 = tràn dưới, 1..bins = bin trong, bins+1 = tràn trên."""
+        return np.searchsorted(self.edges, values, side="right")
+
+    def from_segments(self, s0, s1):
+        return HistogramSketch(
+            self.counts[s0:s1].sum(axis=0).astype(np.int64), self.edges,
+            float(self.seg_min[s0:s1].min(initial=np.inf)), float(self.seg_max[s0:s1].max(initial=-np.inf)),
+        )
+
+    def from_rows(self, a, b):
+        values = self.values[a:b]
+        values = values[np.isfinite(values)]
+        counts = np.bincount(self.bin_of(values), minlength=self.n_bins).astype(np.int64)
+        if len(values) == 0:
+            return HistogramSketch(counts, self.edges)
+        return HistogramSketch(counts, self.edges, float(values.min()), float(values.max()))
+
+
+class DistributionSketches:
+    """
+    Sketch phân phối theo (Line, Circuit, Thiết bị) x tháng cho dữ liệu đã làm sạch, dùng cùng
+    thứ tự dòng với FilterIndex: mỗi thiết bị là một đoạn dòng, trong đó mỗi tháng lại là một
+    đoạn con liên tiếp. Khi truy vấn một khoảng ngày, các tháng nằm trọn trong khoảng được gộp
+    từ sketch, chỉ các dòng của (tối đa) hai tháng ở hai đầu được đọc lại.
+    Histogram của mỗi cột được xây khi cột đó được yêu cầu lần đầu.
+    """
+
+    def __init__(self, df, index, bins=SKETCH_BINS):
+        self.df = df
+        self.index = index
+        self.bins = bins
+        n_rows = len(df)
+
+        starts = df[START_COLUMN]
+        month = (starts.dt.year * 12 + starts.dt.month - 1).fillna(-1).to_numpy(dtype=np.int64)
+        group_ids = np.repeat(np.arange(len(index.group_lo)), index.group_hi - index.group_lo)
+        changed = np.zeros(n_rows, dtype=bool)
+        if n_rows:
+            changed[0] = True
+            changed[1:] = (group_ids[1:] != group_ids[:-1]) | (month[1:] != month[:-1])
+        self.seg_lo = np.flatnonzero(changed)
+        self.seg_hi = np.append(self.seg_lo[1:], n_rows)
+        self.segment_of_row = np.cumsum(changed) - 1
+        # Các đoạn (tháng) của nhóm g: self.seg_lo[group_seg_lo[g]:group_seg_hi[g]]
+        self.group_seg_lo = np.searchsorted(self.seg_lo, index.group_lo)
+        self.group_seg_hi = np.searchsorted(self.seg_lo, index.group_hi)
+
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def _column(self, column):
+        with self._lock:
+            sketches = self._columns.get(column)
+            if sketches is None:
+                values = self.df[column].to_numpy(dtype=float, na_value=np.nan)
+                sketches = _ColumnSketches(values, self.segment_of_row, len(self.seg_lo), self.bins)
+                self._columns[column] = sketches
+            return sketches
+
+    def group_sketch(self, column, group_id, a, b):
+        """Sketch của cột cho các dòng a..b-1 của nhóm group_id (a, b lấy từ FilterIndex.window)."""
+        sketches = self._column(column)
+        lo_seg, hi_seg = self.group_seg_lo[group_id], self.group_seg_hi[group_id]
+        # Các tháng nằm trọn trong [a, b)
+        s0 = lo_seg + np.searchsorted(self.seg_lo[lo_seg:hi_seg], a, side="left")
+        s1 = lo_seg + np.searchsorted(self.seg_hi[lo_seg:hi_seg], b, side="right")
+        if s1 <= s0:
+            return sketches.from_rows(a, b)
+        sketch = sketches.from_segments(s0, s1)
+        sketch = sketch.merge(sketches.from_rows(a, self.seg_lo[s0]))
+        return sketch.merge(sketches.from_rows(self.seg_hi[s1 - 1], b))
+
+    def device_sketches(self, column, bounds, line, circuit):
+        """[(Thiết bị, HistogramSketch)] của mọi thiết bị có dữ liệu thuộc (line, circuit) trong khoảng ngày."""
+        result = []
+        for device, group_id in self.index.tree.get(line, {}).get(circuit, []):
+            a, b = bounds[0][group_id], bounds[1][group_id]
+            if b > a:
+                sketch = self.group_sketch(column, group_id, a, b)
+                if sketch.count:
+                    result.append((device, sketch))
+        return result
+
+
+def downsample_points(values, budget=POINT_BUDGET):
+    """
+    Giảm số điểm của một phân phối xuống tối đa budget mà giữ nguyên hình dạng: lấy các thống kê
+    thứ tự cách đều nhau (luôn gồm min và max), nên hàm phân phối thực nghiệm gần như không đổi.
+    Trả về mảng giá trị (NaN bị bỏ).
+    """
+    values = np.asarray(values, dtype=float)
+    values = np.sort(values[np.isfinite(values)])
+    if len(values) <= budget:
+        return values
+    positions = np.unique(np.linspace(0, len(values) - 1, budget).round().astype(np.int64))
+    return values[positions]
@@ -0,0 +1,304 @@
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from cip_cleaning import GROUP_COLUMNS, START_COLUMN, clean_rows
+from csv_tail import CsvTail
+from data_cache import CACHE_DIR
+
+DATA_PATH = "data.csv"
+SPC_STATE_PATH = os.path.join(CACHE_DIR, "spc_state.json")
+# Tăng khi đổi cách tính hoặc cấu trúc trạng thái -> trạng thái cũ bị bỏ, tính lại từ đầu
+SPC_STATE_VERSION = 2
+
+# Các thông số theo dõi bằng biểu đồ kiểm soát
+SPC_COLUMNS = [
+    "Độ dẫn điện Xút Bắt đầu",
+    "Độ dẫn điện Xút Kết thúc",
+    "Nhiệt độ Xút Bắt đầu",
+    "Nhiệt độ Xút Kết thúc",
+    "Nhiệt độ Nước nóng Bắt đầu",
+    "Nhiệt độ Nước nóng Kết thúc",
+    "Lưu lượng hồi (l/h)",
+]
+# Hệ số làm trơn EWMA và độ rộng giới hạn kiểm soát (số sigma)
+EWMA_LAMBDA = 0.2
+LIMIT_SIGMA = 3.0
+# Số điểm liên tiếp cùng một phía đường trung tâm thì coi là mất kiểm soát
+RUN_LENGTH = 8
+# Số điểm tối thiểu trước khi có giới hạn kiểm soát (và bắt đầu cảnh báo)
+MIN_BASELINE = 10
+# Hằng số d2 của biểu đồ I-MR (khoảng trượt 2 điểm): sigma = MR trung bình / d2
+D2 = 1.128
+
+FLAG_LIMIT = f"Ngoài {LIMIT_SIGMA:g}σ"
+FLAG_EWMA = "EWMA ngoài giới hạn"
+FLAG_RUN = f"{RUN_LENGTH} điểm cùng phía"
+
+
+@dataclass
+class ChartState:
+    """
+    Thống kê tích lũy của một thông số trên một thiết bị (biểu đồ I-MR + EWMA), cập nhật O(1)
+    mỗi lần CIP: trung bình/phương sai (Welford), tổng khoảng trượt, EWMA, độ dài chuỗi cùng phía.
+    Mỗi điểm được so với giới hạn tính từ các điểm trước nó.
+    """
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    last: float = None
+    mr_sum: float = 0.0
+    mr_n: int = 0
+    ewma: float = None
+    run_side: int = 0
+    run_length: int = 0
+    last_at: str = None
+    flags: list = field(default_factory=list)
+    alarms: int = 0
+    last_alarm_at: str = None
+
+    @property
+    def sigma(self):
+        """Sigma ước lượng từ khoảng trượt trung bình (không bị ảnh hưởng bởi trôi chậm như độ lệch chuẩn)."""
+        return self.mr_sum / self.mr_n / D2 if self.mr_n else np.nan
+
+    def limits(self):
+        """(trung tâm, sigma) nếu đủ MIN_BASELINE điểm và sigma > 0, ngược lại None."""
+        sigma = self.sigma
+        if self.n < MIN_BASELINE or not sigma > 0:
+            return None
+        return self.mean, sigma
+
+    def update(self, value, at=None):
+        limits = self.limits()
+        ewma = value if self.ewma is None else EWMA_LAMBDA * value + (1 - EWMA_LAMBDA) * self.ewma
+        flags = []
+        if limits is not None:
+            center, sigma = limits
+            self.run_side, self.run_length = next_run(value, center, self.run_side, self.run_length)
+            flags = check_point(value, ewma, center, sigma, self.run_length)
+
+        if self.last is not None:
+            self.mr_sum += abs(value - self.last)
+            self.mr_n += 1
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        self.last = value
+        self.ewma = ewma
+        self.last_at = at
+        self.flags = flags
+        if flags:
+            self.alarms += 1
+            self.last_alarm_at = at
+
+
+def next_run(value, center, run_side, run_length):
+    """(phía, độ dài chuỗi) sau điểm value: cùng phía với chuỗi trước thì nối dài, nằm trên đường trung tâm thì ngắt."""
+    side = 1 if value > center else -1 if value < center else 0
+    if not side:
+        return 0, 0
+    return side, run_length + 1 if side == run_side else 1
+
+
+def check_point(value, ewma, center, sigma, run_length):
+    """Các quy tắc mất kiểm soát của một điểm so với (trung tâm, sigma)."""
+    flags = []
+    if abs(value - center) > LIMIT_SIGMA * sigma:
+        flags.append(FLAG_LIMIT)
+    # Giới hạn EWMA tiệm cận: L * sigma * sqrt(lambda / (2 - lambda))
+    if abs(ewma - center) > LIMIT_SIGMA * sigma * np.sqrt(EWMA_LAMBDA / (2 - EWMA_LAMBDA)):
+        flags.append(FLAG_EWMA)
+    if run_length >= RUN_LENGTH:
+        flags.append(FLAG_RUN)
+    return flags
+
+
+def control_series(state, times, values):
+    """
+    Dữ liệu vẽ biểu đồ kiểm soát cho một đoạn lịch sử (values theo thứ tự thời gian), so với
+    giới hạn hiện tại của state (giới hạn cố định từ toàn bộ lịch sử). EWMA bắt đầu từ đường trung tâm.
+    DataFrame: time, value, ewma, flags (list). None nếu state chưa có giới hạn.
+    """
+    limits = state.limits()
+    if limits is None:
+        return None
+    center, sigma = limits
+    records = []
+    ewma, run_side, run_length = center, 0, 0
+    for at, value in zip(times, values):
+        if not np.isfinite(value):
+            continue
+        ewma = EWMA_LAMBDA * value + (1 - EWMA_LAMBDA) * ewma
+        run_side, run_length = next_run(value, center, run_side, run_length)
+        records.append((at, value, ewma, check_point(value, ewma, center, sigma, run_length)))
+    return pd.DataFrame(records, columns=["time", "value", "ewma", "flags"])
+
+
+class SpcOrderError(ValueError):
+    """Dòng mới bắt đầu trước lần CIP cuối cùng đã đưa vào biểu đồ của cùng thiết bị (cần tính lại từ đầu)."""
+
+
+class SpcEngine:
+    """
+    ChartState theo (Line, Circuit, Thiết bị, thông số), cập nhật theo từng lần CIP.
+    Giới hạn, EWMA và chuỗi cùng phía của mỗi điểm phụ thuộc vào các điểm trước nó, nên kết quả
+    chỉ đúng khi các lần CIP của một thiết bị được đưa vào theo thứ tự thời gian bắt đầu.
+    """
+
+    def __init__(self, states=None):
+        self.states = states or {}
+
+    def update_rows(self, rows):
+        """
+        Cập nhật từ các dòng đã làm sạch (clean_rows), sắp xếp theo thời gian bắt đầu trước khi
+        đưa vào (mỗi ô hợp lệ một lần ChartState.update, O(1)). Trả về số dòng đã xử lý.
+        SpcOrderError (engine không đổi) nếu có dòng bắt đầu trước lần CIP cuối cùng đã đưa vào
+        biểu đồ của cùng thiết bị: kết quả khi đó sẽ khác với tính lại theo đúng thứ tự.
+        """
+        rows = rows[rows[START_COLUMN].notna()].sort_values(START_COLUMN, kind="stable")
+        columns = [col for col in SPC_COLUMNS if col in rows.columns]
+        keys = list(zip(*(rows[col].tolist() for col in GROUP_COLUMNS)))
+        times = rows[START_COLUMN].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+        values = rows[columns].to_numpy(dtype=float, na_value=np.nan)
+        states = self.states
+        # Dòng sớm nhất của mỗi thiết bị là dòng đầu tiên sau khi sắp xếp
+        first_at = {}
+        for key, at in zip(keys, times):
+            first_at.setdefault(key, at)
+        for key, at in first_at.items():
+            for col in columns:
+                state = states.get(key + (col,))
+                if state is not None and state.last_at is not None and at < state.last_at:
+                    raise SpcOrderError(
+                        f"Dòng mới bắt đầu lúc {at} trước lần CIP cuối cùng ({state.last_at}) của {key}"
+                    )
+        for key, at, row in zip(keys, times, values.tolist()):
+            for col, value in zip(columns, row):
+                if value != value:  # NaN
+                    continue
+                state = states.get(key + (col,))
+                if state is None:
+                    state = states[key + (col,)] = ChartState()
+                state.update(value, at)
+        return len(rows)
+
+    def get(self, line, circuit, device, column):
+        return self.states.get((line, circuit, device, column))
+
+    def table(self, line=None, circuit=None, column=None):
+        """Bảng trạng thái hiện tại (lọc theo line / circuit / thông số), thiết bị đang cảnh báo lên đầu."""
+        records = []
+        for (s_line, s_circuit, device, col), state in self.states.items():
+            if (line is not None and s_line != line) or (circuit is not None and s_circuit != circuit):
+                continue
+            if column is not None and col != column:
+                continue
+            limits = state.limits()
+            center, sigma = limits if limits is not None else (np.nan, np.nan)
+            records.append({
+                "Line": s_line, "Circuit": s_circuit, "Thiết bị": device, "Thông số": col,
+                "Số lần CIP": state.n, "Giá trị gần nhất": state.last, "EWMA": state.ewma,
+                "Trung tâm": center, "LCL": center - LIMIT_SIGMA * sigma, "UCL": center + LIMIT_SIGMA * sigma,
+                "Cảnh báo": ", ".join(state.flags), "Số lần cảnh báo": state.alarms,
+                "Lần CIP gần nhất": state.last_at,
+            })
+        table = pd.DataFrame(records)
+        if table.empty:
+            return table
+        table = table.sort_values(["Cảnh báo", "Số lần cảnh báo"], ascending=False, kind="stable")
+        return table.round(3).reset_index(drop=True)
+
+    def to_json(self):
+        return [{"key": list(key), **asdict(state)} for key, state in self.states.items()]
+
+    @classmethod
+    def from_json(cls, records):
+        return cls({tuple(record.pop("key")): ChartState(**record) for record in records})
+
+
+class SpcTracker:
+    """
+    Giữ SpcEngine khớp với data.csv cho cả tiến trình: chỉ các dòng mới ghi thêm (csv_tail.CsvTail)
+    được đưa vào engine; data.csv bị ghi lại, hoặc dòng mới cũ hơn lần CIP cuối cùng của thiết bị
+    (SpcOrderError), thì tính lại từ đầu. Cả hai trường hợp dùng clean_rows nên cho cùng kết quả.
+    Trạng thái engine và vị trí đã đọc
+    được lưu vào state_path sau mỗi lần cập nhật, nên khởi động lại không phải đọc lại lịch sử.
+    """
+
+    def __init__(self, path=DATA_PATH, state_path=SPC_STATE_PATH):
+        self.path = path
+        self.state_path = state_path
+        self.engine = SpcEngine()
+        self._tail = CsvTail(path)
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.appended_rows = 0
+        self.resumed = self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("version") != SPC_STATE_VERSION or state.get("path") != os.path.abspath(self.path):
+            return False
+        self.engine = SpcEngine.from_json(state["charts"])
+        self._tail = CsvTail(self.path, state["tail"])
+        return True
+
+    def _save(self):
+        state = {
+            "version": SPC_STATE_VERSION,
+            "path": os.path.abspath(self.path),
+            "tail": self._tail.state(),
+            "charts": self.engine.to_json(),
+        }
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _rebuild(self, frame):
+        # clean_rows chứ không phải clean_data: clean_data thu gọn kiểu số (float32), các giá trị
+        # sẽ lệch nhỏ so với các dòng ghi thêm và trạng thái sau khi tính lại khác khi cập nhật dần
+        rows, _ = clean_rows(frame)
+        engine = SpcEngine()
+        engine.update_rows(rows)
+        self.engine = engine
+        self.rebuilds += 1
+
+    def refresh(self):
+        """Đưa các dòng mới của data.csv (nếu có) vào engine. Chỉ tốn một os.stat khi file không đổi."""
+        with self._lock:
+            kind, frame = self._tail.poll()
+            if kind == "appended":
+                rows, _ = clean_rows(frame)
+                try:
+                    self.appended_rows += self.engine.update_rows(rows)
+                except SpcOrderError:
+                    self._tail = CsvTail(self.path)
+                    kind, frame = self._tail.poll()
+            if kind == "rewritten":
+                self._rebuild(frame)
+            if kind != "unchanged":
+                self._save()
+            return self.engine
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "state_path": self.state_path,
+            "offset": self._tail.offset,
+            "charts": len(self.engine.states),
+            "resumed": self.resumed,
+            "rebuilds": self.rebuilds,
+            "appended_rows": self.appended_rows,
+        }
@@ -0,0 +1,226 @@
+"""
+Làm sạch dữ liệu CIP theo từng phần (chunk) với bộ nhớ giới hạn, cho lịch sử rất lớn.
+
+Mỗi phần của data.csv được làm sạch theo từng dòng (clean_rows) rồi ghi thẳng ra store
+Parquet (clean_store/part-*.parquet). time_gap_days cần lần CIP kế tiếp của cùng thiết bị,
+có thể nằm ở phần sau, nên với mỗi (Line, Circuit, Thiết bị) ta giữ lại lần CIP cuối cùng
+(thời gian kết thúc của nó) và chỉ ghi dòng đó khi đã biết lần bắt đầu kế tiếp.
+Bộ nhớ chỉ phụ thuộc vào kích thước phần + số thiết bị, không phụ thuộc độ dài lịch sử.
+
+Yêu cầu: với mỗi thiết bị, các lần CIP xuất hiện trong file theo thứ tự thời gian bắt đầu
+(như khi Google Sheet được ghi thêm dòng). Nếu không, StreamOrderError được báo
+và cần dùng clean_data() trong bộ nhớ.
+
+Kết quả đọc lại bằng read_clean_store() giống hệt clean_data(pd.read_csv(...)).
+
+Chạy: python streaming_clean.py [--data data.csv] [--output clean_store] [--chunksize 100000] [--verify]
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cip_cleaning import GROUP_COLUMNS, SORT_COLUMNS, START_COLUMN, add_time_gaps, clean_data, clean_rows, finish_clean
+from cip_parsing import DURATION_COLUMNS, SAMPLE_SIZE
+from data_cache import CACHE_DIR
+
+DATA_PATH = "data.csv"
+CLEAN_STORE_PATH = "clean_store"
+MANIFEST_NAME = "_manifest.json"
+DEFAULT_CHUNKSIZE = 100_000
+
+# Nhãn dòng gốc trong file CSV, giữ lại để khôi phục đúng index và thứ tự của các dòng trùng khóa
+ROW_COLUMN = "_row"
+
+# pd.read_csv đoán kiểu riêng cho từng phần: Circuit "4" ở phần này (int) và "2A" ở phần sau (chuỗi)
+# không ghép được thành một cột Parquet, còn một phần toàn "0" ở cột thời lượng thành int và bị coi là
+# outlier (== 0) trong khi đọc cả file thì vẫn là chuỗi. Các cột này luôn được đọc dạng chuỗi như khi
+# đọc cả file; kiểu số của cột khóa (nếu cả file đều là số) được khôi phục trong read_clean_store()
+CHUNK_DTYPES = {col: str for col in GROUP_COLUMNS + DURATION_COLUMNS}
+
+# Lỗi làm sạch theo từng phần mà clean_data() trong bộ nhớ vẫn xử lý được:
+# StreamOrderError (là ValueError) và kiểu dữ liệu không ghép được giữa các phần (ArrowException)
+FALLBACK_ERRORS = (ValueError, pa.ArrowException)
+
+
+class StreamOrderError(ValueError):
+    """Một thiết bị có lần CIP sớm hơn lần CIP đã xử lý ở phần trước."""
+
+
+def _merge_reports(totals, reports):
+    """Cộng dồn ParseReport của từng phần vào totals (theo tên cột)."""
+    for report in reports:
+        merged = totals.setdefault(report.column, {"column": report.column, "total": 0, "malformed": 0, "sample": []})
+        merged["total"] += report.total
+        merged["malformed"] += report.malformed
+        merged["sample"] = (merged["sample"] + report.sample)[:SAMPLE_SIZE]
+    return totals
+
+
+def _check_order(carried, df_clean):
+    """Báo lỗi nếu phần mới có lần CIP sớm hơn lần CIP cuối đang giữ của cùng thiết bị."""
+    earliest = df_clean.groupby(GROUP_COLUMNS)[START_COLUMN].min().rename("earliest")
+    last = carried.set_index(GROUP_COLUMNS)[START_COLUMN].rename("last")
+    joined = pd.concat([earliest, last], axis=1, join="inner")
+    late = joined[joined["earliest"] < joined["last"]]
+    if not late.empty:
+        key = "/".join(str(v) for v in late.index[0])
+        raise StreamOrderError(
+            f"Thiết bị {key} có lần CIP lúc {late['earliest'].iloc[0]} sau khi đã xử lý lần CIP "
+            f"lúc {late['last'].iloc[0]}; dữ liệu không theo thứ tự thời gian, hãy dùng clean_data()."
+        )
+
+
+def _split_carried(df_clean):
+    """
+    Tách df (đã qua add_time_gaps) thành (các dòng đã đủ thông tin, các dòng cần giữ lại):
+    dòng giữ lại là lần CIP cuối (có thời gian bắt đầu) của mỗi thiết bị, vì lần kế tiếp
+    của nó có thể nằm ở phần sau. Dòng thiếu thời gian bắt đầu hoặc thiếu khóa nhóm
+    luôn có time_gap_days = NaN nên ghi ngay được.
+    """
+    has_start = df_clean[START_COLUMN].notna() & df_clean[GROUP_COLUMNS].notna().all(axis=1)
+    carried_index = df_clean[has_start].groupby(GROUP_COLUMNS, sort=False).tail(1).index
+    return df_clean.drop(index=carried_index), df_clean.loc[carried_index]
+
+
+def _restore_key_dtypes(df):
+    """
+    Cột khóa được đọc dạng chuỗi (CHUNK_DTYPES); nếu mọi giá trị của cột là số thì chuyển về số
+    như pd.read_csv khi đọc cả file (int64, hoặc float64 nếu có ô trống). Sửa tại chỗ.
+    """
+    for col in GROUP_COLUMNS:
+        if col in df.columns:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def _write_part(root, part, df):
+    path = os.path.join(root, f"part-{part:05d}.parquet")
+    df.rename_axis(ROW_COLUMN).reset_index().to_parquet(path, index=False)
+
+
+def stream_clean(path=DATA_PATH, root=CLEAN_STORE_PATH, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Đọc path theo từng phần chunksize dòng, làm sạch và ghi ra store root.
+    Store được ghi vào thư mục tạm rồi hoán đổi. Trả về manifest (số dòng, số phần, parse_reports).
+    """
+    tmp_root = f"{root}.tmp"
+    old_root = f"{root}.old"
+    for stale in (tmp_root, old_root):
+        if os.path.exists(stale):
+            shutil.rmtree(stale)
+    os.makedirs(tmp_root)
+
+    carried = None
+    reports = {}
+    rows = parts = 0
+    try:
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=CHUNK_DTYPES):
+            df_clean, chunk_reports = clean_rows(chunk)
+            del chunk
+            _merge_reports(reports, chunk_reports)
+            if carried is not None:
+                _check_order(carried, df_clean)
+                df_clean = pd.concat([carried, df_clean])
+            done, carried = _split_carried(add_time_gaps(df_clean))
+            if len(done):
+                _write_part(tmp_root, parts, done)
+                rows += len(done)
+                parts += 1
+    except Exception:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        raise
+
+    if carried is not None and len(carried):
+        # Lần CIP cuối của mỗi thiết bị: không có lần kế tiếp (next_start đã là NaT)
+        _write_part(tmp_root, parts, carried)
+        rows += len(carried)
+        parts += 1
+
+    manifest = {
+        "rows": rows,
+        "parts": parts,
+        "chunksize": chunksize,
+        "parse_reports": [r for r in reports.values() if r["malformed"]],
+    }
+    with open(os.path.join(tmp_root, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(root):
+        os.rename(root, old_root)
+    os.rename(tmp_root, root)
+    if os.path.exists(old_root):
+        shutil.rmtree(old_root)
+    return manifest
+
+
+def read_clean_store(root=CLEAN_STORE_PATH):
+    """
+    Đọc lại toàn bộ store thành DataFrame giống clean_data(): cùng index, thứ tự dòng,
+    kiểu dữ liệu (cột int ở phần này / float ở phần khác được nâng thành float như khi
+    đọc cả file một lần, rồi áp dụng cùng schema gọn) và df.attrs.
+    """
+    with open(os.path.join(root, MANIFEST_NAME), encoding="utf-8") as f:
+        manifest = json.load(f)
+    paths = sorted(glob.glob(os.path.join(root, "part-*.parquet")))
+    if not paths:
+        return pd.DataFrame()
+    table = pa.concat_tables([pq.read_table(p) for p in paths], promote_options="permissive")
+    # Mỗi cột một block và giải phóng bộ nhớ Arrow trong lúc chuyển -> không giữ hai bản cùng lúc
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    # Sắp xếp một lần theo khóa rồi theo thứ tự gốc trong file -> các dòng trùng khóa giữ thứ tự
+    # như sắp xếp ổn định của clean_data()
+    df = df.sort_values(by=SORT_COLUMNS + [ROW_COLUMN], kind="stable")
+    df.index = pd.Index(df.pop(ROW_COLUMN).to_numpy())
+    return finish_clean(_restore_key_dtypes(df), manifest["parse_reports"])
+
+
+def clean_csv_streaming(path=DATA_PATH, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Như clean_data(pd.read_csv(path)) nhưng không bao giờ giữ toàn bộ dữ liệu thô trong bộ nhớ:
+    stream_clean() vào một store tạm trong .cache/ rồi read_clean_store(). Kết quả giống hệt;
+    StreamOrderError nếu dữ liệu không theo thứ tự thời gian.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="clean_store_", dir=CACHE_DIR) as tmp:
+        root = os.path.join(tmp, "store")
+        stream_clean(path, root, chunksize)
+        return read_clean_store(root)
+
+
+def verify(path=DATA_PATH, root=CLEAN_STORE_PATH):
+    """So sánh store với clean_data() trong bộ nhớ (chỉ dùng được khi dữ liệu vừa bộ nhớ)."""
+    expected = clean_data(pd.read_csv(path))
+    actual = read_clean_store(root)
+    pd.testing.assert_frame_equal(actual, expected)
+    assert actual.attrs["parse_reports"] == expected.attrs["parse_reports"]
+    assert actual.attrs["memory_report"] == expected.attrs["memory_report"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Làm sạch dữ liệu CIP theo từng phần với bộ nhớ giới hạn")
+    parser.add_argument("--data", default=DATA_PATH, help="File CSV dữ liệu thô")
+    parser.add_argument("--output", default=CLEAN_STORE_PATH, help="Thư mục store Parquet đã làm sạch")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Số dòng mỗi phần")
+    parser.add_argument("--verify", action="store_true", help="So sánh với clean_data() trong bộ nhớ")
+    args = parser.parse_args()
+
+    manifest = stream_clean(args.data, args.output, args.chunksize)
+    print(f"Đã ghi {manifest['rows']} dòng ({manifest['parts']} phần) vào {args.output}/")
+    if args.verify:
+        verify(args.data, args.output)
+        print("Kết quả giống hệt clean_data().")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# Các module của dashboard nằm ở thư mục gốc của repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COLUMNS = [
+    "Thiết bị", "Line", "Circuit", "Chương trình CIP", "Lưu lượng hồi (l/h)",
+    "Tổng thời gian bước Xút", "Độ dẫn điện Xút Bắt đầu", "Độ dẫn điện Xút Kết thúc",
+    "Nhiệt độ Xút Bắt đầu", "Nhiệt độ Xút Kết thúc", "Tổng thời gian bước nước nóng",
+    "Nhiệt độ Nước nóng Bắt đầu", "Nhiệt độ Nước nóng Kết thúc",
+    "Thời gian Bắt đầu CIP", "Thời gian Kết thúc CIP", "CIP kế tiếp",
+]
+
+# (Thiết bị, Line, Circuit, Bắt đầu, thời lượng (phút), Lưu lượng hồi, bước Xút, bước nước nóng),
+# theo thứ tự ghi vào Google Sheet (tăng dần theo thời gian bắt đầu). Gồm: hai Line, Circuit "1"
+# trùng tên ở hai Line, khoảng cách > 5 ngày, hai lần CIP trong một ngày, dòng outlier (0 ở lưu lượng
+# hoặc thời gian bước), ô thời gian sai định dạng, và dữ liệu trải qua ranh giới tháng.
+CIP_RUNS = [
+    ("T1", "L1", 1, "28/01/24 08:00", 60, 15000, "0:30", "0:06"),
+    ("T2", "L1", 1, "28/01/24 09:10", 75, 14200, "0:31", "0:05"),
+    ("T3", "L1", 2, "29/01/24 10:00", 70, 20100, "0:36", "0:06"),
+    ("T4", "L2", 1, "29/01/24 13:30", 65, 18000, "0:33", "0:07"),
+    ("T1", "L1", 1, "31/01/24 07:45", 62, 15100, "0:30", "0:06"),
+    ("T2", "L1", 1, "01/02/24 09:00", 80, 0, "0:31", "0:05"),
+    ("T3", "L1", 2, "01/02/24 11:20", 68, 19800, "0:35", "0:06"),
+    ("T4", "L2", 1, "02/02/24 14:00", 66, 18300, "0:00", "0:07"),
+    ("T2", "L1", 1, "02/02/24 16:00", 77, 14500, "0:32", "0:05"),
+    ("T1", "L1", 1, "03/02/24 08:10", 61, 14900, "0:29", "0:06"),
+    ("T1", "L1", 1, "03/02/24 19:00", 59, 15300, "0:30", "0:06"),
+    ("T4", "L2", 1, "05/02/24 13:00", 64, 17900, "0:34", "0:07"),
+    ("T3", "L1", 2, "09/02/24 10:30", 72, 20300, "0:36", "0:00"),
+    ("T2", "L1", 1, "10/02/24 09:40", 79, 14100, "0:31", "0:05"),
+    ("T1", "L1", 1, "11/02/24 08:00", 63, 15200, "0:31", "0:06"),
+    ("T3", "L1", 2, "12/02/24 10:15", 71, 20000, "0:37", "0:06"),
+    ("T4", "L2", 1, "13/02/24 25:00", 65, 18100, "0:33", "0:07"),
+    ("T4", "L2", 1, "14/02/24 13:20", 67, 18200, "0:33", "0:07"),
+    ("T2", "L1", 1, "15/02/24 09:05", 76, 14400, "0:32", "0:05"),
+    ("T1", "L1", 1, "16/02/24 08:20", 60, 15000, "0:30", "0:06"),
+    ("T3", "L1", 2, "16/02/24 10:40", 69, 19900, "0:36", "0:06"),
+    ("T1", "L1", 1, "20/02/24 08:05", 62, 15050, "0:30", "0:06"),
+    ("T4", "L2", 1, "29/02/24 23:30", 70, 18400, "0:34", "0:07"),
+    ("T2", "L1", 1, "01/03/24 09:30", 78, 14300, "0:31", "0:05"),
+    ("T3", "L1", 2, "02/03/24 10:00", 73, 20200, "0:35", "0:06"),
+    ("T1", "L1", 1, "02/03/24 08:00", 61, 15150, "0:31", "0:06"),
+    ("T4", "L2", 1, "04/03/24 13:10", 66, 18150, "0:33", "0:07"),
+    ("T1", "L1", 1, "06/03/24 08:30", 60, 14950, "0:30", "0:06"),
+]
+
+TIMESTAMP_FORMAT = "%d/%m/%y %H:%M"
+
+
+def make_raw_frame(runs=CIP_RUNS):
+    """DataFrame thô giống pd.read_csv("data.csv"); các thông số đo được suy ra từ số thứ tự dòng."""
+    records = []
+    for i, (device, line, circuit, start, minutes, flow, xut, nuoc_nong) in enumerate(runs):
+        start_ts = pd.to_datetime(start, format=TIMESTAMP_FORMAT, errors="coerce")
+        if pd.isna(start_ts):
+            end = next_due = ""
+        else:
+            end_ts = start_ts + pd.Timedelta(minutes=minutes)
+            end = end_ts.strftime(TIMESTAMP_FORMAT)
+            next_due = (end_ts + pd.Timedelta(days=5)).strftime(TIMESTAMP_FORMAT)
+        wobble = (i * 7) % 5
+        records.append([
+            device, line, circuit, "Full", flow, xut,
+            36.0 + wobble * 0.3, 37.0 + wobble * 0.2, 80.0 + wobble, 88.0 + wobble * 0.5, nuoc_nong,
+            88.5 + wobble * 0.4, 95.0 + wobble * 0.3, start, end, next_due,
+        ])
+    return pd.DataFrame(records, columns=COLUMNS)
+
+
+def write_csv(frame, path, append=False):
+    """Ghi (hoặc ghi thêm) frame vào CSV như fetch_sheet_data.py; luôn đổi mtime để CsvTail thấy thay đổi."""
+    previous = os.stat(path).st_mtime_ns if append else 0
+    frame.to_csv(path, index=False, header=not append, mode="a" if append else "w")
+    stat = os.stat(path)
+    mtime_ns = max(stat.st_mtime_ns, previous + 1_000_000)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def raw_frame():
+    return make_raw_frame()
+
+
+@pytest.fixture
+def data_csv(tmp_path, raw_frame):
+    path = str(tmp_path / "data.csv")
+    write_csv(raw_frame, path)
+    return path
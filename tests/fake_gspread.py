@@ -0,0 +1,171 @@
+"""
+Bản giả lập tối thiểu của gspread (Client / Spreadsheet / Worksheet) để chạy
+fetch_sheet_data.py offline (không cần credentials hay mạng), ví dụ:
+
+    ws = FakeWorksheet.from_csv("data.csv")
+    sync(ws, data_path="/tmp/data.csv", state_path="/tmp/state.json")
+
+    client = FakeClient({"sheet-a": FakeSpreadsheet([ws], latency=0.2)})
+    ws.errors = [api_error(429)]  # lần đọc đầu tiên bị lỗi quota
+    df, stats = fetch_targets(client, [SheetTarget("sheet-a", 0)])
+
+Worksheet nằm trong FakeSpreadsheet có tín hiệu phiên bản (get_lastUpdateTime) tăng
+mỗi khi dữ liệu bị sửa; drive_access=False giả lập token thiếu quyền Drive (lỗi 403).
+"""
+import csv
+import json
+import re
+import threading
+import time
+
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol, numericise_all
+
+
+class FakeResponse:
+    """Đủ thuộc tính để tạo gspread.exceptions.APIError."""
+
+    def __init__(self, code, message="fake error"):
+        self.status_code = code
+        self.text = json.dumps({"error": {"code": code, "message": message, "status": "FAKE"}})
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def api_error(code, message="fake error"):
+    """Tạo APIError như gspread trả về, ví dụ api_error(429) cho lỗi quota."""
+    return APIError(FakeResponse(code, message))
+
+
+class _Faulty:
+    """Giả lập độ trễ mạng và lỗi: mỗi lần gọi API ngủ latency giây, rồi ném lỗi đầu tiên trong errors (nếu còn)."""
+
+    def _simulate(self, call):
+        with self._fault_lock:
+            self.calls.append(call)
+            error = self.errors.pop(0) if self.errors else None
+        if self.latency:
+            time.sleep(self.latency)
+        if error is not None:
+            raise error
+
+
+class FakeWorksheet(_Faulty):
+    """Worksheet lưu trong bộ nhớ dưới dạng list các dòng chuỗi (dòng 0 là header)."""
+
+    def __init__(self, values, title="Sheet1", latency=0.0, errors=None):
+        self.values = [list(row) for row in values]
+        self.title = title
+        # Spreadsheet chứa worksheet này (gán bởi FakeSpreadsheet), như Worksheet.spreadsheet của gspread
+        self.spreadsheet = None
+        self.latency = latency
+        self.errors = list(errors or [])
+        self.calls = []
+        self._fault_lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls(list(csv.reader(f)), **kwargs)
+
+    # --- Các hàm thay đổi dữ liệu (mô phỏng người dùng nhập sheet) ---
+
+    def _touch(self):
+        if self.spreadsheet is not None:
+            self.spreadsheet.revision += 1
+
+    def append_rows(self, rows):
+        self.values.extend([str(cell) for cell in row] for row in rows)
+        self._touch()
+
+    def update_cell(self, row, col, value):
+        """Sửa một ô (row, col đánh số từ 1 như gspread)."""
+        self.values[row - 1][col - 1] = str(value)
+        self._touch()
+
+    # --- API đọc giống gspread ---
+
+    def get_all_values(self):
+        self._simulate(("get_all_values",))
+        return [list(row) for row in self.values]
+
+    def get_all_records(self):
+        self._simulate(("get_all_records",))
+        header = self.values[0]
+        return [dict(zip(header, numericise_all(list(row)))) for row in self.values[1:]]
+
+    def row_values(self, row):
+        self._simulate(("row_values", row))
+        if row > len(self.values):
+            return []
+        return list(self.values[row - 1])
+
+    def get(self, range_name):
+        """Hỗ trợ range dạng "A2:P10" hoặc mở "A2:P" (đến dòng cuối)."""
+        self._simulate(("get", range_name))
+        start, end = range_name.split(":")
+        start_row, start_col = a1_to_rowcol(start)
+        if re.search(r"\d", end):
+            end_row, end_col = a1_to_rowcol(end)
+        else:
+            end_row, end_col = len(self.values), a1_to_rowcol(f"{end}1")[1]
+        rows = self.values[start_row - 1:end_row]
+        # API thật bỏ các ô trống ở cuối dòng
+        result = []
+        for row in rows:
+            cells = list(row[start_col - 1:end_col])
+            while cells and cells[-1] == "":
+                cells.pop()
+            result.append(cells)
+        return result
+
+
+class FakeSpreadsheet(_Faulty):
+    def __init__(self, worksheets, latency=0.0, errors=None, drive_access=True):
+        self.worksheets_list = list(worksheets)
+        self.latency = latency
+        self.errors = list(errors or [])
+        self.calls = []
+        self._fault_lock = threading.Lock()
+        self.drive_access = drive_access
+        self.revision = 0
+        for ws in self.worksheets_list:
+            ws.spreadsheet = self
+
+    def get_lastUpdateTime(self):
+        """modifiedTime giả: đổi mỗi khi một worksheet bị sửa."""
+        self._simulate(("get_lastUpdateTime",))
+        if not self.drive_access:
+            raise api_error(403, "Request had insufficient authentication scopes.")
+        return f"rev-{self.revision}"
+
+    def get_worksheet(self, index):
+        self._simulate(("get_worksheet", index))
+        if index >= len(self.worksheets_list):
+            return None
+        return self.worksheets_list[index]
+
+    def worksheet(self, title):
+        self._simulate(("worksheet", title))
+        for ws in self.worksheets_list:
+            if ws.title == title:
+                return ws
+        raise WorksheetNotFound(title)
+
+
+class FakeClient(_Faulty):
+    """Client giả: spreadsheets là dict {spreadsheet_id: FakeSpreadsheet}."""
+
+    def __init__(self, spreadsheets, latency=0.0, errors=None):
+        self.spreadsheets = dict(spreadsheets)
+        self.latency = latency
+        self.errors = list(errors or [])
+        self.calls = []
+        self._fault_lock = threading.Lock()
+
+    def open_by_key(self, key):
+        self._simulate(("open_by_key", key))
+        if key not in self.spreadsheets:
+            raise api_error(404, f"Spreadsheet {key} not found")
+        return self.spreadsheets[key]
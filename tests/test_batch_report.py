@@ -0,0 +1,51 @@
+import io
+import json
+import os
+
+import pandas as pd
+
+import batch_report
+from cip_cleaning import clean_data
+from metrics import compute_device_metrics
+
+
+def expected_summary(df_clean, start, end):
+    """Bảng thống kê của từng (Line, Circuit) trong khoảng ngày, lọc trực tiếp bằng mặt nạ boolean."""
+    starts = df_clean["Thời gian Bắt đầu CIP"]
+    window = df_clean[(starts >= start) & (starts <= end)]
+    tables = []
+    for (line, circuit), df in window.groupby(["Line", "Circuit"], observed=True, sort=True):
+        device_metrics = compute_device_metrics(df)
+        if device_metrics.gaps().empty:
+            continue
+        table = device_metrics.stats_table()
+        table.insert(0, "Circuit", circuit)
+        table.insert(0, "Line", line)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+
+def test_second_run_skips_every_combination(raw_frame, tmp_path):
+    df_clean = clean_data(raw_frame)
+    output = str(tmp_path / "reports")
+    rendered, skipped = batch_report.run(df_clean, output, "2024-01-28", "2024-02-29", workers=1)
+    # L1/1: T1, T2 + Tất cả; L1/2: T3 + Tất cả; L2/1: T4 + Tất cả
+    assert (rendered, skipped) == (7, 0)
+    with open(os.path.join(output, batch_report.MANIFEST_NAME), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert sorted(manifest) == sorted([
+        "L1/1/Tất cả", "L1/1/T1", "L1/1/T2", "L1/2/Tất cả", "L1/2/T3", "L2/1/Tất cả", "L2/1/T4",
+    ])
+    assert os.path.exists(os.path.join(output, "L1", "1", "T1", "index.html"))
+
+    summary = pd.read_csv(os.path.join(output, batch_report.SUMMARY_NAME))
+    expected = expected_summary(
+        df_clean, pd.Timestamp("2024-01-28"), pd.Timestamp("2024-02-29 23:59:59")
+    )
+    pd.testing.assert_frame_equal(summary, pd.read_csv(io.StringIO(expected.to_csv(index=False))))
+
+    assert batch_report.run(df_clean, output, "2024-01-28", "2024-02-29", workers=1) == (0, 7)
+    # Dữ liệu của một thiết bị đổi -> chỉ các tổ hợp chứa thiết bị đó được render lại
+    changed = raw_frame.copy()
+    changed.loc[changed["Thiết bị"] == "T4", "Nhiệt độ Xút Kết thúc"] += 1
+    assert batch_report.run(clean_data(changed), output, "2024-01-28", "2024-02-29", workers=1) == (2, 5)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cip_parsing import parse_duration_minutes, parse_timestamps
+
+
+def test_duration_minutes():
+    values, report = parse_duration_minutes(pd.Series(["1:30", "0:05", "", None], name="x"))
+    assert values.tolist() == [90, 5, 0, 0]
+    assert report.malformed == 0
+
+
+def test_duration_malformed_cells_are_nan_and_reported():
+    values, report = parse_duration_minutes(pd.Series(["1:30", "1:75", "abc"], name="x"))
+    assert values.iloc[0] == 90
+    assert values.iloc[1:].isna().all()
+    assert report.malformed == 2
+    assert report.sample == ["1:75", "abc"]
+
+
+def test_duration_empty_series():
+    values, report = parse_duration_minutes(pd.Series([], dtype=object, name="x"))
+    assert len(values) == 0
+    assert report.total == 0 and report.malformed == 0
+
+
+def test_duration_all_nan_series():
+    values, report = parse_duration_minutes(pd.Series([np.nan, np.nan], name="x"))
+    assert values.tolist() == [0, 0]
+    assert report.malformed == 0
+
+
+def test_duration_without_separator():
+    # Không ô nào có dấu ":" (chỉ có giờ) -> mọi ô đều sai định dạng, không lỗi KeyError
+    values, report = parse_duration_minutes(pd.Series(["H", "H", "2"], name="x"))
+    assert values.isna().all()
+    assert report.malformed == 3
+
+
+@pytest.mark.parametrize("cell, minutes", [("1:75", None), ("1:30:00", None), ("0:60", None), ("-1:30", None), ("1:59", 119)])
+def test_duration_rejects_out_of_range_minutes_and_seconds(cell, minutes):
+    values, report = parse_duration_minutes(pd.Series([cell], name="x"))
+    if minutes is None:
+        assert values.isna().all() and report.malformed == 1 and report.sample == [cell]
+    else:
+        assert values.tolist() == [minutes] and report.malformed == 0
+
+
+def test_timestamps_both_hour_widths():
+    # Google Sheet ghi giờ một chữ số khi < 10 giờ ("07/02/25 0:27") và hai chữ số khi >= 10 giờ
+    values, report = parse_timestamps(pd.Series(["06/02/25 15:51", "07/02/25 0:27", " 07/02/25 9:05 "], name="t"))
+    assert values.tolist() == [
+        pd.Timestamp("2025-02-06 15:51"), pd.Timestamp("2025-02-07 00:27"), pd.Timestamp("2025-02-07 09:05")
+    ]
+    assert report.total == 3 and report.malformed == 0
+
+
+def test_timestamps_custom_format():
+    values, report = parse_timestamps(pd.Series(["2025-02-06 15:51"], name="t"), fmt="%Y-%m-%d %H:%M")
+    assert values.tolist() == [pd.Timestamp("2025-02-06 15:51")]
+    assert report.malformed == 0
+
+
+def test_timestamps_malformed_cells_are_nat_and_reported():
+    series = pd.Series(["13/02/24 25:00", "31/02/24 10:00", "2024-02-13 10:00", "", None, "13/02/24 10:00"], name="t")
+    values, report = parse_timestamps(series)
+    assert values.iloc[:5].isna().all()
+    assert values.iloc[5] == pd.Timestamp("2024-02-13 10:00")
+    # Ô trống / NaN là NaT nhưng không bị tính là sai định dạng
+    assert report.column == "t" and report.total == 6 and report.malformed == 3
+    assert report.sample == ["13/02/24 25:00", "31/02/24 10:00", "2024-02-13 10:00"]
@@ -0,0 +1,37 @@
+import os
+
+import pandas as pd
+import pytest
+
+import data_cache
+
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_cache, "CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_round_trip(cache_dir):
+    df = pd.DataFrame({"Line": ["L1", "L2"], "x": [1.0, 2.0]})
+    path = data_cache.write_cached_frame("abc", df)
+    assert path is not None
+    pd.testing.assert_frame_equal(data_cache.read_cached_frame("abc"), df)
+
+
+def test_arrow_errors_skip_the_cache(cache_dir, monkeypatch):
+    def fail(*args, **kwargs):
+        raise pa.lib.ArrowTypeError("Expected bytes, got a 'int' object")
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", fail)
+    df = pd.DataFrame({"Circuit": pd.Series([1, "A"], dtype=object)})
+    assert data_cache.write_cached_frame("abc", df) is None
+    assert os.listdir(cache_dir) == []
+
+
+def test_mixed_object_column_skips_the_cache(cache_dir):
+    df = pd.DataFrame({"Circuit": pd.Series([1, "A"], dtype=object)})
+    assert data_cache.write_cached_frame("abc", df) is None
+    assert data_cache.read_cached_frame("abc") is None
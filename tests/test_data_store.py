@@ -0,0 +1,123 @@
+import os
+import subprocess
+import sys
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from cip_cleaning import clean_data
+from conftest import make_raw_frame
+from data_store import filter_frame, lines_in_window, load_data, read_dataset, write_dataset
+
+pytest.importorskip("pyarrow")
+
+
+def make_raw():
+    # Line toàn số: pyarrow sẽ suy luận phân vùng Line=1 thành int nếu không khai báo kiểu
+    raw = make_raw_frame()[:4].copy()
+    raw["Thiết bị"] = ["T1", "T2", "T2", "T3"]
+    raw["Line"] = [1, 2, 2, 10]
+    raw["Circuit"] = [1, 1, 1, 2]
+    raw["Thời gian Bắt đầu CIP"] = ["01/01/24 08:00", "02/01/24 08:00", "03/02/24 08:00", "05/02/24 09:00"]
+    return raw
+
+
+def test_read_dataset_prunes_numeric_lines(tmp_path):
+    root = str(tmp_path / "store")
+    manifest = write_dataset(make_raw(), root)
+    assert manifest["lines"] == ["1", "10", "2"]
+
+    df = read_dataset(root, lines=[2])
+    assert df["Line"].tolist() == ["2", "2"]
+    assert df["Thiết bị"].tolist() == ["T2", "T2"]
+
+
+def test_read_dataset_matches_filter_frame(tmp_path):
+    root = str(tmp_path / "store")
+    raw = make_raw()
+    write_dataset(raw, root)
+    start, end = pd.Timestamp("2024-01-02"), pd.Timestamp("2024-02-04")
+
+    stored = read_dataset(root, start=start, end=end, lines=["2", "10"])
+    expected = filter_frame(raw, start=start, end=end, lines=["2", "10"])
+    key = ["Thiết bị", "Thời gian Bắt đầu CIP"]
+    assert stored[key].values.tolist() == expected[key].values.tolist()
+
+
+def with_long_gap(raw_frame):
+    # T5: lần CIP kế tiếp sau 01/02/24 cách hơn một tháng (quá cửa sổ đọc thêm 31 ngày trước đây)
+    extra = make_raw_frame([
+        ("T5", "L2", 2, "01/02/24 08:00", 60, 16000, "0:30", "0:06"),
+        ("T5", "L2", 2, "20/03/24 08:00", 60, 16000, "0:30", "0:06"),
+    ])
+    return pd.concat([raw_frame, extra], ignore_index=True)
+
+
+def gap_table(df_clean, start, end, line):
+    df = df_clean[df_clean["Line"].astype(str) == line]
+    df = df[(df["Thời gian Bắt đầu CIP"] >= start) & (df["Thời gian Bắt đầu CIP"] <= end)]
+    return df[["Thiết bị", "Thời gian Bắt đầu CIP", "next_start", "time_gap_days"]].astype(
+        {"Thiết bị": str}
+    ).reset_index(drop=True)
+
+
+def test_window_gaps_match_the_full_history(raw_frame, tmp_path):
+    raw = with_long_gap(raw_frame)
+    root = str(tmp_path / "store")
+    write_dataset(raw, root)
+    full = clean_data(raw)
+    start, end = pd.Timestamp("2024-01-28"), pd.Timestamp("2024-02-15 23:59:59")
+    for line in ("L1", "L2"):
+        window = clean_data(read_dataset(root, start=start, end=end, lines=[line], with_next_start=True))
+        assert "_next_start" not in window.columns
+        pd.testing.assert_frame_equal(gap_table(window, start, end, line), gap_table(full, start, end, line))
+    t5 = gap_table(full, start, end, "L2").set_index("Thiết bị").loc["T5"]
+    assert t5["time_gap_days"] > 31
+    # Không yêu cầu thì read_dataset vẫn trả về đúng các cột của data.csv
+    assert list(read_dataset(root)) == list(raw.columns)
+
+
+def test_lines_in_window(raw_frame, tmp_path):
+    manifest = write_dataset(raw_frame, str(tmp_path / "store"))
+    assert lines_in_window(manifest, date(2024, 1, 28), date(2024, 2, 15)) == ["L1", "L2"]
+    # 05/03 - 06/03: chỉ L1 (T1 06/03) có CIP
+    assert lines_in_window(manifest, date(2024, 3, 5), date(2024, 3, 6)) == ["L1"]
+    assert lines_in_window(manifest, date(2024, 4, 1), date(2024, 4, 30)) == []
+    # Store cũ chưa có line_days: mọi Line
+    assert lines_in_window({"lines": ["L1", "L2"]}, date(2024, 4, 1), date(2024, 4, 30)) == ["L1", "L2"]
+
+
+def test_rewrite_swaps_atomically_and_keeps_the_previous_version(raw_frame, tmp_path):
+    root = str(tmp_path / "store")
+    # Store cũ là thư mục thật
+    os.makedirs(root)
+    write_dataset(raw_frame.iloc[:10], root)
+    assert os.path.islink(root)
+    first = os.path.realpath(root)
+
+    write_dataset(raw_frame, root)
+    second = os.path.realpath(root)
+    assert second != first
+    # Người đọc đã phân giải phiên bản trước vẫn đọc được trọn vẹn
+    assert len(read_dataset(first)) == 10
+    assert len(read_dataset(root)) == len(raw_frame)
+
+    write_dataset(raw_frame.iloc[:5], root)
+    assert not os.path.exists(first) and os.path.exists(second)
+    versions = [p.name for p in tmp_path.iterdir() if p.name.startswith("store.")]
+    assert len(versions) == 2
+
+
+def test_load_data_matches_read_dataset_without_streamlit(raw_frame, data_csv, tmp_path):
+    root = str(tmp_path / "store")
+    write_dataset(raw_frame, root)
+    start, end = pd.Timestamp("2024-02-01"), pd.Timestamp("2024-02-29 23:59:59")
+    from_csv = load_data(data_csv, start=start, end=end, lines=["L1"])
+    from_store = load_data(root, start=start, end=end, lines=["L1"])
+    key = ["Thiết bị", "Thời gian Bắt đầu CIP"]
+    assert from_store[key].values.tolist() == from_csv[key].values.tolist()
+    # Benchmark pipeline và job batch đọc dữ liệu mà không kéo theo Streamlit
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, benchmarks.bench_pipeline; assert 'streamlit' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=repo, check=True)
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from conftest import write_csv
+from due_index import DueIndex, DueTracker, plant_now, schedule_rows
+
+
+def due_table(index, as_of="2024-03-20", within_hours=0):
+    return index.due(pd.Timestamp(as_of), within_hours).reset_index(drop=True)
+
+
+def test_outlier_run_resets_the_due_date(raw_frame, tmp_path):
+    # Lần CIP mới nhất của T2 (01/02/24 09:00) có Lưu lượng hồi = 0 -> outlier khi làm sạch
+    path = str(tmp_path / "data.csv")
+    write_csv(raw_frame.iloc[:6], path)
+    index = DueTracker(path).refresh()
+    as_of = pd.Timestamp("2024-02-03")
+    assert "T2" not in set(due_table(index, as_of)["Thiết bị"])
+    t2 = index.due(as_of, within_hours=24 * 7).set_index("Thiết bị").loc["T2"]
+    assert t2["Lần CIP gần nhất"] == pd.Timestamp("2024-02-01 09:00")
+    assert t2["CIP kế tiếp"] == pd.Timestamp("2024-02-06 10:20")
+
+
+def test_appends_match_a_rebuild(raw_frame, tmp_path):
+    path = str(tmp_path / "data.csv")
+    write_csv(raw_frame.iloc[:10], path)
+    tracker = DueTracker(path)
+    tracker.refresh()
+    for rows in (slice(10, 17), slice(17, None)):
+        write_csv(raw_frame.iloc[rows], path, append=True)
+        tracker.refresh()
+    assert tracker.rebuilds == 1
+    expected = DueIndex.from_frame(schedule_rows(pd.read_csv(path)))
+    for as_of in ("2024-02-10", "2024-03-05", "2024-03-20"):
+        pd.testing.assert_frame_equal(due_table(tracker.index, as_of, 48), due_table(expected, as_of, 48))
+    # Ô thời gian sai định dạng (13/02/24 25:00) không thay lần CIP mới nhất của T4
+    t4 = due_table(expected).set_index("Thiết bị").loc["T4"]
+    assert t4["Lần CIP gần nhất"] == pd.Timestamp("2024-03-04 13:10")
+    assert expected.overdue_count(pd.Timestamp("2024-03-20")) == 4
+
+
+def test_plant_now_uses_plant_timezone():
+    # Không phụ thuộc múi giờ của máy chủ: giờ nhà máy luôn là UTC+7 (Việt Nam không có giờ mùa hè)
+    now = plant_now()
+    assert now.tz is None
+    utc_now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+    assert abs(now - utc_now - pd.Timedelta(hours=7)) < pd.Timedelta(minutes=1)
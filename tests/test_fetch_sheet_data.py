@@ -0,0 +1,175 @@
+import io
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+import fetch_sheet_data as fetch
+from fake_gspread import FakeClient, FakeSpreadsheet, FakeWorksheet
+
+
+def sheet_values(raw_frame, rows=slice(None)):
+    return [list(raw_frame.columns)] + raw_frame.iloc[rows].astype(str).values.tolist()
+
+
+@pytest.fixture
+def client(raw_frame):
+    first = FakeSpreadsheet([
+        FakeWorksheet(sheet_values(raw_frame, slice(0, 10)), title="L1"),
+        FakeWorksheet(sheet_values(raw_frame, slice(10, 20)), title="L2"),
+    ])
+    second = FakeSpreadsheet([FakeWorksheet(sheet_values(raw_frame, slice(20, None)))])
+    return FakeClient({"sheet-a": first, "sheet-b": second})
+
+
+TARGETS = [
+    fetch.SheetTarget("sheet-a", "L1", "A1"),
+    fetch.SheetTarget("sheet-a", "L2", "A2"),
+    fetch.SheetTarget("sheet-b", 0, "B"),
+]
+
+
+def test_sync_targets_opens_each_spreadsheet_once(client, tmp_path, raw_frame):
+    data_path, state_path = str(tmp_path / "data.csv"), str(tmp_path / "state.json")
+    stats = fetch.sync_targets(client, TARGETS, data_path, state_path)
+    assert stats.changed and stats.rows_fetched == len(raw_frame)
+    opened = [call[1] for call in client.calls if call[0] == "open_by_key"]
+    assert sorted(opened) == ["sheet-a", "sheet-b"]
+
+    # Không có gì đổi: chỉ kiểm tra tín hiệu phiên bản, không đọc dữ liệu
+    client.calls.clear()
+    stats = fetch.sync_targets(client, TARGETS, data_path, state_path)
+    assert stats.mode == "unchanged" and not stats.changed
+    assert len(client.calls) == 2
+    worksheet = client.spreadsheets["sheet-b"].worksheets_list[0]
+    assert not any(call[0] == "get_all_values" for call in worksheet.calls[1:])
+
+
+def test_validate_schema_accepts_trailing_columns():
+    fetch.validate_schema(fetch.REQUIRED_COLUMNS + ["Ghi chú"], TARGETS[0])
+
+
+@pytest.mark.parametrize("header, message", [
+    (fetch.REQUIRED_COLUMNS[:5] + fetch.REQUIRED_COLUMNS[6:], "thiếu cột"),
+    (["Line", "Thiết bị"] + fetch.REQUIRED_COLUMNS[2:], "sai thứ tự"),
+    (["Thiết bị ", *fetch.REQUIRED_COLUMNS[1:]], "thiếu cột"),
+])
+def test_validate_schema_rejects_missing_reordered_or_renamed(header, message):
+    with pytest.raises(fetch.SchemaError, match=message):
+        fetch.validate_schema(header, TARGETS[0])
+
+
+def test_reordered_sheet_fails_the_fetch(client, tmp_path):
+    worksheet = client.spreadsheets["sheet-b"].worksheets_list[0]
+    header = worksheet.values[0]
+    header[0], header[1] = header[1], header[0]
+    with pytest.raises(fetch.SchemaError):
+        fetch.fetch_targets(client, TARGETS)
+
+
+def test_append_csv_appends_in_place(tmp_path, raw_frame):
+    path = str(tmp_path / "data.csv")
+    raw_frame.iloc[:10].to_csv(path, index=False)
+    inode = os.stat(path).st_ino
+    assert fetch.write_csv_atomic(raw_frame.iloc[10:], path, append=True)
+    assert os.stat(path).st_ino == inode
+    pd.testing.assert_frame_equal(pd.read_csv(path), pd.read_csv(io.StringIO(raw_frame.to_csv(index=False))))
+    assert not fetch.write_csv_atomic(raw_frame.iloc[:0], path, append=True)
+
+
+def test_append_csv_truncates_on_failure(tmp_path, raw_frame, monkeypatch):
+    path = str(tmp_path / "data.csv")
+    raw_frame.iloc[:10].to_csv(path, index=False)
+    before = open(path, "rb").read()
+
+    def failing_fsync(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(fetch.os, "fsync", failing_fsync)
+    with pytest.raises(OSError):
+        fetch.append_csv(raw_frame.iloc[10:], path)
+    assert open(path, "rb").read() == before
+
+
+def test_credentials_fall_back_to_sheets_scope(monkeypatch):
+    requested = []
+
+    class FakeCredentials:
+        valid = False
+
+        def __init__(self, scopes):
+            self.scopes = scopes
+
+        @classmethod
+        def from_authorized_user_info(cls, info, scopes):
+            requested.append(scopes)
+            return cls(scopes)
+
+        def refresh(self, request):
+            # Token cũ chỉ được cấp quyền Sheets
+            if set(self.scopes) - set(fetch.SHEETS_SCOPES):
+                raise fetch.RefreshError("Not all requested scopes were granted")
+
+    monkeypatch.setattr(fetch, "Credentials", FakeCredentials)
+    for name in ("CLIENT_ID", "CLIENT_SECRET", "REFRESH_TOKEN"):
+        monkeypatch.setenv(name, "x")
+    assert fetch.get_credentials_from_env().scopes == fetch.SHEETS_SCOPES
+    assert requested == [fetch.SCOPES, fetch.SHEETS_SCOPES]
+
+
+def test_refresh_rollups_is_optional(tmp_path, raw_frame, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    raw_frame.to_csv(fetch.DATA_PATH, index=False)
+    tracker = fetch.refresh_rollups(str(tmp_path / "rollups"))
+    assert tracker is not None and tracker.rebuilds == 1
+    # Lỗi của bảng tổng hợp chỉ được báo, không làm hỏng lần tải
+    monkeypatch.setitem(sys.modules, "rollups", None)
+    assert fetch.refresh_rollups() is None
+    assert "bảng tổng hợp" in capsys.readouterr().err
+
+
+@pytest.fixture
+def worksheet(raw_frame):
+    worksheet = FakeWorksheet(sheet_values(raw_frame, slice(0, 20)))
+    FakeSpreadsheet([worksheet])
+    return worksheet
+
+
+def test_sync_skips_fetch_when_revision_is_unchanged(worksheet, tmp_path, raw_frame):
+    data_path, state_path = str(tmp_path / "data.csv"), str(tmp_path / "state.json")
+    assert fetch.sync(worksheet, data_path, state_path).changed
+
+    # Cùng modifiedTime: chỉ một lời gọi metadata, không đọc dữ liệu sheet
+    worksheet.calls.clear()
+    worksheet.spreadsheet.calls.clear()
+    stats = fetch.sync(worksheet, data_path, state_path)
+    assert stats.mode == "unchanged" and not stats.changed and stats.rows_fetched == 0
+    assert worksheet.calls == []
+    assert worksheet.spreadsheet.calls == [("get_lastUpdateTime",)]
+
+    # Sheet được ghi thêm dòng -> modifiedTime đổi -> tải các dòng mới
+    worksheet.append_rows(raw_frame.iloc[20:].astype(str).values.tolist())
+    stats = fetch.sync(worksheet, data_path, state_path)
+    assert stats.changed and stats.mode != "unchanged"
+    assert len(pd.read_csv(data_path)) == len(raw_frame)
+
+
+def test_sync_ignores_revision_when_data_csv_changed(worksheet, tmp_path):
+    data_path, state_path = str(tmp_path / "data.csv"), str(tmp_path / "state.json")
+    fetch.sync(worksheet, data_path, state_path)
+    with open(data_path, "ab") as f:
+        f.write(b"x\n")
+    # data.csv không còn là file đã ghi lần trước: không bỏ qua dù modifiedTime không đổi
+    assert fetch.sync(worksheet, data_path, state_path).mode != "unchanged"
+
+
+def test_main_exits_unchanged_when_revision_is_unchanged(worksheet, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(fetch.TARGETS_ENV, raising=False)
+    monkeypatch.setattr(fetch, "open_worksheet", lambda: worksheet)
+    monkeypatch.setattr(sys, "argv", ["fetch_sheet_data.py"])
+    assert fetch.main() == 0
+    assert fetch.main() == fetch.EXIT_UNCHANGED == 3
+    worksheet.update_cell(2, 5, "15001")
+    assert fetch.main() == 0
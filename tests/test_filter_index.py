@@ -0,0 +1,41 @@
+import pandas as pd
+
+from filter_index import FilterIndex
+
+
+def make_frame():
+    # Đã sắp xếp theo (Line, Circuit, Thiết bị, Thời gian Bắt đầu CIP) như kết quả của clean_data()
+    return pd.DataFrame({
+        "Line": ["L1", "L1", "L1", "L2"],
+        "Circuit": ["C1", "C1", "C2", "C1"],
+        "Thiết bị": ["T1", "T1", "T2", "T3"],
+        "Thời gian Bắt đầu CIP": pd.to_datetime([
+            "2024-01-01 08:00", "2024-01-05 08:00", "2024-01-03 10:00", "2024-01-10 09:30",
+        ]),
+    })
+
+
+def test_window_before_all_data_is_empty():
+    index = FilterIndex(make_frame())
+    bounds = index.window("2023-01-01", "2023-12-31 23:59:59")
+    assert index.lines(bounds) == []
+    assert len(index.positions(bounds)) == 0
+
+
+def test_window_boundaries_are_inclusive():
+    df = make_frame()
+    index = FilterIndex(df)
+    bounds = index.window("2024-01-01 08:00", "2024-01-03 10:00")
+    assert index.positions(bounds).tolist() == [0, 2]
+    bounds = index.window("2023-06-01", "2024-01-01 08:00")
+    assert index.positions(bounds).tolist() == [0]
+
+
+def test_filters_by_level():
+    df = make_frame()
+    index = FilterIndex(df)
+    bounds = index.window("2024-01-02", "2024-01-31")
+    assert index.lines(bounds) == ["L1", "L2"]
+    assert index.circuits(bounds, "L1") == ["C1", "C2"]
+    assert index.devices(bounds, "L1", "C1") == ["T1"]
+    assert index.select(df, bounds, "L1", "C1").index.tolist() == [1]
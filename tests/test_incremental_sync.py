@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import fetch_sheet_data as fetch
+from fake_gspread import FakeSpreadsheet, FakeWorksheet
+
+# Khối nhỏ để 28 dòng mẫu chia thành nhiều khối (khối cuối, khối cũ được kiểm tra theo vòng)
+BLOCK_SIZE = 4
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(fetch, "BLOCK_SIZE", BLOCK_SIZE)
+
+
+def sheet(raw_frame, rows):
+    values = [list(raw_frame.columns)] + raw_frame.iloc[rows].astype(str).values.tolist()
+    worksheet = FakeWorksheet(values)
+    FakeSpreadsheet([worksheet])
+    return worksheet
+
+
+def full_fetch(worksheet, tmp_path):
+    """data.csv khi tải lại toàn bộ sheet hiện tại vào một thư mục khác."""
+    path = tmp_path / "full.csv"
+    fetch.full_sync(worksheet, str(path), str(tmp_path / "full_state.json"))
+    return path.read_bytes()
+
+
+@pytest.fixture
+def synced(raw_frame, tmp_path):
+    """Sheet 10 dòng đầu đã được tải lần đầu; trả về (worksheet, data_path, state_path)."""
+    worksheet = sheet(raw_frame, slice(0, 10))
+    data_path, state_path = str(tmp_path / "data.csv"), str(tmp_path / "state.json")
+    assert fetch.incremental_sync(worksheet, data_path, state_path).mode == "full"
+    return worksheet, data_path, state_path
+
+
+def test_appends_match_a_full_fetch(synced, raw_frame, tmp_path):
+    worksheet, data_path, state_path = synced
+    for rows in (slice(10, 11), slice(11, 17), slice(17, None)):
+        worksheet.append_rows(raw_frame.iloc[rows].astype(str).values.tolist())
+        stats = fetch.incremental_sync(worksheet, data_path, state_path, audit_counter=0)
+        assert stats.mode == "incremental" and stats.changed
+        assert stats.rows_fetched == len(raw_frame.iloc[rows])
+        assert open(data_path, "rb").read() == full_fetch(worksheet, tmp_path)
+
+    state = fetch.load_state(state_path)
+    assert state["rows_ingested"] == len(raw_frame)
+    assert state["block_checksums"] == fetch.block_checksums(worksheet.values[1:])
+
+    # Không có dòng mới: không ghi gì
+    before = open(data_path, "rb").read()
+    stats = fetch.incremental_sync(worksheet, data_path, state_path, audit_counter=0)
+    assert (stats.mode, stats.rows_fetched, stats.changed) == ("incremental", 0, False)
+    assert open(data_path, "rb").read() == before
+
+
+def test_edit_in_the_last_block_forces_a_full_resync(synced, tmp_path):
+    worksheet, data_path, state_path = synced
+    # Dòng 10 (dữ liệu) nằm trong khối cuối (dòng 8-9), luôn được đọc lại cùng các dòng mới
+    worksheet.update_cell(11, 5, "9999")
+    assert fetch.incremental_sync(worksheet, data_path, state_path, audit_counter=0).mode == "full"
+    assert open(data_path, "rb").read() == full_fetch(worksheet, tmp_path)
+
+
+def test_audit_rotation_finds_an_edited_old_block(synced, tmp_path):
+    worksheet, data_path, state_path = synced
+    # Sửa dòng dữ liệu đầu tiên (khối 0); khối cuối là khối 2 nên khối 0 chỉ được kiểm tra theo vòng
+    worksheet.update_cell(2, 5, "9999")
+    # Vòng kiểm tra đang ở khối 1 -> chưa thấy
+    assert fetch.incremental_sync(worksheet, data_path, state_path, audit_counter=1).mode == "incremental"
+    assert open(data_path, "rb").read() != full_fetch(worksheet, tmp_path)
+    # Vòng kiểm tra đến khối 0 -> tải lại toàn bộ
+    assert fetch.incremental_sync(worksheet, data_path, state_path, audit_counter=2).mode == "full"
+    assert open(data_path, "rb").read() == full_fetch(worksheet, tmp_path)
+
+
+def test_deleted_rows_force_a_full_resync(synced, tmp_path):
+    worksheet, data_path, state_path = synced
+    del worksheet.values[-2:]
+    assert fetch.incremental_sync(worksheet, data_path, state_path, audit_counter=0).mode == "full"
+    assert open(data_path, "rb").read() == full_fetch(worksheet, tmp_path)
+
+
+@pytest.mark.parametrize("content", [None, "{not json", "[]", json.dumps({"block_size": BLOCK_SIZE})])
+def test_missing_or_corrupt_state_falls_back_to_full(synced, raw_frame, tmp_path, content):
+    worksheet, data_path, state_path = synced
+    worksheet.append_rows(raw_frame.iloc[10:].astype(str).values.tolist())
+    if content is None:
+        (tmp_path / "state.json").unlink()
+    else:
+        (tmp_path / "state.json").write_text(content, encoding="utf-8")
+    assert fetch.incremental_sync(worksheet, data_path, state_path).mode == "full"
+    assert open(data_path, "rb").read() == full_fetch(worksheet, tmp_path)
+    assert fetch.load_state(state_path)["rows_ingested"] == len(raw_frame)
@@ -0,0 +1,50 @@
+import tracemalloc
+
+from instrumentation import Profiler
+
+
+def run_stage(profiler, name, size):
+    with profiler.stage(name):
+        buffer = bytearray(size)
+        del buffer
+    return profiler.records[-1]
+
+
+def test_only_one_profiler_traces_memory_at_a_time():
+    first = Profiler(enabled=True).start()
+    second = Profiler(enabled=True).start()
+    try:
+        assert first.traces_memory and not second.traces_memory
+        # Phiên thứ hai chạy giữa chừng không được đặt lại đỉnh của phiên đầu
+        with first.stage("outer"):
+            buffer = bytearray(4 * 2**20)
+            del buffer
+            skipped = run_stage(second, "other", 2**20)
+        assert skipped["peak_bytes"] is None
+        assert skipped["seconds"] >= 0
+        assert first.records[0]["peak_bytes"] >= 4 * 2**20
+    finally:
+        second.stop()
+        first.stop()
+    assert not tracemalloc.is_tracing()
+
+
+def test_memory_tracing_is_released_on_stop():
+    first = Profiler(enabled=True).start()
+    first.stop()
+    second = Profiler(enabled=True).start()
+    try:
+        assert second.traces_memory
+        assert run_stage(second, "alloc", 2**20)["peak_bytes"] >= 2**20
+    finally:
+        second.stop()
+
+
+def test_disabled_profiler_never_claims_memory_tracing():
+    disabled = Profiler(enabled=False).start()
+    enabled = Profiler(enabled=True).start()
+    try:
+        assert not disabled.traces_memory and enabled.traces_memory
+    finally:
+        enabled.stop()
+        disabled.stop()
@@ -0,0 +1,61 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import data_cache
+import metrics_api
+from conftest import write_csv
+
+
+@pytest.fixture
+def server(data_csv, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    server, service = metrics_api.create_server(data_csv, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, service
+    server.shutdown()
+    server.server_close()
+    service.dataset.stop()
+
+
+def get(server, path, etag=None):
+    url = f"http://127.0.0.1:{server.server_address[1]}{path}"
+    request = urllib.request.Request(url, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers.get("ETag"), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("ETag"), e.read()
+
+
+def test_etag_returns_304_until_data_changes(server, data_csv, raw_frame):
+    server, service = server
+    status, etag, body = get(server, "/metrics?line=L1")
+    assert status == 200 and etag
+    payload = json.loads(body)
+    assert {device["device"] for device in payload["devices"]} == {"T1", "T2", "T3"}
+
+    status, again, body = get(server, "/metrics?line=L1", etag)
+    assert (status, again, body) == (304, etag, b"")
+    assert service.not_modified == 1
+    # Weak validator và danh sách nhiều ETag cũng khớp
+    assert get(server, "/metrics?line=L1", f'"other", W/{etag}')[0] == 304
+    # Bộ lọc khác -> ETag khác
+    assert get(server, "/metrics?line=L2", etag)[0] == 200
+
+    # Dữ liệu đổi -> phiên bản mới -> ETag cũ không còn khớp
+    write_csv(raw_frame.iloc[:1], data_csv, append=True)
+    service.dataset.refresh(wait_for_settle=False)
+    status, new_etag, body = get(server, "/metrics?line=L1", etag)
+    assert status == 200 and new_etag != etag
+    assert json.loads(body)["data_version"] != payload["data_version"]
+
+
+def test_bad_request(server):
+    server, _ = server
+    assert get(server, "/metrics?start=2024-03-01&end=2024-02-01")[0] == 400
+    assert get(server, "/metrics?unknown=1")[0] == 400
@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cip_cleaning import clean_data
+from conftest import write_csv
+from filter_index import FilterIndex
+from metrics import compute_device_metrics
+from rollups import RollupTracker
+
+WINDOWS = [
+    ("2024-01-28", "2024-03-06"),  # toàn bộ dữ liệu
+    ("2024-02-01", "2024-02-29"),  # trọn một tháng
+    ("2024-01-30", "2024-02-03"),  # qua ranh giới tháng
+    ("2024-02-03", "2024-02-03"),  # một ngày có hai lần CIP của T1
+    ("2024-02-10", "2024-03-01"),
+    ("2023-01-01", "2023-12-31"),  # trước toàn bộ dữ liệu
+]
+
+
+def assert_matches_compute_device_metrics(rollups, raw):
+    df = clean_data(raw)
+    index = FilterIndex(df)
+    for start, end in WINDOWS:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        bounds = index.window(start, end + pd.Timedelta(days=1) - pd.Timedelta(seconds=1))
+        for line, circuits in index.tree.items():
+            for circuit, devices in circuits.items():
+                for device in [None] + [device for device, _ in devices]:
+                    got = rollups.device_metrics(line, circuit, device, start, end).per_device
+                    selected = index.select(df, bounds, line, circuit, device)
+                    if selected.empty:
+                        assert got.empty
+                        continue
+                    expected = compute_device_metrics(selected).per_device
+                    got = got.loc[[str(d) for d in expected.index], expected.columns]
+                    np.testing.assert_allclose(
+                        got.to_numpy(float), expected.to_numpy(float), rtol=1e-6, atol=1e-9,
+                        err_msg=f"{start.date()}..{end.date()} {line}/{circuit}/{device}",
+                    )
+
+
+def test_rollups_match_compute_device_metrics(data_csv, raw_frame, tmp_path):
+    rollups, fingerprint = RollupTracker(data_csv, str(tmp_path / "rollups")).refresh()
+    assert fingerprint is not None
+    assert_matches_compute_device_metrics(rollups, raw_frame)
+
+
+@pytest.mark.parametrize("cuts", [[5, 6, 17], [1, 2, 3, 10, 20, 27]])
+def test_incremental_appends_match_rebuild(raw_frame, tmp_path, cuts):
+    path, root = str(tmp_path / "data.csv"), str(tmp_path / "rollups")
+    write_csv(raw_frame.iloc[:cuts[0]], path)
+    RollupTracker(path, root).refresh()
+    for lo, hi in zip(cuts, cuts[1:] + [len(raw_frame)]):
+        write_csv(raw_frame.iloc[lo:hi], path, append=True)
+        # Tracker mới mỗi lần: tiếp tục từ trạng thái đã lưu như sau khi khởi động lại
+        tracker = RollupTracker(path, root)
+        rollups, _ = tracker.refresh()
+        assert tracker.resumed and tracker.rebuilds == 0
+    assert_matches_compute_device_metrics(rollups, raw_frame)
+
+
+def test_out_of_order_append_rebuilds(raw_frame, tmp_path):
+    path, root = str(tmp_path / "data.csv"), str(tmp_path / "rollups")
+    write_csv(raw_frame.iloc[1:], path)
+    RollupTracker(path, root).refresh()
+    # Lần CIP đầu tiên của T1 đến sau cùng -> không cộng dồn được, phải tính lại từ đầu
+    write_csv(raw_frame.iloc[:1], path, append=True)
+    tracker = RollupTracker(path, root)
+    rollups, _ = tracker.refresh()
+    assert tracker.rebuilds == 1
+    assert_matches_compute_device_metrics(rollups, pd.concat([raw_frame.iloc[1:], raw_frame.iloc[:1]]))
+
+
+def test_latest_refreshes_in_background(raw_frame, tmp_path, monkeypatch):
+    path, root = str(tmp_path / "data.csv"), str(tmp_path / "rollups")
+    write_csv(raw_frame.iloc[:10], path)
+    tracker = RollupTracker(path, root)
+    # Chưa có bảng: trả về ngay (không khớp phiên bản nào) và tính trong luồng nền
+    rollups, fingerprint = tracker.latest()
+    assert fingerprint is None and len(rollups) == 0
+    tracker.wait()
+    first, fingerprint = tracker.latest()
+    assert fingerprint is not None and tracker.rebuilds == 1
+
+    # Trong lúc luồng nền đang cộng dòng mới, latest() vẫn trả về ngay cặp (bảng, mã băm) cũ
+    started, release = threading.Event(), threading.Event()
+    refresh = tracker.refresh
+
+    def slow_refresh():
+        started.set()
+        release.wait(5)
+        return refresh()
+
+    monkeypatch.setattr(tracker, "refresh", slow_refresh)
+    write_csv(raw_frame.iloc[10:], path, append=True)
+    assert tracker.latest() == (first, fingerprint)
+    assert started.wait(5)
+    assert tracker.latest() == (first, fingerprint) and tracker.stats()["refreshing"]
+    release.set()
+    tracker.wait()
+    rollups, new_fingerprint = tracker.latest()
+    assert new_fingerprint not in (None, fingerprint) and tracker.appended_rows == len(raw_frame) - 10
+    assert_matches_compute_device_metrics(rollups, raw_frame)
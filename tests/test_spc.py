@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from cip_cleaning import clean_rows
+from conftest import make_raw_frame, write_csv
+from spc import SpcEngine, SpcOrderError, SpcTracker
+
+# Nhân bản lịch sử mẫu sang các năm sau để mỗi biểu đồ có đủ MIN_BASELINE điểm (giới hạn kiểm soát + cảnh báo)
+YEARS = 4
+TIME_COLUMNS = ("Thời gian Bắt đầu CIP", "Thời gian Kết thúc CIP", "CIP kế tiếp")
+
+
+def long_history():
+    frames = []
+    for k in range(YEARS):
+        frame = make_raw_frame()
+        for col in TIME_COLUMNS:
+            # "dd/mm/24 hh:mm" -> "dd/mm/(24+k) hh:mm"
+            frame[col] = frame[col].str.replace("/24 ", f"/{24 + k} ", regex=False)
+        frame["Nhiệt độ Xút Kết thúc"] += (frame.index % 3) * 1.5 * k
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def full_replay(raw, tmp_path):
+    path = str(tmp_path / "full.csv")
+    write_csv(raw, path)
+    return SpcTracker(path, str(tmp_path / "full_state.json")).refresh()
+
+
+@pytest.mark.parametrize("chunk", [1, 9, 40])
+def test_incremental_updates_match_full_replay(tmp_path, chunk):
+    raw = long_history()
+    path, state_path = str(tmp_path / "data.csv"), str(tmp_path / "spc_state.json")
+    write_csv(raw.iloc[:chunk], path)
+    SpcTracker(path, state_path).refresh()
+    for lo in range(chunk, len(raw), chunk):
+        write_csv(raw.iloc[lo:lo + chunk], path, append=True)
+        # Tracker mới mỗi lần: tiếp tục từ trạng thái đã lưu như sau khi khởi động lại
+        tracker = SpcTracker(path, state_path)
+        engine = tracker.refresh()
+        assert tracker.resumed and tracker.rebuilds == 0
+
+    expected = full_replay(raw, tmp_path)
+    assert engine.to_json() == expected.to_json()
+    assert any(state.alarms for state in expected.states.values())
+
+
+def test_out_of_order_rows_trigger_a_rebuild(tmp_path):
+    raw = long_history()
+    # Lần CIP đầu tiên của T1 được ghi thêm sau cùng
+    late = raw.iloc[:1]
+    path, state_path = str(tmp_path / "data.csv"), str(tmp_path / "spc_state.json")
+    write_csv(raw.iloc[1:], path)
+    tracker = SpcTracker(path, state_path)
+    tracker.refresh()
+    before = tracker.engine.to_json()
+    write_csv(late, path, append=True)
+    engine = tracker.refresh()
+    assert tracker.rebuilds == 2 and tracker.appended_rows == 0
+    assert engine.to_json() != before
+    expected = full_replay(pd.concat([raw.iloc[1:], late]), tmp_path)
+    assert engine.to_json() == expected.to_json()
+
+
+def test_update_rows_rejects_rows_older_than_the_chart(raw_frame):
+    rows, _ = clean_rows(raw_frame)
+    engine = SpcEngine()
+    engine.update_rows(rows.iloc[5:])
+    before = engine.to_json()
+    with pytest.raises(SpcOrderError):
+        engine.update_rows(rows.iloc[:5])
+    # Không có thay đổi dở dang
+    assert engine.to_json() == before
@@ -0,0 +1,93 @@
+import pandas as pd
+import pytest
+
+from cip_cleaning import clean_data
+from conftest import write_csv
+
+pytest.importorskip("pyarrow")
+
+from streaming_clean import StreamOrderError, read_clean_store, stream_clean, verify  # noqa: E402
+
+
+@pytest.mark.parametrize("chunksize", [1, 4, 7, 1000])
+def test_stream_clean_matches_clean_data(data_csv, tmp_path, chunksize):
+    root = str(tmp_path / "clean_store")
+    manifest = stream_clean(data_csv, root, chunksize=chunksize)
+    expected = clean_data(pd.read_csv(data_csv))
+    assert manifest["rows"] == len(expected)
+    # So sánh cả index, thứ tự dòng, kiểu dữ liệu và attrs (parse_reports, memory_report)
+    verify(data_csv, root)
+    pd.testing.assert_frame_equal(read_clean_store(root), expected)
+
+
+@pytest.mark.parametrize("chunksize", [3, 1000])
+def test_stream_clean_reads_chunks_with_file_dtypes(raw_frame, tmp_path, chunksize):
+    raw = raw_frame.copy()
+    # Circuit "2A" chỉ xuất hiện ở phần sau; các dòng 3..5 có thời lượng "0" (không phải "0:00")
+    raw["Circuit"] = raw["Circuit"].astype(str)
+    raw.loc[raw["Thiết bị"] == "T3", "Circuit"] = "2A"
+    raw.loc[3:5, ["Tổng thời gian bước Xút", "Tổng thời gian bước nước nóng"]] = "0"
+    path = str(tmp_path / "data.csv")
+    write_csv(raw, path)
+    root = str(tmp_path / "clean_store")
+    stream_clean(path, root, chunksize=chunksize)
+    verify(path, root)
+    assert (read_clean_store(root)["Circuit"] == "2A").any()
+
+
+def test_stream_clean_restores_numeric_keys(data_csv, tmp_path):
+    root = str(tmp_path / "clean_store")
+    stream_clean(data_csv, root, chunksize=5)
+    expected = clean_data(pd.read_csv(data_csv))
+    assert read_clean_store(root)["Circuit"].dtype == expected["Circuit"].dtype
+
+
+def test_stream_clean_rejects_out_of_order_devices(raw_frame, tmp_path):
+    path = str(tmp_path / "data.csv")
+    # Lần CIP đầu tiên của T1 bị chuyển xuống cuối file
+    write_csv(pd.concat([raw_frame.iloc[1:], raw_frame.iloc[:1]]), path)
+    with pytest.raises(StreamOrderError):
+        stream_clean(path, str(tmp_path / "clean_store"), chunksize=5)
+    assert not (tmp_path / "clean_store").exists()
+
+
+def test_clean_csv_streams_large_files(data_csv, tmp_path, monkeypatch):
+    import shared_dataset
+    import streaming_clean
+
+    monkeypatch.setattr(streaming_clean, "CACHE_DIR", str(tmp_path / "cache"))
+    calls = []
+    monkeypatch.setattr(streaming_clean, "stream_clean",
+                        lambda *args: calls.append(args) or stream_clean(*args))
+    expected = clean_data(pd.read_csv(data_csv))
+    pd.testing.assert_frame_equal(shared_dataset.clean_csv(data_csv, streaming_min_bytes=0), expected)
+    assert len(calls) == 1
+    # Store tạm được xoá sau khi đọc lại
+    assert list((tmp_path / "cache").iterdir()) == []
+    pd.testing.assert_frame_equal(shared_dataset.clean_csv(data_csv), expected)
+    assert len(calls) == 1
+
+
+def test_clean_csv_falls_back_on_out_of_order(raw_frame, tmp_path, monkeypatch):
+    import shared_dataset
+    import streaming_clean
+
+    monkeypatch.setattr(streaming_clean, "CACHE_DIR", str(tmp_path / "cache"))
+    path = str(tmp_path / "data.csv")
+    write_csv(pd.concat([raw_frame.iloc[1:], raw_frame.iloc[:1]]), path)
+    pd.testing.assert_frame_equal(shared_dataset.clean_csv(path, streaming_min_bytes=0),
+                                  clean_data(pd.read_csv(path)))
+
+
+def test_clean_csv_falls_back_on_arrow_errors(data_csv, monkeypatch):
+    import pyarrow as pa
+
+    import shared_dataset
+    import streaming_clean
+
+    def fail(*args):
+        raise pa.ArrowTypeError("Expected bytes, got a 'int' object")
+
+    monkeypatch.setattr(streaming_clean, "clean_csv_streaming", fail)
+    pd.testing.assert_frame_equal(shared_dataset.clean_csv(data_csv, streaming_min_bytes=0),
+                                  clean_data(pd.read_csv(data_csv)))